@@ -0,0 +1,7 @@
+''' nse is the package behind nsecli.py, a command line interface to the
+National Stock Exchange (NSE).
+
+Modules are kept free of import time work and are imported by nse.cli only
+on the code paths which need them, so that the fast paths like
+-current_display_fields or a cached quote don't pay for urllib2 & co.
+'''
@@ -0,0 +1,385 @@
+''' alert rules evaluated on every fetched quote.
+
+A rule reads like "INFY lastPrice > 1800", "pChange < -3" or
+"price crosses sma20": an optional symbol, an operand, an operator among
+> >= < <= crosses, crosses_above and crosses_below, and another operand.
+Operands are numbers, quote fields, or indicator pseudo fields (see
+nse.indicators). Rules without a symbol apply to every symbol.
+
+Rules are compiled once per symbol. Comparisons of a quote field with a
+number are kept in thresholds sorted per field and operator, so a quote only
+looks at the rules whose threshold lies between the previous and the current
+value. A rule fires once when it becomes true and is re-armed only after its
+condition has been false by more than the hysteresis band, a crossing fires
+when the value moves from more than the band below to more than the band
+above the other operand or the other way round.
+'''
+from bisect import bisect_left, bisect_right
+import logging
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+from nse.indicators import IndicatorSet, is_indicator
+from nse.quote import to_number
+
+COMPARISONS = ('>', '>=', '<', '<=')
+CROSSINGS = ('crosses', 'crosses_above', 'crosses_below')
+ABOVE = ('>', '>=')
+FLIPPED = {'>': '<', '>=': '<=', '<': '>', '<=': '>='}
+ALIASES = {'price': 'lastPrice'}
+
+
+class Rule(object):
+    ''' a parsed alert rule, left and right are floats or field names '''
+    __slots__ = ('id', 'symbol', 'left', 'op', 'right', 'sink', 'text')
+
+    def __init__(self, id, symbol, left, op, right, sink=None, text=None):
+        self.id = id
+        self.symbol = symbol
+        self.left = left
+        self.op = op
+        self.right = right
+        self.sink = sink
+        self.text = text
+
+    @classmethod
+    def parse(cls, text, id=None, sink=None):
+        ''' parses the text of a rule, raises ValueError when invalid '''
+        tokens = text.replace('crosses above', 'crosses_above')\
+                     .replace('crosses below', 'crosses_below').split()
+        ops = [idx for idx, token in enumerate(tokens)
+               if token in COMPARISONS or token in CROSSINGS]
+        if len(ops) != 1 or ops[0] not in (1, 2) or len(tokens) != ops[0] + 2:
+            raise ValueError('expected [SYMBOL] OPERAND OPERATOR OPERAND, '
+                             'got "%s"' % text)
+        symbol = tokens[0].upper() if ops[0] == 2 else None
+        left, op, right = [operand(token) if idx != 1 else token
+                           for idx, token in enumerate(tokens[-3:])]
+        if not isinstance(left, basestring) and not isinstance(right, basestring):
+            raise ValueError('rule "%s" does not use any field' % text)
+        if not isinstance(left, basestring):
+            if op in CROSSINGS:
+                raise ValueError('a number can not cross a field in "%s"' % text)
+            left, op, right = right, FLIPPED[op], left
+        return cls(id, symbol, left, op, right, sink, ' '.join(tokens))
+
+    def is_threshold(self):
+        ''' comparisons of a quote field with a number are indexed '''
+        return (self.op in COMPARISONS and not isinstance(self.right, basestring)
+                and not is_indicator(self.left))
+
+
+def operand(token):
+    ''' returns the float of a number or the name of a field '''
+    number = to_number(token)
+    if number is not None:
+        return float(number)
+    if token in ALIASES:
+        return ALIASES[token]
+    if not is_indicator(token) and is_indicator(token.lower()):
+        return token.lower()
+    return token
+
+
+def holds(op, value, other):
+    ''' evaluates a comparison '''
+    if op == '>':
+        return value > other
+    if op == '>=':
+        return value >= other
+    if op == '<':
+        return value < other
+    return value <= other
+
+
+def satisfied(op, thresholds, value):
+    ''' returns the (start, end) range of the sorted thresholds for which
+    "value op threshold" holds
+    '''
+    if op == '>':
+        return 0, bisect_left(thresholds, value)
+    if op == '>=':
+        return 0, bisect_right(thresholds, value)
+    if op == '<':
+        return bisect_right(thresholds, value), len(thresholds)
+    return bisect_left(thresholds, value), len(thresholds)
+
+
+class Ladder(object):
+    ''' the threshold rules on one field of one symbol, sorted by threshold
+    per operator
+    '''
+    def __init__(self):
+        self.ops = {}
+        self.last = None
+
+    def add(self, rule):
+        self.ops.setdefault(rule.op, []).append(rule)
+
+    def build(self):
+        for op, rules in self.ops.items():
+            rules.sort(key=lambda rule: rule.right)
+            self.ops[op] = ([rule.right for rule in rules], rules)
+
+    def crossed(self, value):
+        ''' returns the rules which hold for value and did not hold for the
+        previous value
+        '''
+        previous, self.last = self.last, value
+        crossed = []
+        for op, (thresholds, rules) in self.ops.iteritems():
+            start, end = satisfied(op, thresholds, value)
+            if op in ABOVE:
+                if previous is not None:
+                    start = satisfied(op, thresholds, previous)[1]
+            elif previous is not None:
+                end = satisfied(op, thresholds, previous)[0]
+            crossed.extend(rules[start:end])
+        return crossed
+
+
+class SymbolAlerts(object):
+    ''' the compiled rules of one symbol along with their state '''
+    def __init__(self, symbol, rules, states, hysteresis, history=None):
+        self.symbol = symbol
+        self.hysteresis = hysteresis
+        self.history = history
+        self.ladders = {}
+        self.rules = []
+        # rules which fired and wait for their condition to go away
+        self.disarmed = {}
+        self.sides = {}
+        for rule in rules:
+            armed, side = states.get((rule.id, symbol), (True, None))
+            if rule.is_threshold():
+                self.ladders.setdefault(rule.left, Ladder()).add(rule)
+            else:
+                self.rules.append(rule)
+            if not armed:
+                self.disarmed.setdefault(rule.left, set()).add(rule)
+            self.sides[rule.id] = side
+        for ladder in self.ladders.itervalues():
+            ladder.build()
+        fields = set()
+        for rule in self.rules:
+            fields.update(o for o in (rule.left, rule.right)
+                          if isinstance(o, basestring) and is_indicator(o))
+        self.indicators = IndicatorSet(sorted(fields)) if fields else None
+        self.indicator_values = {}
+
+    def evaluate(self, quote, when):
+        ''' returns the list of (rule, value) fired by the quote and the
+        list of (rule id, armed, side) states which changed
+        '''
+        fired = []
+        changed = []
+        self.update_indicators(quote, when)
+        for field, rules in self.disarmed.items():
+            value = self.value(field, quote)
+            if value is None:
+                continue
+            for rule in list(rules):
+                other = self.value(rule.right, quote)
+                if other is not None and self.rearms(rule, value, other):
+                    rules.discard(rule)
+                    changed.append((rule.id, True, self.sides[rule.id]))
+        for field, ladder in self.ladders.iteritems():
+            value = quote.num(field)
+            if value is None:
+                continue
+            for rule in ladder.crossed(value):
+                if rule not in self.disarmed.get(field, ()):
+                    fired.append((rule, value))
+        for rule in self.rules:
+            value = self.value(rule.left, quote)
+            other = self.value(rule.right, quote)
+            if value is None or other is None:
+                continue
+            if rule.op in CROSSINGS:
+                if self.crosses(rule, value, other, changed):
+                    fired.append((rule, value))
+            elif (holds(rule.op, value, other) and
+                  rule not in self.disarmed.get(rule.left, ())):
+                fired.append((rule, value))
+        for rule, value in fired:
+            if rule.op in COMPARISONS:
+                self.disarmed.setdefault(rule.left, set()).add(rule)
+                changed.append((rule.id, False, self.sides[rule.id]))
+        return fired, changed
+
+    def rearms(self, rule, value, other):
+        ''' tells if a comparison no longer holds once moved towards the
+        threshold by the hysteresis band
+        '''
+        band = self.hysteresis * abs(other)
+        if rule.op in ABOVE:
+            return not holds(rule.op, value + band, other)
+        return not holds(rule.op, value - band, other)
+
+    def crosses(self, rule, value, other, changed):
+        ''' tracks the side of the other operand the value is on, outside of
+        the hysteresis band, and tells if it moved to the other side
+        '''
+        band = self.hysteresis * abs(other)
+        if value > other + band:
+            side = 1
+        elif value < other - band:
+            side = -1
+        else:
+            return False
+        previous = self.sides[rule.id]
+        if side == previous:
+            return False
+        self.sides[rule.id] = side
+        changed.append((rule.id, True, side))
+        if previous is None:
+            return False
+        return (rule.op == 'crosses' or
+                (rule.op == 'crosses_above') == (side == 1))
+
+    def update_indicators(self, quote, when):
+        ''' feeds the quote to the indicators, the first quote loads the
+        recorded history which already holds it
+        '''
+        if self.indicators is None:
+            return
+        if not self.indicator_values and self.history is not None:
+            self.indicator_values = self.indicators.feed(
+                self.history.read(self.symbol))
+            return
+        price = quote.num('lastPrice')
+        if price is not None:
+            self.indicator_values = self.indicators.update(
+                when, price, quote.num('totalTradedVolume', float('nan')))
+
+    def value(self, operand, quote):
+        ''' returns the current value of an operand, None when unknown '''
+        if not isinstance(operand, basestring):
+            return operand
+        if is_indicator(operand):
+            value = self.indicator_values.get(operand)
+            return None if value is None or value != value else value
+        return quote.num(operand)
+
+
+class StreamSink(object):
+    ''' writes alerts to a stream, stdout by default '''
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+
+    def __call__(self, alert):
+        self.out.write(alert['message'] + '\n')
+        self.out.flush()
+
+
+class FileSink(object):
+    ''' appends alerts to a file '''
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def __call__(self, alert):
+        with open(self.path, 'a') as f:
+            f.write(alert['message'] + '\n')
+
+
+class ExecSink(object):
+    ''' runs a command for every alert without waiting for it. the message
+    is passed as the last argument, the details in NSE_ALERT_* variables.
+    the commands which exited are reaped on the next alert, so that a long
+    running -serve or -watch doesn't collect zombies
+    '''
+    def __init__(self, command):
+        self.command = shlex.split(command)
+        self.lock = threading.Lock()
+        self.running = []
+
+    def __call__(self, alert):
+        env = dict(os.environ)
+        for key, value in alert.iteritems():
+            env['NSE_ALERT_%s' % key.upper()] = str(value)
+        process = subprocess.Popen(self.command + [alert['message']], env=env)
+        with self.lock:
+            self.running = [p for p in self.running if p.poll() is None]
+            self.running.append(process)
+
+
+def make_sink(spec, out=None):
+    ''' returns the sink of a spec: stdout, file:PATH or exec:COMMAND '''
+    if not spec or spec == 'stdout':
+        return StreamSink(out)
+    kind, _, arg = spec.partition(':')
+    if kind == 'file' and arg:
+        return FileSink(arg)
+    if kind == 'exec' and arg:
+        return ExecSink(arg)
+    raise ValueError('unknown alert sink "%s", use stdout, file:PATH or '
+                     'exec:COMMAND' % spec)
+
+
+class AlertEngine(object):
+    ''' evaluates the alert rules on the quotes passed to on_quote, meant
+    to be registered with NseDriver.add_listener. rows are the
+    (id, symbol, rule, sink) rows of DB.get_alerts, states the saved
+    (armed, side) of every (rule id, symbol) and store a callable saving
+    the changed (rule id, symbol, armed, side) states
+    '''
+    def __init__(self, rows, hysteresis=0.005, history=None, states=None,
+                 store=None, out=None):
+        self.log = logging.getLogger('AlertEngine')
+        self.hysteresis = hysteresis
+        self.history = history
+        self.states = states or {}
+        self.store = store
+        self.out = out
+        self.lock = threading.Lock()
+        self.by_symbol = {}
+        for id, symbol, text, sink in rows:
+            rule = Rule.parse(text, id, sink)
+            self.by_symbol.setdefault(rule.symbol, []).append(rule)
+        self.sinks = {}
+        self.symbols = {}
+
+    def compiled(self, code):
+        ''' returns the SymbolAlerts of a code, None when no rule applies '''
+        try:
+            return self.symbols[code]
+        except KeyError:
+            pass
+        rules = self.by_symbol.get(code, []) + self.by_symbol.get(None, [])
+        alerts = None
+        if rules:
+            alerts = SymbolAlerts(code, rules, self.states, self.hysteresis,
+                                  self.history)
+        self.symbols[code] = alerts
+        return alerts
+
+    def on_quote(self, code, quote, fetched):
+        ''' evaluates the rules of the code, returns the fired alerts '''
+        with self.lock:
+            alerts = self.compiled(code)
+            if alerts is None:
+                return []
+            fired, changed = alerts.evaluate(quote, fetched)
+            if changed and self.store is not None:
+                self.store([(id, code, armed, side) for id, armed, side in changed])
+            return [self.emit(rule, code, value, fetched) for rule, value in fired]
+
+    def emit(self, rule, code, value, fetched):
+        ''' hands an alert to the sink of its rule '''
+        text = rule.text if rule.symbol else '%s %s' % (code, rule.text)
+        alert = {'id': rule.id, 'symbol': code, 'rule': text,
+                 'value': value,
+                 'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(fetched))}
+        alert['message'] = 'ALERT %(time)s %(rule)s (%(value)s)' % alert
+        sink = self.sinks.get(rule.sink)
+        if sink is None:
+            sink = self.sinks[rule.sink] = make_sink(rule.sink, self.out)
+        try:
+            sink(alert)
+        except (IOError, OSError) as err:
+            self.log.error('alert sink %s failed: %s', rule.sink, err)
+        return alert
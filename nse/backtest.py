@@ -0,0 +1,297 @@
+''' vectorized backtests of simple strategies over the daily history.
+
+A Panel holds the closing prices of every symbol on every day as one days x
+symbols matrix. Strategies turn it into a matrix of positions, 1 when long
+and 0 when flat, with whole matrix operations: rolling means come from
+cumulative sums, rolling extremes from block wise running extremes, and
+entry/exit rules are resolved by forward filling the last signal instead of
+walking the bars. Positions are taken at the close and earn the return of
+the next day, every symbol trading an equal slice of the capital.
+
+numpy is required, parameter sweeps are spread over a process pool.
+'''
+import itertools
+import math
+import multiprocessing
+
+import numpy
+
+TRADING_DAYS = 252
+
+# the panel, strategy and cost of the sweep workers
+_sweep = None
+
+
+class Panel(object):
+    ''' closing prices of the symbols on the union of their days, nan
+    where a symbol did not trade
+    '''
+    def __init__(self, dates, symbols, close):
+        self.dates = dates
+        self.symbols = symbols
+        self.close = close
+
+    @classmethod
+    def load(cls, store, symbols=None, start=None, end=None):
+        ''' reads the closing prices of the symbols, all the symbols of the
+        store by default, from a daily HistoryStore
+        '''
+        series = []
+        for symbol in symbols or store.symbols():
+            history = store.read(symbol, start, end, columns=['TIME', 'closePrice'])
+            if len(history['TIME']):
+                series.append((symbol.upper(), numpy.asarray(history['TIME']),
+                               numpy.asarray(history['closePrice'])))
+        if not series:
+            return cls(numpy.empty(0), [], numpy.empty((0, 0)))
+        dates = numpy.unique(numpy.concatenate([times for s, times, c in series]))
+        close = numpy.full((len(dates), len(series)), numpy.nan)
+        for idx, (symbol, times, values) in enumerate(series):
+            close[numpy.searchsorted(dates, times), idx] = values
+        return cls(dates, [symbol for symbol, t, c in series], close)
+
+
+def shift(values, n=1):
+    ''' returns the values n rows later, nan in the first n rows '''
+    shifted = numpy.full(values.shape, numpy.nan)
+    shifted[n:] = values[:-n]
+    return shifted
+
+
+def ffill(values):
+    ''' fills the nan values with the last value above them '''
+    rows = numpy.arange(len(values)).reshape((-1,) + (1,) * (values.ndim - 1))
+    last = numpy.maximum.accumulate(numpy.where(numpy.isnan(values), 0, rows), axis=0)
+    if values.ndim == 1:
+        return values[last]
+    return values[last, numpy.arange(values.shape[1])]
+
+
+def _window_sums(values, n):
+    ''' sums and counts of the non nan values of the last n rows '''
+    valid = ~numpy.isnan(values)
+    sums = numpy.cumsum(numpy.where(valid, values, 0), axis=0)
+    counts = numpy.cumsum(valid, axis=0)
+    sums[n:] = sums[n:] - sums[:-n]
+    counts[n:] = counts[n:] - counts[:-n]
+    return sums, counts
+
+
+def rolling_mean(values, n):
+    ''' mean of the last n rows, nan unless all of them are known '''
+    sums, counts = _window_sums(values, n)
+    return numpy.where(counts == n, sums / n, numpy.nan)
+
+
+def rolling_std(values, n):
+    ''' population standard deviation of the last n rows '''
+    sums, counts = _window_sums(values, n)
+    squares, counts = _window_sums(values * values, n)
+    variance = numpy.maximum(squares / n - (sums / n) ** 2, 0)
+    return numpy.where(counts == n, numpy.sqrt(variance), numpy.nan)
+
+
+def rolling_extreme(values, n, maximum=True):
+    ''' highest (or lowest) of the last n rows in O(1) per value: the rows
+    are cut in blocks of n, and a window is covered by the running extreme
+    from its start to the end of its first block and the one from the
+    start of its last block to its end
+    '''
+    fill = -numpy.inf if maximum else numpy.inf
+    extreme = numpy.maximum if maximum else numpy.minimum
+    rows = len(values)
+    result = numpy.full(values.shape, numpy.nan)
+    if rows < n:
+        return result
+    blocks = -(-rows // n)
+    padded = numpy.full((blocks * n,) + values.shape[1:], fill)
+    padded[:rows] = numpy.where(numpy.isnan(values), fill, values)
+    shaped = padded.reshape((blocks, n) + values.shape[1:])
+    prefix = extreme.accumulate(shaped, axis=1).reshape(padded.shape)
+    suffix = extreme.accumulate(shaped[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    result[n - 1:] = extreme(suffix[:rows - n + 1], prefix[n - 1:rows])
+    sums, counts = _window_sums(values, n)
+    result[counts < n] = numpy.nan
+    return result
+
+
+def hold(entries, exits):
+    ''' positions of entering on the entries and leaving on the exits,
+    exits winning when both happen on the same row
+    '''
+    signal = numpy.where(exits, 0.0, numpy.where(entries, 1.0, numpy.nan))
+    signal[0] = numpy.where(numpy.isnan(signal[0]), 0, signal[0])
+    return ffill(signal)
+
+
+def sma_cross(close, fast=20, slow=50):
+    ''' long while the fast moving average is above the slow one '''
+    with numpy.errstate(invalid='ignore'):
+        return (rolling_mean(close, fast) > rolling_mean(close, slow)).astype('d')
+
+
+def breakout(close, entry=55, exit=20):
+    ''' long from a close above the highest close of the previous entry
+    days until a close below the lowest close of the previous exit days
+    '''
+    with numpy.errstate(invalid='ignore'):
+        return hold(close > shift(rolling_extreme(close, entry)),
+                    close < shift(rolling_extreme(close, exit, maximum=False)))
+
+
+def mean_reversion(close, n=20, entry=2.0, exit=0.0):
+    ''' long from a close entry standard deviations below the n day mean
+    until the close is back above exit deviations below it
+    '''
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        score = (close - rolling_mean(close, n)) / rolling_std(close, n)
+        return hold(score < -entry, score > -exit)
+
+
+# strategies and their default parameters, the type of a default is the
+# type of the parameter
+STRATEGIES = {
+    'sma_cross': (sma_cross, {'fast': 20, 'slow': 50}),
+    'breakout': (breakout, {'entry': 55, 'exit': 20}),
+    'mean_reversion': (mean_reversion, {'n': 20, 'entry': 2.0, 'exit': 0.0}),
+}
+
+
+def parse_grid(strategy, specs):
+    ''' returns the parameter sets of NAME=VALUE[,VALUE...] specs, every
+    combination of the values, defaults filling the parameters not given.
+    raises ValueError for unknown strategies, parameters or values
+    '''
+    if strategy not in STRATEGIES:
+        raise ValueError('unknown strategy %s, use one of %s' % (
+            strategy, ', '.join(sorted(STRATEGIES))))
+    defaults = STRATEGIES[strategy][1]
+    names, choices = [], []
+    for spec in specs:
+        name, sep, values = spec.partition('=')
+        if name not in defaults or not values:
+            raise ValueError('%s takes %s' % (strategy, ' '.join(
+                '%s=VALUE[,VALUE...]' % p for p in sorted(defaults))))
+        try:
+            values = [type(defaults[name])(float(v)) for v in values.split(',')]
+        except ValueError:
+            values = None
+        # integer parameters are windows
+        if not values or isinstance(defaults[name], int) and min(values) < 1:
+            raise ValueError('invalid values for %s: %s' % (name, spec.partition('=')[2]))
+        choices.append(values)
+        names.append(name)
+    grid = []
+    for values in itertools.product(*choices):
+        params = dict(defaults)
+        params.update(zip(names, values))
+        grid.append(params)
+    return grid
+
+
+def run(panel, strategy, params, cost=0.001):
+    ''' backtests a strategy with the given parameters, cost being the
+    fraction of the traded value paid on every trade
+    '''
+    positions = STRATEGIES[strategy][0](panel.close, **params)
+    return Result(panel, positions, cost)
+
+
+class Result(object):
+    ''' equity curve, drawdown, turnover and trades of positions held over
+    a panel
+    '''
+    def __init__(self, panel, positions, cost=0.001):
+        self.panel = panel
+        self.positions = positions
+        close = ffill(panel.close)
+        returns = numpy.zeros(close.shape)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            returns[1:] = close[1:] / close[:-1] - 1
+        returns[~numpy.isfinite(returns)] = 0
+        traded = numpy.abs(numpy.diff(positions, axis=0))
+        self.traded = numpy.vstack([numpy.abs(positions[:1]), traded])
+        # returns of the slice of capital of every symbol
+        self.sleeves = shift(positions) * returns - cost * self.traded
+        self.sleeves[0] = -cost * self.traded[0]
+        width = max(positions.shape[1], 1)
+        self.returns = self.sleeves.sum(axis=1) / width
+        self.equity = numpy.cumprod(1 + self.returns)
+        # measured from the starting capital too, the costs of the first
+        # day are already a drawdown
+        peak = numpy.maximum.accumulate(numpy.maximum(self.equity, 1))
+        self.drawdown = self.equity / peak - 1
+        self.turnover = self.traded.sum(axis=1) / width
+
+    def symbol_equity(self):
+        ''' equity curves of the slices of the symbols, days x symbols '''
+        return numpy.cumprod(1 + self.sleeves, axis=0)
+
+    def years(self):
+        return len(self.returns) / float(TRADING_DAYS)
+
+    def summary(self):
+        ''' returns the performance figures as a dict '''
+        years = self.years()
+        final = self.equity[-1] if len(self.equity) else 1.0
+        deviation = self.returns.std()
+        return {
+            'return': final - 1,
+            'cagr': final ** (1 / years) - 1 if years and final > 0 else float('nan'),
+            'sharpe': (self.returns.mean() / deviation * math.sqrt(TRADING_DAYS)
+                       if deviation else 0.0),
+            'drawdown': self.drawdown.min() if len(self.drawdown) else 0.0,
+            'turnover': self.turnover.sum() / years if years else 0.0,
+            'trades': int((numpy.diff((self.positions > 0).astype('i1'), axis=0) > 0).sum() +
+                          (self.positions[:1] > 0).sum()),
+        }
+
+    def trades(self):
+        ''' returns the (symbol, entry, exit, entry price, exit price,
+        return, open) of every trade ordered by symbol and entry time.
+        positions still open are closed at the last day
+        '''
+        held = (self.positions > 0).astype('i1')
+        edges = numpy.zeros((held.shape[0] + 1, held.shape[1]), 'i1')
+        edges[:-1] = held
+        edges[1:] -= held
+        # the column wise order pairs every entry with the exit after it
+        symbols, entries = numpy.nonzero(edges.T > 0)
+        exits = numpy.nonzero(edges.T < 0)[1]
+        last = len(held) - 1
+        close = ffill(self.panel.close)
+        dates = self.panel.dates
+        trades = []
+        for symbol, entry, exit in zip(symbols, entries, exits):
+            closed = min(exit, last)
+            bought, sold = close[entry, symbol], close[closed, symbol]
+            trades.append((self.panel.symbols[symbol], dates[entry], dates[closed],
+                           bought, sold, sold / bought - 1, exit > last))
+        return trades
+
+
+def _init_sweep(panel, strategy, cost):
+    global _sweep
+    _sweep = (panel, strategy, cost)
+
+
+def _evaluate(params):
+    panel, strategy, cost = _sweep
+    return params, run(panel, strategy, params, cost).summary()
+
+
+def sweep(panel, strategy, grid, cost=0.001, processes=None):
+    ''' returns (params, summary) for every parameter set of the grid. the
+    sets are spread over a pool of processes which get the panel when they
+    fork
+    '''
+    processes = processes or multiprocessing.cpu_count()
+    if processes > 1 and len(grid) > 1:
+        pool = multiprocessing.Pool(min(processes, len(grid)), _init_sweep,
+                                    (panel, strategy, cost))
+        try:
+            return pool.map(_evaluate, grid, chunksize=1)
+        finally:
+            pool.terminate()
+    _init_sweep(panel, strategy, cost)
+    return [_evaluate(params) for params in grid]
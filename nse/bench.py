@@ -0,0 +1,563 @@
+''' benchmarks of nsecli, run from the directory of nsecli.py as
+
+    python -m nse.bench parse FILE [FILE ...]
+    python -m nse.bench startup [-runs N] [-threshold MS]
+    python -m nse.bench indicators [-symbols N] [-years N]
+    python -m nse.bench quotes [-archive FILE] [-symbols N] [-workers N]
+                               [-latency MS] [-jitter MS] [-ticks N]
+    python -m nse.bench db [-processes N] [-ops N] [-no_wal]
+    python -m nse.bench ingest [-symbols N] [-years N] [-processes N]
+    python -m nse.bench backtest [-symbols N] [-years N] [-params N]
+                                 [-processes N]
+    python -m nse.bench screen [-symbols N] [-repeat N] [EXPR]
+'''
+import argparse
+import ast
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from nse.quote import parse_quote
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'nsecli.py')
+
+
+def bench_parse(paths, repeat=1000):
+    ''' times parse_quote against the old lxml + ast.literal_eval parsing
+    on recorded GetQuote.jsp responses, lxml is only used if installed
+    '''
+    bodies = [open(path).read() for path in paths]
+    timings = [('parse_quote', parse_quote)]
+    try:
+        import lxml.etree
+    except ImportError:
+        print 'lxml is not installed, skipping the lxml parser'
+    else:
+        def parse_lxml(body):
+            parser = lxml.etree.HTMLParser(encoding='utf-8')
+            tree = lxml.etree.fromstring(body, parser)
+            doi = tree.xpath('//*[@id="responseDiv"]')
+            return ast.literal_eval(doi[0].text.strip())['data'][0]
+        timings.append(('lxml + literal_eval', parse_lxml))
+    for name, parse in timings:
+        started = time.time()
+        for i in xrange(repeat):
+            for body in bodies:
+                parse(body)
+        elapsed = time.time() - started
+        print '%-20s %8.1f us/quote' % (name, elapsed * 1e6 / (repeat * len(bodies)))
+
+
+def bench_startup(runs=20, threshold=None):
+    ''' times cold runs of nsecli.py -current_display_fields and of a
+    cached quote against a scratch database. returns False when the median
+    of a run is above threshold milliseconds
+    '''
+    from nse.db import DB
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmpdir, 'nse.db')
+        db = DB(db_path)
+        db.bootstrap()
+        db.create_stocks_table('SYMBOL,NAME OF COMPANY\nINFY,Infosys Limited\n')
+        db.cache_quote('INFY', {'symbol': 'INFY', 'lastPrice': '1,234.50'},
+                       time.time())
+        db.db.close()
+
+        ok = True
+        for name, args in [('-current_display_fields', ['-current_display_fields']),
+                           ('cached quote', ['INFY', '-max_age', '1e9'])]:
+            timings = []
+            for i in range(runs):
+                started = time.time()
+                process = subprocess.Popen([sys.executable, SCRIPT, '-db', db_path] + args,
+                                           stdout=open(os.devnull, 'w'),
+                                           stderr=subprocess.PIPE)
+                errors = process.communicate()[1]
+                # the database errors of nsecli log and exit with status 0
+                if process.returncode != 0 or 'ERROR:' in errors:
+                    print '%s failed with status %d' % (name, process.returncode)
+                    sys.stdout.write(errors)
+                    return False
+                timings.append((time.time() - started) * 1000)
+            timings.sort()
+            median = timings[len(timings) // 2]
+            print '%-25s median %6.1f ms  min %6.1f ms' % (name, median, timings[0])
+            if threshold is not None and median > threshold:
+                print '%s is above the threshold of %s ms' % (name, threshold)
+                ok = False
+        return ok
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_indicators(symbols=500, years=10):
+    ''' times nse.indicators over synthetic daily prices, both as series
+    over the whole history and as incremental updates per tick
+    '''
+    from nse import indicators
+    days = years * 252
+    random.seed(0)
+    fields = indicators.FIELDS
+    print 'numpy %s' % ('installed' if indicators._numpy() else 'not installed')
+    series_time = tick_time = 0.0
+    for s in xrange(symbols):
+        price, volume = 100.0, 0.0
+        history = {'TIME': [], 'lastPrice': [], 'totalTradedVolume': []}
+        for day in xrange(days):
+            price *= 1 + random.gauss(0, 0.02)
+            volume = random.randint(1000, 100000)
+            history['TIME'].append(day * 86400.0)
+            history['lastPrice'].append(price)
+            history['totalTradedVolume'].append(volume)
+        started = time.time()
+        indicators.compute(fields, history)
+        series_time += time.time() - started
+        started = time.time()
+        indicators.IndicatorSet(fields).feed(history)
+        tick_time += time.time() - started
+    ticks = symbols * days
+    print '%d symbols x %d days' % (symbols, days)
+    print 'series      %8.2f s  %8.1f ms/symbol' % (series_time, series_time * 1000 / symbols)
+    print 'incremental %8.2f s  %8.2f us/tick' % (tick_time, tick_time * 1e6 / ticks)
+
+
+def scratch_db(tmpdir):
+    ''' returns a DB in tmpdir with the rate limit lifted, so that the
+    benchmarks measure nsecli and not the throttling
+    '''
+    from nse.db import DB
+    db = DB(os.path.join(tmpdir, 'nse.db'))
+    db.bootstrap()
+    db.create_stocks_table('SYMBOL,NAME OF COMPANY\nINFY,Infosys Limited\n')
+    db.update_config_setting('RATE_LIMIT', '1000000')
+    db.update_config_setting('RATE_BURST', '1000000')
+    return db
+
+
+def synthetic_archive(path, urls):
+    ''' records a GetQuote.jsp like response for every url '''
+    from nse.transport import Archive
+    archive = Archive(path, 'w')
+    for idx, url in enumerate(urls):
+        price = '%.2f' % (100 + idx % 1000)
+        quote = {'symbol': 'S%d' % idx, 'lastPrice': price, 'change': '1.00',
+                 'pChange': '1.00', 'open': price, 'dayHigh': price,
+                 'dayLow': price, 'previousClose': price,
+                 'totalTradedVolume': '12,34,567', 'buyPrice1': price,
+                 'buyQuantity1': '100', 'sellPrice1': price,
+                 'sellQuantity1': '100'}
+        body = ('<html><body><div id="responseDiv" style="display:none">%s'
+                '</div></body></html>' % json.dumps({'data': [quote]}))
+        archive.add(url, 200, 'OK', 'Content-Type: text/html\r\n', body)
+    archive.close()
+
+
+def cpu_time():
+    ''' user and system time of the process, with microsecond resolution '''
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[int(round(p * (len(values) - 1)))]
+
+
+def bench_quotes(archive=None, symbols=200, workers=8, latency=50, jitter=20,
+                 ticks=5):
+    ''' times NseDriver end to end against a replayed archive, recorded with
+    nsecli.py -record or made up for the given number of symbols, in the
+    single quote, batch and watch modes. reports quotes/sec, the p50/p99
+    latency of fetch_quote and the cpu time per quote
+    '''
+    from nse.display import NseDisplay
+    from nse.driver import NseDriver
+    from nse.transport import Archive, ReplayHandler
+    from nse.watch import NseWatcher
+    import urlparse
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db = scratch_db(tmpdir)
+        if archive is None:
+            archive = os.path.join(tmpdir, 'quotes.zip')
+            urls = [NseDriver(db).build_url('S%d' % idx) for idx in range(symbols)]
+            synthetic_archive(archive, urls)
+        responses = Archive(archive)
+        codes = []
+        for url in responses.urls():
+            query = urlparse.parse_qs(urlparse.urlparse(url).query)
+            if 'symbol' in query:
+                codes.append(query['symbol'][0])
+        print '%d symbols, %d workers, latency %s ms, jitter %s ms' % (
+            len(codes), workers, latency, jitter)
+        print '%-8s %8s %10s %10s %10s %12s' % ('mode', 'quotes', 'quotes/s',
+                                               'p50 ms', 'p99 ms', 'cpu us/quote')
+
+        def single(nse):
+            for code in codes:
+                nse.get_quotes([code])
+            return len(codes)
+
+        def batch(nse):
+            return sum(1 for result in nse.iter_quotes(codes))
+
+        def watch(nse):
+            disp = NseDisplay(db, out=open(os.devnull, 'w'))
+            NseWatcher(nse, disp, interval=0, sleep=lambda s: None).run(codes, ticks)
+            return len(codes) * ticks
+
+        for name, run in [('single', single), ('batch', batch), ('watch', watch)]:
+            handler = ReplayHandler(responses, latency / 1000.0, jitter / 1000.0)
+            nse = NseDriver(db, workers=workers, transport=lambda live: handler)
+            latencies = []
+            fetch_quote = nse.fetch_quote
+
+            def timed(code):
+                started = time.time()
+                try:
+                    return fetch_quote(code)
+                finally:
+                    latencies.append(time.time() - started)
+            nse.fetch_quote = timed
+            cpu = cpu_time()
+            started = time.time()
+            quotes = run(nse)
+            elapsed = time.time() - started
+            cpu = cpu_time() - cpu
+            print '%-8s %8d %10.1f %10.1f %10.1f %12.1f' % (
+                name, quotes, quotes / elapsed, percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.99) * 1000, cpu * 1e6 / quotes)
+        responses.close()
+        db.db.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+class _ErrorCounter(logging.Handler):
+    ''' counts the errors logged by DB, which reports most failures that
+    way instead of raising
+    '''
+    def __init__(self):
+        logging.Handler.__init__(self, logging.ERROR)
+        self.errors = 0
+
+    def emit(self, record):
+        self.errors += 1
+
+
+def stress_worker(db_path, ops, wal, seed, results):
+    ''' one process of bench_db, bootstraps the database and then reads and
+    writes config settings and cached quotes at random
+    '''
+    from nse.db import DB
+    counter = _ErrorCounter()
+    logging.getLogger('DB').addHandler(counter)
+    logging.getLogger('DB').propagate = False
+    rand = random.Random(seed)
+    done = 0
+    started = time.time()
+    try:
+        db = DB(db_path, wal=wal)
+        db.bootstrap()
+        for done in xrange(1, ops + 1):
+            op = rand.random()
+            code = 'S%d' % rand.randint(0, 99)
+            if op < 0.4:
+                db.get_cached_quote(code)
+            elif op < 0.7:
+                db.get_config_setting('DISPLAY_FIELDS')
+            elif op < 0.9:
+                db.cache_quote(code, {'symbol': code, 'lastPrice': str(done)},
+                               time.time())
+            else:
+                db.update_config_setting('QUOTE_TTL', str(rand.randint(1, 10)))
+    except (SystemExit, Exception) as err:
+        counter.errors += 1
+        sys.stderr.write('worker %d stopped after %d ops: %s\n' % (seed, done, err))
+    results.put((done, time.time() - started, counter.errors))
+
+
+def bench_db(processes=16, ops=500, wal=True):
+    ''' runs processes concurrent stress_workers against a new database,
+    all of them bootstrapping it at once. returns False when an operation
+    failed or the database ended up inconsistent
+    '''
+    import multiprocessing
+    from nse.db import DB
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmpdir, 'nse.db')
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=stress_worker,
+                                           args=(db_path, ops, wal, n, results))
+                   for n in range(processes)]
+        started = time.time()
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for worker in workers]
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - started
+        done = sum(n for n, seconds, errors in outcomes)
+        errors = sum(errors for n, seconds, errors in outcomes)
+        db = DB(db_path)
+        settings = db.db.execute('SELECT SETTING, COUNT(*) FROM CONFIG\
+                                 GROUP BY SETTING').fetchall()
+        duplicated = [setting for setting, n in settings if n > 1]
+        print '%s journal, %d processes x %d ops' % ('wal' if wal else 'rollback',
+                                                     processes, ops)
+        print 'ops       %8d' % done
+        print 'ops/s     %8.0f' % (done / elapsed)
+        print 'errors    %8d' % errors
+        print 'settings  %8d %s' % (len(settings), 'duplicated: %s' % duplicated
+                                   if duplicated else '')
+        print 'version   %8d' % db.schema_version()
+        return not errors and not duplicated and done == processes * ops
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def synthetic_bhavcopies(root, symbols=1500, years=2):
+    ''' writes zipped bhavcopies of random walks of the given number of
+    symbols over the week days of the given number of years, returns
+    their paths
+    '''
+    import zipfile
+    random.seed(0)
+    prices = [100.0] * symbols
+    day = time.mktime((2010, 1, 1, 0, 0, 0, 0, 0, -1))
+    paths = []
+    while len(paths) < years * 252:
+        day += 24 * 60 * 60
+        local = time.localtime(day)
+        if local.tm_wday >= 5:
+            continue
+        stamp = time.strftime('%d-%b-%Y', local).upper()
+        lines = ['SYMBOL,SERIES,OPEN,HIGH,LOW,CLOSE,LAST,PREVCLOSE,TOTTRDQTY,'
+                 'TOTTRDVAL,TIMESTAMP,TOTALTRADES,ISIN,']
+        for idx in xrange(symbols):
+            previous = prices[idx]
+            price = prices[idx] = previous * (1 + random.gauss(0, 0.02))
+            lines.append('S%d,EQ,%.2f,%.2f,%.2f,%.2f,%.2f,%.2f,%d,%.2f,%s,%d,INE%06d,' % (
+                idx, previous, max(previous, price) * 1.01, min(previous, price) * 0.99,
+                price, price, previous, 10000 + idx, price * (10000 + idx),
+                stamp, 100, idx))
+        path = os.path.join(root, 'cm%sbhav.csv.zip' % stamp.replace('-', ''))
+        archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        archive.writestr(os.path.basename(path)[:-4], '\n'.join(lines) + '\n')
+        archive.close()
+        paths.append(path)
+    return paths
+
+
+def bench_ingest(symbols=1500, years=2, processes=None):
+    ''' times nse.ingest over synthetic bhavcopies, loading them once,
+    again to check that nothing is written twice, and then the older half
+    again into a store holding only the newer half, which has to be merged
+    in front. returns False when the stored rows don't add up
+    '''
+    import multiprocessing
+    from nse.history import HistoryStore
+    from nse.ingest import DAILY_COLUMNS, Ingester
+    tmpdir = tempfile.mkdtemp()
+    try:
+        db = scratch_db(tmpdir)
+        db.refresh_stocks_table('SYMBOL,NAME OF COMPANY\n' + ''.join(
+            'S%d,Stock %d\n' % (idx, idx) for idx in xrange(symbols)))
+        os.mkdir(os.path.join(tmpdir, 'bhav'))
+        paths = synthetic_bhavcopies(os.path.join(tmpdir, 'bhav'), symbols, years)
+        expected = len(paths) * symbols
+        half = len(paths) // 2
+        print '%d symbols x %d days, %d processes' % (
+            symbols, len(paths), processes or multiprocessing.cpu_count())
+        print '%-10s %8s %10s %10s %10s' % ('run', 'days', 'rows', 'seconds', 'rows/s')
+        ok = True
+        runs = [('first', 'daily', paths, expected),
+                ('again', 'daily', paths, 0),
+                ('newer', 'merged', paths[half:], (len(paths) - half) * symbols),
+                ('older', 'merged', paths[:half], half * symbols)]
+        for name, store, files, rows in runs:
+            ingester = Ingester(HistoryStore(os.path.join(tmpdir, store), DAILY_COLUMNS),
+                                db.symbol_index_path(), processes)
+            started = time.time()
+            stats = ingester.ingest(files)
+            elapsed = time.time() - started
+            print '%-10s %8d %10d %10.2f %10.0f' % (name, stats['days'], stats['rows'],
+                                                   elapsed, stats['rows'] / elapsed)
+            if stats['rows'] != rows or stats['errors']:
+                print '%s stored %d rows instead of %d' % (name, stats['rows'], rows)
+                ok = False
+        merged = HistoryStore(os.path.join(tmpdir, 'merged'), DAILY_COLUMNS)
+        daily = HistoryStore(os.path.join(tmpdir, 'daily'), DAILY_COLUMNS)
+        for symbol in ('S0', 'S%d' % (symbols - 1)):
+            if [list(merged.read(symbol)[c]) for c in DAILY_COLUMNS] != \
+                    [list(daily.read(symbol)[c]) for c in DAILY_COLUMNS]:
+                print 'out of order load of %s differs' % symbol
+                ok = False
+        return ok
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def bench_backtest(symbols=1500, years=10, params=100, processes=None):
+    ''' times nse.backtest over random walks: one run of every strategy,
+    then a sweep of params sma_cross parameter sets in one process and in
+    the pool, which gives the scaling of the sweeps
+    '''
+    import multiprocessing
+    import numpy
+    from nse import backtest
+    days = years * backtest.TRADING_DAYS
+    rand = numpy.random.RandomState(0)
+    close = 100 * numpy.cumprod(1 + rand.normal(0.0003, 0.02, (days, symbols)), axis=0)
+    # symbols listed late or suspended for a while
+    close[rand.rand(days, symbols) < 0.01] = numpy.nan
+    panel = backtest.Panel(numpy.arange(days) * 86400.0,
+                           ['S%d' % idx for idx in xrange(symbols)], close)
+    processes = processes or multiprocessing.cpu_count()
+    print '%d symbols x %d days' % (symbols, days)
+    print '%-16s %10s %10s' % ('strategy', 'run s', 'trades s')
+    for strategy in sorted(backtest.STRATEGIES):
+        started = time.time()
+        result = backtest.run(panel, strategy, backtest.STRATEGIES[strategy][1])
+        result.summary()
+        elapsed = time.time() - started
+        started = time.time()
+        result.trades()
+        print '%-16s %10.2f %10.2f' % (strategy, elapsed, time.time() - started)
+    grid = [{'fast': fast, 'slow': slow} for slow in range(50, 260, 10)
+            for fast in range(5, 50, 5)][:params]
+    print '%-16s %10s %10s %10s' % ('sweep', 'sets', 'seconds', 'sets/s')
+    baseline = None
+    for pool in sorted(set([1, processes])):
+        started = time.time()
+        backtest.sweep(panel, 'sma_cross', grid, processes=pool)
+        elapsed = time.time() - started
+        baseline = baseline or elapsed
+        print '%-16s %10d %10.2f %10.2f  x%.1f' % ('%d processes' % pool, len(grid),
+                                                 elapsed, len(grid) / elapsed,
+                                                 baseline / elapsed)
+
+
+def bench_screen(expression, symbols=2000, repeat=100):
+    ''' times compiling a screen and running it over a made up snapshot of
+    the given number of symbols, sorted by pChange
+    '''
+    from array import array
+    from nse.market import BHAV_FIELDS, Snapshot, derive
+    from nse.screen import Screen, numpy, screen
+    random.seed(0)
+    columns = dict((field, array('d')) for bhav, field in BHAV_FIELDS)
+    for idx in xrange(symbols):
+        previous = random.uniform(10, 5000)
+        close = previous * random.uniform(0.9, 1.1)
+        for field, value in (('open', previous), ('dayHigh', max(previous, close)),
+                             ('dayLow', min(previous, close)), ('closePrice', close),
+                             ('lastPrice', close), ('previousClose', previous),
+                             ('totalTradedVolume', random.randint(0, 10 ** 7)),
+                             ('totalTradedValue', close * random.randint(0, 10 ** 7))):
+            columns[field].append(value)
+    snapshot = Snapshot(['S%d' % idx for idx in xrange(symbols)], derive(columns))
+    snapshot.columns['high52'] = snapshot.columns['dayHigh'] * 1.05 if numpy is not None \
+        else array('d', [v * 1.05 for v in snapshot.columns['dayHigh']])
+    fields = list(snapshot.columns)
+    started = time.time()
+    for i in xrange(repeat):
+        where = Screen(expression, fields)
+    compiled = (time.time() - started) / repeat
+    order = Screen('pChange', fields, condition=False)
+    started = time.time()
+    for i in xrange(repeat):
+        matches = screen(snapshot, where, order, limit=None)
+    elapsed = (time.time() - started) / repeat
+    print 'numpy %s' % ('installed' if numpy is not None else 'not installed')
+    print '%d symbols, %d match "%s"' % (symbols, len(matches), where.text)
+    print 'compile %8.3f ms' % (compiled * 1000)
+    print 'screen  %8.3f ms' % (elapsed * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m nse.bench')
+    commands = parser.add_subparsers(dest='command')
+    parse = commands.add_parser('parse', help='quote parsing')
+    parse.add_argument('files', nargs='+', metavar='FILE',
+                       help='recorded GetQuote.jsp responses')
+    parse.add_argument('-repeat', type=int, default=1000)
+    startup = commands.add_parser('startup', help='start up time of nsecli.py')
+    startup.add_argument('-runs', type=int, default=20)
+    startup.add_argument('-threshold', type=float, default=None, metavar='MS',
+                         help='fail when a median is above MS milliseconds')
+    bench = commands.add_parser('indicators', help='technical indicators')
+    bench.add_argument('-symbols', type=int, default=500)
+    bench.add_argument('-years', type=int, default=10)
+    quotes = commands.add_parser('quotes', help='end to end quote fetching')
+    quotes.add_argument('-archive', default=None, metavar='FILE',
+                        help='responses saved by nsecli.py -record, made up '
+                             'when not given')
+    quotes.add_argument('-symbols', type=int, default=200,
+                        help='number of made up symbols')
+    quotes.add_argument('-workers', type=int, default=8)
+    quotes.add_argument('-latency', type=float, default=50, metavar='MS')
+    quotes.add_argument('-jitter', type=float, default=20, metavar='MS')
+    quotes.add_argument('-ticks', type=int, default=5,
+                        help='number of refreshes in watch mode')
+    stress = commands.add_parser('db', help='concurrent access to nse.db')
+    stress.add_argument('-processes', type=int, default=16)
+    stress.add_argument('-ops', type=int, default=500,
+                        help='operations per process')
+    stress.add_argument('-no_wal', action='store_true', default=False,
+                        help='keep the rollback journal')
+    ingest = commands.add_parser('ingest', help='bhavcopy loading')
+    ingest.add_argument('-symbols', type=int, default=1500)
+    ingest.add_argument('-years', type=int, default=2)
+    ingest.add_argument('-processes', type=int, default=None)
+    backtest = commands.add_parser('backtest', help='strategy backtests, needs numpy')
+    backtest.add_argument('-symbols', type=int, default=1500)
+    backtest.add_argument('-years', type=int, default=10)
+    backtest.add_argument('-params', type=int, default=100,
+                          help='number of parameter sets of the sweep')
+    backtest.add_argument('-processes', type=int, default=None)
+    screener = commands.add_parser('screen', help='screener expressions')
+    screener.add_argument('expression', nargs='?', metavar='EXPR',
+                          default='pChange > 3 and totalTradedVolume > 1e6 and '
+                                  'lastPrice > 0.9 * high52')
+    screener.add_argument('-symbols', type=int, default=2000)
+    screener.add_argument('-repeat', type=int, default=100)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == 'parse':
+        bench_parse(args.files, args.repeat)
+    elif args.command == 'startup':
+        if not bench_startup(args.runs, args.threshold):
+            sys.exit(1)
+    elif args.command == 'indicators':
+        bench_indicators(args.symbols, args.years)
+    elif args.command == 'quotes':
+        bench_quotes(args.archive, args.symbols, args.workers, args.latency,
+                     args.jitter, args.ticks)
+    elif args.command == 'db':
+        if not bench_db(args.processes, args.ops, not args.no_wal):
+            sys.exit(1)
+    elif args.command == 'ingest':
+        if not bench_ingest(args.symbols, args.years, args.processes):
+            sys.exit(1)
+    elif args.command == 'backtest':
+        bench_backtest(args.symbols, args.years, args.params, args.processes)
+    elif args.command == 'screen':
+        bench_screen(args.expression, args.symbols, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+''' the five level order book carried by a quote '''
+from array import array
+
+LEVELS = 5
+
+NAN = float('nan')
+
+# offsets of the four blocks of LEVELS values in OrderBook.values
+BID_PRICE, BID_QTY, ASK_PRICE, ASK_QTY = [n * LEVELS for n in range(4)]
+
+BOOK_FIELDS = tuple('%s%d' % (name, level)
+                    for name in ('buyPrice', 'buyQuantity',
+                                 'sellPrice', 'sellQuantity')
+                    for level in range(1, LEVELS + 1))
+
+
+class OrderBook(object):
+    ''' order book of a stock kept in a single array of doubles laid out as
+    the bid prices, bid quantities, ask prices and ask quantities of the
+    LEVELS levels, best level first. Empty levels are all zeros so that
+    unchanged books compare equal as a whole
+    '''
+    __slots__ = ('symbol', 'values', 'total_buy', 'total_sell')
+
+    def __init__(self, symbol, values, total_buy=0, total_sell=0):
+        self.symbol = symbol
+        self.values = values
+        self.total_buy = total_buy
+        self.total_sell = total_sell
+
+    @classmethod
+    def from_quote(cls, quote):
+        ''' builds the book from the buyPrice1..sellQuantity5 fields of a
+        Quote
+        '''
+        values = array('d', [quote.num(field, 0) for field in BOOK_FIELDS])
+        return cls(quote.get('symbol'), values,
+                   quote.num('totalBuyQuantity', 0),
+                   quote.num('totalSellQuantity', 0))
+
+    def bid(self, level=1):
+        ''' returns the (price, quantity) of a bid level '''
+        return (self.values[BID_PRICE + level - 1],
+                self.values[BID_QTY + level - 1])
+
+    def ask(self, level=1):
+        ''' returns the (price, quantity) of an ask level '''
+        return (self.values[ASK_PRICE + level - 1],
+                self.values[ASK_QTY + level - 1])
+
+    def spread(self):
+        ''' best ask minus best bid, nan when a side is empty '''
+        if not self.values[ASK_PRICE] or not self.values[BID_PRICE]:
+            return NAN
+        return self.values[ASK_PRICE] - self.values[BID_PRICE]
+
+    def mid(self):
+        ''' average of the best bid and the best ask '''
+        if not self.values[ASK_PRICE] or not self.values[BID_PRICE]:
+            return NAN
+        return (self.values[ASK_PRICE] + self.values[BID_PRICE]) / 2
+
+    def imbalance(self, levels=LEVELS):
+        ''' (bid quantity - ask quantity) / (bid quantity + ask quantity)
+        over the first levels, from -1 (only sellers) to 1 (only buyers)
+        '''
+        bids = sum(self.values[BID_QTY:BID_QTY + levels])
+        asks = sum(self.values[ASK_QTY:ASK_QTY + levels])
+        if not bids + asks:
+            return NAN
+        return (bids - asks) / (bids + asks)
+
+    def weighted_price(self, side=None, levels=LEVELS):
+        ''' quantity weighted average price of the first levels of the
+        'buy' or 'sell' side, or of both sides when side is None
+        '''
+        starts = {'buy': [BID_PRICE], 'sell': [ASK_PRICE]}.get(
+            side, [BID_PRICE, ASK_PRICE])
+        amount = quantity = 0.0
+        for start in starts:
+            for idx in range(start, start + levels):
+                qty = self.values[idx + LEVELS]
+                if qty:
+                    amount += self.values[idx] * qty
+                    quantity += qty
+        return amount / quantity if quantity else NAN
+
+    def diff(self, other):
+        ''' returns the indexes of the values which differ from the other
+        book, comparing the arrays at once before looking at single values
+        '''
+        if other is None:
+            return range(len(self.values))
+        if self.values == other.values:
+            return []
+        mine, theirs = self.values, other.values
+        return [idx for idx in range(len(mine)) if mine[idx] != theirs[idx]]
+
+    def changed_levels(self, other):
+        ''' returns the set of ('bid' or 'ask', level) rows which differ
+        from the other book
+        '''
+        return set(('bid' if idx < ASK_PRICE else 'ask', idx % LEVELS + 1)
+                   for idx in self.diff(other))
@@ -0,0 +1,1047 @@
+''' command line interface of nsecli.py '''
+import argparse
+import errno
+import logging
+import os
+import pipes
+import sys
+import time
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'nse.db')
+
+
+def build_parser():
+    ''' builds the parser for the command line options '''
+    cparser = argparse.ArgumentParser(prog='nsecli.py')
+    cparser.add_argument('code',
+                         nargs = '*',
+                         action='store',
+                         default = False,
+                         help='provide one or more stock codes')
+
+    cparser.add_argument('-workers',
+                         action="store",
+                         type=int,
+                         default=8,
+                         metavar = 'N',
+                         help='max number of quotes fetched in parallel')
+
+    cparser.add_argument('-refresh_symbols',
+                         action="store_true",
+                         default=False,
+                         help='updates the list of stock codes from nseindia.com')
+
+    cparser.add_argument('-search',
+                         action="store",
+                         default=None,
+                         metavar = 'TEXT',
+                         help='searches stock codes and company names')
+
+    cparser.add_argument('-limit',
+                         action="store",
+                         type=int,
+                         default=10,
+                         metavar = 'N',
+                         help='max number of results shown by -search, -screen and the -top_* '
+                         'commands')
+
+    cparser.add_argument('-depth',
+                         action="store_true",
+                         default=False,
+                         help='shows the order book of the stock codes as a price ladder, also with -watch')
+
+    cparser.add_argument('-top_gainers',
+                         action="store_true",
+                         default=False,
+                         help='shows the stocks which gained the most on the last trading day')
+
+    cparser.add_argument('-top_losers',
+                         action="store_true",
+                         default=False,
+                         help='shows the stocks which lost the most on the last trading day')
+
+    cparser.add_argument('-top_volume',
+                         action="store_true",
+                         default=False,
+                         help='shows the most traded stocks of the last trading day')
+
+    cparser.add_argument('-advance_declines',
+                         action="store_true",
+                         default=False,
+                         help='shows the number of advancing and declining stocks')
+
+    cparser.add_argument('-indices',
+                         action="store_true",
+                         default=False,
+                         help='shows the closing values of all the indices')
+
+    cparser.add_argument('-snapshot',
+                         action="store",
+                         default=None,
+                         metavar = 'FILE',
+                         help='bhavcopy file used instead of downloading the latest one')
+
+    cparser.add_argument('-screen',
+                         action="store",
+                         default=None,
+                         metavar = 'EXPR',
+                         help='lists the stocks of the latest bhavcopy matching an expression '
+                         'of display fields like "pChange > 3 and lastPrice > 0.9*high52", '
+                         'or the saved screen of that name')
+
+    cparser.add_argument('-sort',
+                         action="store",
+                         default=None,
+                         metavar = 'EXPR',
+                         help='orders the -screen results by an expression, largest first')
+
+    cparser.add_argument('-ascending',
+                         action="store_true",
+                         default=False,
+                         help='-sort puts the smallest first')
+
+    cparser.add_argument('-save_screen',
+                         action="store",
+                         default=None,
+                         metavar = 'NAME',
+                         help='saves the -screen expression under a name')
+
+    cparser.add_argument('-screens',
+                         action="store_true",
+                         default=False,
+                         help='lists the saved screens')
+
+    cparser.add_argument('-remove_screen',
+                         action="store",
+                         default=None,
+                         metavar = 'NAME',
+                         help='removes a saved screen')
+
+    cparser.add_argument('-batch',
+                         action="store",
+                         default=None,
+                         metavar = 'FILE',
+                         help='streams quotes for the codes listed in FILE, - for stdin')
+
+    cparser.add_argument('-format',
+                         action="store",
+                         choices=['ndjson', 'csv'],
+                         default='ndjson',
+                         help='output format of -batch, defaults to ndjson')
+
+    cparser.add_argument('-serve',
+                         action="store_true",
+                         default=False,
+                         help='runs the local quote server used by other nsecli.py runs')
+
+    cparser.add_argument('-port',
+                         action="store",
+                         type=int,
+                         default=None,
+                         help='port of the quote server, defaults to the SERVER_PORT setting')
+
+    cparser.add_argument('-no_daemon',
+                         action="store_true",
+                         default=False,
+                         help='fetches quotes directly even if the quote server is running')
+
+    cparser.add_argument('-history',
+                         action="store",
+                         default=None,
+                         metavar = 'CODE',
+                         help='shows the locally recorded quotes of a stock')
+
+    cparser.add_argument('-daily',
+                         action="store_true",
+                         default=False,
+                         help='-history shows the daily prices loaded by -ingest')
+
+    cparser.add_argument('-ingest',
+                         action="store",
+                         nargs = '*',
+                         default=None,
+                         metavar = 'SOURCE',
+                         help='loads bhavcopy archives from files, directories or urls '
+                         'into the daily history, downloads the days of -from and -to '
+                         'when no source is given')
+
+    cparser.add_argument('-backtest',
+                         action="store",
+                         default=None,
+                         metavar = 'STRATEGY',
+                         help='backtests sma_cross, breakout or mean_reversion over the '
+                         'daily history of the given codes, all of them by default. '
+                         'needs numpy')
+
+    cparser.add_argument('-params',
+                         action="store",
+                         nargs = '*',
+                         default=[],
+                         metavar = 'NAME=VALUES',
+                         help='parameters of -backtest like fast=10,20 slow=50, several '
+                         'values sweep all the combinations')
+
+    cparser.add_argument('-cost',
+                         action="store",
+                         type=float,
+                         default=10,
+                         metavar = 'BPS',
+                         help='cost of a -backtest trade in basis points of its value')
+
+    cparser.add_argument('-processes',
+                         action="store",
+                         type=int,
+                         default=None,
+                         metavar = 'N',
+                         help='number of processes of -ingest and -backtest, defaults to '
+                         'the cpu count')
+
+    cparser.add_argument('-from',
+                         action="store",
+                         dest='start',
+                         type=start_time,
+                         default=None,
+                         metavar = 'DATE',
+                         help='start of -history and -ingest, as YYYY-MM-DD [HH:MM[:SS]]')
+
+    cparser.add_argument('-to',
+                         action="store",
+                         dest='end',
+                         type=end_time,
+                         default=None,
+                         metavar = 'DATE',
+                         help='end of -history and -ingest, as YYYY-MM-DD [HH:MM[:SS]]')
+
+    cparser.add_argument('-watch',
+                         action="store_true",
+                         default=False,
+                         help='keeps refreshing the quotes of the given codes in place')
+
+    cparser.add_argument('-interval',
+                         action="store",
+                         type=float,
+                         default=2,
+                         metavar = 'SECONDS',
+                         help='refresh interval of -watch, defaults to 2 seconds')
+
+    cparser.add_argument('-max_age',
+                         action="store",
+                         type=float,
+                         default=None,
+                         metavar = 'SECONDS',
+                         help='serve quotes cached within SECONDS, defaults to the QUOTE_TTL setting')
+
+    cparser.add_argument('-no_cache',
+                         action="store_true",
+                         default=False,
+                         help='always fetch quotes from the market')
+
+    cparser.add_argument('-stale',
+                         action="store_true",
+                         default=False,
+                         help='serve expired cached quotes while refreshing them')
+
+    cparser.add_argument('-cache_ttl',
+                         action="store",
+                         type=float,
+                         default=None,
+                         metavar = 'SECONDS',
+                         help='sets the QUOTE_TTL setting')
+
+    cparser.add_argument('-portfolio',
+                         action="store_true",
+                         default=False,
+                         help='values the holdings, also with -watch')
+
+    cparser.add_argument('-set_holding',
+                         action="store",
+                         nargs=3,
+                         default=None,
+                         metavar = ('SYMBOL', 'QTY', 'COST'),
+                         help='sets the quantity and average cost of a holding, a quantity of 0 removes it')
+
+    cparser.add_argument('-add_alert',
+                         action="store",
+                         nargs='+',
+                         default=None,
+                         metavar = 'RULE',
+                         help='adds an alert rule like "INFY lastPrice > 1800", "pChange < -3" or "price crosses sma20", optionally followed by a sink: stdout, file:PATH or exec:COMMAND')
+
+    cparser.add_argument('-alerts',
+                         action="store_true",
+                         default=False,
+                         help='lists the alert rules')
+
+    cparser.add_argument('-remove_alert',
+                         action="store",
+                         type=int,
+                         default=None,
+                         metavar = 'ID',
+                         help='removes an alert rule')
+
+    cparser.add_argument('-record',
+                         action="store",
+                         default=None,
+                         metavar = 'FILE',
+                         help='saves the responses of nseindia.com to a zip archive')
+
+    cparser.add_argument('-replay',
+                         action="store",
+                         default=None,
+                         metavar = 'FILE',
+                         help='answers requests from an archive saved by -record instead of nseindia.com')
+
+    cparser.add_argument('-latency',
+                         action="store",
+                         type=float,
+                         default=0,
+                         metavar = 'MS',
+                         help='delay of the responses of -replay')
+
+    cparser.add_argument('-jitter',
+                         action="store",
+                         type=float,
+                         default=0,
+                         metavar = 'MS',
+                         help='random extra delay of up to MS added to -latency')
+
+    cparser.add_argument('-db',
+                         action="store",
+                         default=DEFAULT_DB_PATH,
+                         metavar = 'PATH',
+                         help='database file, defaults to nse.db next to nsecli.py')
+
+    cparser.add_argument('-set_config',
+                         action="store",
+                         nargs=2,
+                         default=None,
+                         metavar = ('SETTING', 'VALUE'),
+                         help='changes a setting, e.g. RATE_LIMIT, MAX_RETRIES or BREAKER_COOLDOWN')
+
+    cparser.add_argument('-profile',
+                         action="store_true",
+                         default=False,
+                         help='prints the time spent in every phase on exit')
+
+    cparser.add_argument('-metrics',
+                         action="store",
+                         default=None,
+                         metavar = 'FILE',
+                         help='writes the counters and timings to a json file on exit, the quote server also serves them on /metrics')
+
+    cparser.add_argument('-D',
+                         action="store_true",
+                         default=False,
+                         help='enables debug mode for debugging purpose')
+
+    cparser.add_argument('-reset',
+                         action="store_true",
+                         default=False,
+                         help='resets all the display settings')
+
+    cparser.add_argument('-current_display_fields',
+                         action="store_true",
+                         default=False,
+                         help='shows current display fields')
+
+    cparser.add_argument('-all_display_fields',
+                         action="store_true",
+                         default=False,
+                         help='shows all possible display fields')
+
+    cparser.add_argument('-add_display_fields',
+                         action="store",
+                         nargs = '*',
+                         default=False,
+                         metavar = '',
+                         help='adds a display field')
+
+    cparser.add_argument('-remove_display_fields',
+                         action="store",
+                         nargs = '*',
+                         default=False,
+                         metavar = '',
+                         help='deletes a display fields')
+
+    cparser.add_argument('-completion',
+                         action="store",
+                         choices=('bash', 'zsh'),
+                         default=None,
+                         help='prints the shell completion of stock codes and '
+                         'display fields, e.g. eval "$(nsecli.py -completion bash)"')
+    return cparser
+
+
+# shell functions printed by -completion, they call back -complete KIND
+# PREFIX DB which only reads the symbol index
+BASH_COMPLETION = '''_nsecli() {
+    local cur=${COMP_WORDS[COMP_CWORD]} kind=codes i
+    case ${COMP_WORDS[COMP_CWORD-1]} in
+        -db|-batch|-snapshot|-record|-replay|-metrics) return ;;
+    esac
+    for ((i = COMP_CWORD - 1; i > 0; i--)); do
+        case ${COMP_WORDS[i]} in
+            -add_display_fields|-remove_display_fields) kind=fields; break ;;
+            -*) break ;;
+        esac
+    done
+    [[ $cur == -* ]] && kind=options
+    COMPREPLY=($(%(program)s -complete $kind "$cur" %(db)s 2>/dev/null))
+}
+complete -o default -F _nsecli nsecli.py %(program)s
+'''
+
+ZSH_COMPLETION = '''_nsecli() {
+    local cur=${words[CURRENT]} kind=codes i
+    case ${words[CURRENT-1]} in
+        -db|-batch|-snapshot|-record|-replay|-metrics) _files; return ;;
+    esac
+    for ((i = CURRENT - 1; i > 1; i--)); do
+        case ${words[i]} in
+            -add_display_fields|-remove_display_fields) kind=fields; break ;;
+            -*) break ;;
+        esac
+    done
+    [[ $cur == -* ]] && kind=options
+    compadd -U -- ${(f)"$(%(program)s -complete $kind "$cur" %(db)s 2>/dev/null)"}
+}
+compdef _nsecli nsecli.py %(program)s
+'''
+
+
+def main(argv=None):
+    ''' entry point of nsecli.py. only the modules needed by the given
+    options are imported
+    '''
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['-complete']:
+        complete(argv[1:])
+        return
+    cli = build_parser().parse_args(argv)
+    if cli.completion is not None:
+        print completion_script(cli.completion, cli.db)
+        return
+
+    #### SET LOG LEVEL ####
+    if cli.D is True:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+    log = logging.getLogger('NseCli')
+
+    from nse.metrics import METRICS, span
+    if cli.profile or cli.metrics is not None or cli.serve:
+        import atexit
+        METRICS.enable()
+        if cli.profile:
+            atexit.register(METRICS.report, sys.stderr)
+        if cli.metrics is not None:
+            atexit.register(METRICS.dump, cli.metrics)
+
+    #### INSTANTIATE CLASSES ####
+    from nse.db import DB
+    from nse.display import NseDisplay
+    with span('db.open'):
+        db = DB(cli.db)
+    disp = NseDisplay(db, history=history_store(cli))
+
+    #### INTIALYZE DB FOR THE FIRST TIME USE ####
+    with span('db.bootstrap'):
+        db.bootstrap()
+    if not db.has_table('STOCKS'):
+        from nse.quote import QuoteError
+        with db.lock():
+            if not db.has_table('STOCKS'):
+                try:
+                    data = driver(db, cli).download_stock_csv()
+                except QuoteError as err:
+                    print >> sys.stderr, 'unable to download the stock codes: %s' % err
+                    sys.exit(1)
+                db.create_stocks_table(data)
+
+    if cli.no_cache is True:
+        max_age = 0
+    elif cli.max_age is not None:
+        max_age = cli.max_age
+    else:
+        max_age = float(db.get_config_setting('QUOTE_TTL')[0])
+
+    if cli.port is None:
+        cli.port = int(db.get_config_setting('SERVER_PORT')[0])
+
+    checked = None
+    if cli.code:
+        checked = list(check_codes(db, cli.code))
+        cli.code = [code for given, code in checked if code is not None]
+        if cli.watch is True or cli.backtest is not None:
+            # without a result per code the unknown codes are told first
+            for given, code in checked:
+                if code is None:
+                    disp.show_invalid_code(given)
+                elif code != given.upper():
+                    print >> sys.stderr, '"%s" is not a stock code, using %s' % (given, code)
+            if not cli.code:
+                return
+
+    if cli.serve is True:
+        from nse.server import QuoteServer, QuoteService
+        listeners = [history_store(cli).append]
+        engine = alert_engine(db, cli, store=False)
+        if engine is not None:
+            listeners.append(engine.on_quote)
+        service = QuoteService(driver(db, cli), ttl=max_age, listeners=listeners)
+        import socket
+        try:
+            server = QuoteServer(service, cli.port)
+        except socket.error as err:
+            if err.errno == errno.EADDRINUSE:
+                print >> sys.stderr, ('port %d is already in use, stop the program '
+                                      'listening on it or pass -port' % cli.port)
+            else:
+                print >> sys.stderr, 'unable to serve on port %d: %s' % (cli.port, err)
+            sys.exit(1)
+        print 'serving quotes on 127.0.0.1:%d' % cli.port
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print
+    elif cli.portfolio is True:
+        portfolio_command(db, disp, cli, max_age)
+    elif cli.backtest is not None:
+        backtest_command(disp, cli)
+    elif cli.code and cli.watch is True:
+        from nse.watch import NseWatcher
+        try:
+            NseWatcher(quote_driver(db, cli), disp, interval=cli.interval,
+                       view='depth' if cli.depth else 'quotes').run(cli.code)
+        except KeyboardInterrupt:
+            print
+    elif cli.batch is not None:
+        source = sys.stdin if cli.batch == '-' else open(cli.batch)
+        nse = quote_driver(db, cli)
+        try:
+            # unknown codes get their error record in the output
+            disp.write_batch(with_unknown_codes(
+                check_codes(db, read_codes(source)),
+                lambda codes: nse.iter_quotes(codes, max_age=max_age)), cli.format)
+        except IOError as err:
+            # the reader of the output went away, e.g. piped to head
+            if err.errno != errno.EPIPE:
+                raise
+    elif checked and cli.depth is True:
+        nse = quote_driver(db, cli)
+        disp.show_depths(with_unknown_codes(
+            checked, lambda codes: get_quotes(nse, codes, max_age=max_age)))
+    elif checked:
+        nse = quote_driver(db, cli)
+        stale = cli.stale and not cli.no_cache
+        results = with_unknown_codes(checked, lambda codes: get_quotes(
+            nse, codes, max_age=max_age, stale=stale))
+        disp.show_quotes(list(results), corrected=dict(
+            (code, given) for given, code in checked
+            if code is not None and code != given.upper()))
+        nse.wait_for_refresh()
+        # a request to the quote server when it is running
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('connection stats: %s', nse.connection_stats())
+    else:
+        if cli.current_display_fields is True:
+            disp.show_current_display_fields()
+        elif cli.all_display_fields is True:
+            disp.show_all_display_fields()
+        elif cli.add_display_fields is not False:
+            disp.add_display_fields(cli.add_display_fields)
+        elif cli.reset is True:
+            disp.reset_display_fields()
+        elif cli.remove_display_fields is not False:
+            disp.remove_display_fields(cli.remove_display_fields)
+        elif cli.refresh_symbols is True:
+            from nse.quote import QuoteError
+            try:
+                counts = driver(db, cli).refresh_symbols()
+            except QuoteError as err:
+                print >> sys.stderr, 'unable to refresh the stock codes: %s' % err
+                sys.exit(1)
+            if counts is None:
+                print 'stock codes are already up to date'
+            else:
+                print '%d added, %d removed, %d renamed' % counts
+        elif (cli.top_gainers or cli.top_losers or cli.top_volume or
+              cli.advance_declines or cli.indices):
+            market_command(db, disp, cli)
+        elif cli.screen is not None:
+            screen_command(db, disp, cli)
+        elif cli.screens is True:
+            disp.show_screens(db.get_screens())
+        elif cli.remove_screen is not None:
+            if not db.remove_screen(cli.remove_screen):
+                print 'no screen named %s' % cli.remove_screen
+        elif cli.ingest is not None:
+            ingest_command(db, cli)
+        elif cli.history is not None and cli.daily is True:
+            store = daily_store(cli)
+            disp.show_history(cli.history, store.read(
+                cli.history, utc_day(cli.start), utc_day(cli.end)),
+                store.columns, daily=True)
+        elif cli.history is not None:
+            disp.show_history(cli.history, history_store(cli).read(
+                cli.history, cli.start, cli.end))
+        elif cli.search is not None:
+            disp.show_matches(cli.search, cli.limit)
+        elif cli.set_holding is not None:
+            set_holding(db, cli.set_holding)
+        elif cli.add_alert is not None:
+            add_alert(db, cli.add_alert)
+        elif cli.alerts is True:
+            disp.show_alerts(db.get_alerts())
+        elif cli.remove_alert is not None:
+            if not db.remove_alert(cli.remove_alert):
+                print 'no alert with id %d' % cli.remove_alert
+        elif cli.cache_ttl is not None:
+            db.update_config_setting('QUOTE_TTL', str(cli.cache_ttl))
+        elif cli.set_config is not None:
+            setting, value = cli.set_config
+            db.load_config()
+            if setting not in db.config:
+                print 'unknown setting %s' % setting
+            else:
+                db.update_config_setting(setting, value)
+
+
+def driver(db, cli, history=False):
+    ''' returns the NseDriver, imported only by the options which need
+    the network. with history=True fetched quotes are recorded in the
+    history store
+    '''
+    from nse.driver import NseDriver
+    nse = NseDriver(db, workers=cli.workers, transport=transport(cli))
+    if history:
+        nse.add_listener(history_store(cli).append)
+        engine = alert_engine(db, cli)
+        if engine is not None:
+            nse.add_listener(engine.on_quote)
+    return nse
+
+
+def transport(cli):
+    ''' returns the transport of the NseDriver for -record and -replay,
+    None for the live transport. the archive is opened once per run as
+    several drivers may be built
+    '''
+    if getattr(cli, 'transport', None) is not None:
+        return cli.transport
+    if cli.replay is not None:
+        from nse.transport import Archive, ReplayHandler
+        archive = Archive(cli.replay)
+        cli.transport = lambda live: ReplayHandler(archive, cli.latency / 1000.0,
+                                                   cli.jitter / 1000.0)
+    elif cli.record is not None:
+        import atexit
+        from nse.transport import Archive, RecordingHandler
+        archive = Archive(cli.record, 'a')
+        atexit.register(archive.close)
+        cli.transport = lambda live: RecordingHandler(live, archive)
+    return getattr(cli, 'transport', None)
+
+
+def alert_engine(db, cli, store=True):
+    ''' returns the AlertEngine of the alert rules, None when there is
+    none. with store=False the fired alerts are remembered in memory only,
+    as the quote server calls the listeners from its request threads
+    '''
+    rows = db.get_alerts()
+    if not rows:
+        return None
+    from nse.alerts import AlertEngine
+    return AlertEngine(rows,
+                       hysteresis=float(db.get_config_setting('ALERT_HYSTERESIS')[0]) / 100,
+                       history=history_store(cli),
+                       states=db.get_alert_states(),
+                       store=db.set_alert_states if store else None)
+
+
+def portfolio_command(db, disp, cli, max_age):
+    ''' values the holdings once, or continuously with -watch. all the
+    holdings are priced with one concurrent get_quotes call
+    '''
+    from nse.portfolio import Portfolio
+    holdings = db.get_holdings()
+    if not holdings:
+        print 'no holdings, add some with -set_holding SYMBOL QTY COST'
+        return
+    codes = [symbol for symbol, qty, cost in holdings]
+    nse = quote_driver(db, cli)
+    if cli.watch is True:
+        from nse.watch import NseWatcher
+        try:
+            NseWatcher(nse, disp, interval=cli.interval, view='portfolio').run(codes)
+        except KeyboardInterrupt:
+            print
+        return
+    disp.show_portfolio(Portfolio(holdings), nse.get_quotes(codes, max_age=max_age))
+
+
+def set_holding(db, args):
+    ''' stores the SYMBOL QTY COST of -set_holding '''
+    symbol, qty, cost = args
+    try:
+        qty, cost = float(qty), float(cost)
+    except ValueError:
+        print 'QTY and COST must be numbers'
+        return
+    db.set_holding(symbol.upper(), qty, cost)
+
+
+def add_alert(db, args):
+    ''' validates and stores the rule and the optional sink of -add_alert '''
+    from nse.alerts import Rule, make_sink
+    from nse.indicators import is_indicator
+    if len(args) > 2:
+        print 'quote the rule, e.g. -add_alert "INFY lastPrice > 1800" stdout'
+        return
+    text, sink = args[0], args[1] if len(args) > 1 else 'stdout'
+    try:
+        rule = Rule.parse(text)
+        make_sink(sink)
+    except ValueError as err:
+        print err
+        return
+    fields = db.get_config_setting('ALL_DISPLAY_FIELDS')
+    for name in (rule.left, rule.right):
+        if isinstance(name, basestring) and name not in fields and not is_indicator(name):
+            print 'unknown field %s, see -all_display_fields' % name
+            return
+    print 'added alert %d' % db.add_alert(rule.symbol, rule.text, sink)
+
+
+def quote_driver(db, cli):
+    ''' returns the driver used to fetch quotes, a DaemonDriver when the
+    quote server is running and an NseDriver recording the history
+    otherwise
+    '''
+    if (not cli.no_daemon and cli.record is None and cli.replay is None and
+            daemon_listening(cli.port)):
+        from nse.server import DaemonDriver
+        if DaemonDriver.available(cli.port):
+            logging.getLogger('NseCli').debug('using quote server on port %d',
+                                              cli.port)
+            return DaemonDriver(cli.port)
+    return driver(db, cli, history=True)
+
+
+def daemon_listening(port):
+    ''' cheap check for a listener on the quote server port, done before
+    importing anything http related
+    '''
+    import socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(0.05)
+    try:
+        return sock.connect_ex(('127.0.0.1', port)) == 0
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def market_data(db, cli):
+    ''' returns the MarketData kept in the market directory next to the
+    database
+    '''
+    from nse.market import MarketData
+    root = os.path.join(os.path.dirname(os.path.abspath(cli.db)), 'market')
+    return MarketData(lambda: driver(db, cli), root,
+                      ttl=float(db.get_config_setting('SNAPSHOT_TTL')[0]))
+
+
+def market_command(db, disp, cli):
+    ''' runs the -top_*, -advance_declines and -indices commands '''
+    from nse.quote import QuoteError
+    market = market_data(db, cli)
+    try:
+        if cli.indices:
+            disp.show_indices(market.indices())
+            return
+        snapshot = market.snapshot(cli.snapshot)
+    except (QuoteError, IOError, ValueError) as err:
+        print 'unable to get the market data: %s' % err
+        return
+    if snapshot.day:
+        print 'as of %s' % snapshot.day
+    if cli.top_gainers:
+        disp.show_ranking(snapshot, snapshot.top('pChange', cli.limit))
+    elif cli.top_losers:
+        disp.show_ranking(snapshot, snapshot.top('pChange', cli.limit,
+                                                 ascending=True))
+    elif cli.top_volume:
+        disp.show_ranking(snapshot, snapshot.top('totalTradedVolume', cli.limit))
+    else:
+        disp.show_advance_declines(snapshot)
+
+
+def symbol_index(db):
+    ''' returns the SymbolIndex of the database, written first when it is
+    missing, None when it can't be read
+    '''
+    from nse.symbols import SymbolIndex
+    try:
+        return SymbolIndex(db.symbol_index_path())
+    except (IOError, ValueError):
+        db.write_symbol_index()
+    try:
+        return SymbolIndex(db.symbol_index_path())
+    except (IOError, ValueError):
+        return None
+
+
+def symbol_index_path(db):
+    ''' returns the path of the symbol index, written first if missing '''
+    if symbol_index(db) is None:
+        return None
+    return db.symbol_index_path()
+
+
+def check_codes(db, codes):
+    ''' checks the codes against the symbol index before anything is
+    fetched. yields a (given, code) pair per code in input order, code
+    being the known code in upper case with single typos fixed, None for
+    the other unknown codes. a code already yielded, also after its
+    correction, is skipped. lazy, for the endless inputs of -batch
+    '''
+    index = symbol_index(db)
+    seen = set()
+    for given in codes:
+        code = given
+        if index is not None and len(index.codes):
+            code = index.correct(given)
+        if code is not None:
+            if code in seen:
+                continue
+            seen.add(code)
+        yield given, code
+
+
+def with_unknown_codes(checked, fetch):
+    ''' yields the (code, quote, error) results of fetch over the known
+    codes of checked, the pairs of check_codes, with an InvalidCodeError
+    result at the position of every unknown code. fetch takes an
+    iterable of codes and returns their results in the same order
+    '''
+    from collections import deque
+    from nse.quote import InvalidCodeError
+    checked = iter(checked)
+    pending = deque()
+
+    def known():
+        for given, code in checked:
+            pending.append((given, code))
+            if code is not None:
+                yield code
+    for result in fetch(known()):
+        while pending[0][1] is None:
+            given, code = pending.popleft()
+            yield given, None, InvalidCodeError(given)
+        pending.popleft()
+        yield result
+    for given, code in pending:
+        yield given, None, InvalidCodeError(given)
+
+
+def get_quotes(nse, codes, **kwargs):
+    ''' get_quotes of the driver over an iterable of codes, none is
+    fetched for no code
+    '''
+    codes = list(codes)
+    if not codes:
+        return []
+    return nse.get_quotes(codes, **kwargs)
+
+
+def complete(args):
+    ''' prints the completions of -complete KIND PREFIX [DB], one per line.
+    KIND is codes, fields or options. runs before the database is opened,
+    codes and fields come from the symbol index
+    '''
+    if not args:
+        return
+    kind, prefix = args[0], args[1] if len(args) > 1 else ''
+    if kind == 'options':
+        options = build_parser()._option_string_actions
+        matches = sorted(option for option in options if option.startswith(prefix))
+    else:
+        from nse.symbols import SymbolIndex
+        db_path = args[2] if len(args) > 2 else DEFAULT_DB_PATH
+        try:
+            index = SymbolIndex(db_path + '.symbols')
+        except (IOError, ValueError):
+            return
+        if kind == 'fields':
+            matches = index.complete_field(prefix)
+        else:
+            matches = index.complete_code(prefix)
+    for match in matches:
+        print match
+
+
+def completion_script(shell, db_path):
+    ''' returns the completion of -completion for the shell '''
+    program = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'nsecli.py')
+    template = BASH_COMPLETION if shell == 'bash' else ZSH_COMPLETION
+    return template % {'program': pipes.quote(program),
+                       'db': pipes.quote(os.path.abspath(db_path))}
+
+
+def screen_command(db, disp, cli):
+    ''' runs -screen over the snapshot of the latest bhavcopy, saving it
+    first with -save_screen
+    '''
+    from nse.quote import QuoteError
+    from nse.screen import Screen, screen
+    text = dict(db.get_screens()).get(cli.screen, cli.screen)
+    fields = db.get_config_setting('ALL_DISPLAY_FIELDS')
+    try:
+        where = Screen(text, fields)
+        order = Screen(cli.sort, fields, condition=False) if cli.sort else None
+    except ValueError as err:
+        print err
+        return
+    if cli.save_screen is not None:
+        db.save_screen(cli.save_screen, where.text)
+        print 'saved screen %s' % cli.save_screen
+    try:
+        snapshot = market_data(db, cli).snapshot(cli.snapshot)
+    except (QuoteError, IOError, ValueError) as err:
+        print 'unable to get the market data: %s' % err
+        return
+    names = where.names + (order.names if order else [])
+    if 'high52' in names or 'low52' in names:
+        snapshot.add_year_range(daily_store(cli))
+    try:
+        ranked = screen(snapshot, where, order, cli.ascending, cli.limit)
+    except ValueError as err:
+        print err
+        return
+    if snapshot.day:
+        print 'as of %s' % snapshot.day
+    shown = ['lastPrice', 'pChange']
+    for name in names:
+        if name not in shown:
+            shown.append(name)
+    disp.show_screen(snapshot, ranked, shown)
+
+
+def read_codes(lines):
+    ''' yields the stock codes of a batch file, any number per line.
+    blank lines and # comments are skipped
+    '''
+    for line in lines:
+        for code in line.split('#')[0].split():
+            yield code
+
+
+def history_store(cli):
+    ''' returns the HistoryStore kept in the history directory next to
+    the database
+    '''
+    from nse.history import HistoryStore
+    return HistoryStore(os.path.join(os.path.dirname(os.path.abspath(cli.db)),
+                                     'history'))
+
+
+def daily_store(cli):
+    ''' returns the HistoryStore of the daily prices loaded by -ingest,
+    kept in the daily directory next to the database
+    '''
+    from nse.history import HistoryStore
+    from nse.ingest import DAILY_COLUMNS
+    return HistoryStore(os.path.join(os.path.dirname(os.path.abspath(cli.db)),
+                                     'daily'), DAILY_COLUMNS)
+
+
+def ingest_command(db, cli):
+    ''' loads the bhavcopies of -ingest into the daily history. urls and
+    the days of -from/-to are downloaded to the market directory first
+    '''
+    from nse.ingest import Ingester, download_archives, find_archives
+    urls = [s for s in cli.ingest if s.startswith(('http://', 'https://'))]
+    paths = find_archives([s for s in cli.ingest if s not in urls])
+    if urls or cli.start is not None:
+        root = os.path.join(os.path.dirname(os.path.abspath(cli.db)), 'market', 'bhav')
+        end = cli.end if cli.end is not None else time.time()
+        paths += download_archives(driver(db, cli), root, urls, cli.start, end)
+    elif not paths:
+        print 'give bhavcopy files, directories or urls, or the days with -from and -to'
+        return
+    started = time.time()
+    stats = Ingester(daily_store(cli), symbol_index_path(db),
+                     processes=cli.processes).ingest(paths)
+    print '%d days, %d rows stored, %d rows of unknown symbols, %d errors in %.1f s' % (
+        stats['days'], stats['rows'], stats['unknown'], stats['errors'],
+        time.time() - started)
+
+
+def backtest_command(disp, cli):
+    ''' runs -backtest over the daily history, a sweep when -params gives
+    several parameter sets
+    '''
+    try:
+        from nse import backtest
+    except ImportError:
+        print '-backtest needs numpy, install it with pip install numpy'
+        return
+    try:
+        grid = backtest.parse_grid(cli.backtest, cli.params)
+    except ValueError as err:
+        print err
+        return
+    panel = backtest.Panel.load(daily_store(cli), cli.code or None,
+                                utc_day(cli.start), utc_day(cli.end))
+    if not panel.symbols:
+        print 'no daily history, load bhavcopies with -ingest first'
+        return
+    cost = cli.cost / 10000
+    if len(grid) == 1:
+        disp.show_backtest(backtest.run(panel, cli.backtest, grid[0], cost),
+                           cli.limit)
+    else:
+        disp.show_sweep(backtest.sweep(panel, cli.backtest, grid, cost,
+                                       cli.processes), cli.limit)
+
+
+def utc_day(timestamp):
+    ''' moves a local time to the same wall clock time in UTC, the dates
+    of -from and -to then match the days of the daily history
+    '''
+    if timestamp is None:
+        return None
+    import calendar
+    return calendar.timegm(time.localtime(timestamp))
+
+
+def parse_time(text):
+    ''' parses a local date and optional time, returns (timestamp,
+    has_time)
+    '''
+    for fmt, has_time in (('%Y-%m-%d %H:%M:%S', True), ('%Y-%m-%d %H:%M', True),
+                          ('%Y-%m-%d', False)):
+        try:
+            return time.mktime(time.strptime(text, fmt)), has_time
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError('invalid date %r' % text)
+
+
+def start_time(text):
+    ''' argparse type of -from '''
+    return parse_time(text)[0]
+
+
+def end_time(text):
+    ''' argparse type of -to, a date without time includes the whole day '''
+    timestamp, has_time = parse_time(text)
+    if has_time:
+        return timestamp
+    return timestamp + 24 * 60 * 60
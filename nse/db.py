@@ -0,0 +1,608 @@
+''' the sqlite database holding the stock list, settings and cache '''
+from cStringIO import StringIO
+import csv
+import json
+import logging
+import sqlite3
+import sys
+
+from nse.indicators import FIELDS as INDICATOR_FIELDS
+from nse.lock import FileLock
+from nse.metrics import span
+from nse.quote import Quote
+from nse.search import stock_grams, query_grams, match_rank
+from nse.symbols import write_index
+
+# PRAGMA user_version of an up to date database, bump it whenever migrate()
+# learns something new so that existing databases run it once more
+SCHEMA_VERSION = 3
+# seconds a connection waits for another process to release its lock
+BUSY_TIMEOUT = 30
+# config settings holding the saved screens, see save_screen
+SCREEN_PREFIX = 'SCREEN_'
+
+
+def parse_stock_csv(data):
+    ''' yields (code, name) tuples from the contents of EQUITY_L.csv,
+    skipping the header and blank lines
+    '''
+    for row in csv.reader(StringIO(data)):
+        if len(row) < 2 or 'NAME OF COMPANY' in row[1]:
+            continue
+        code = row[0].strip().decode('utf-8', 'replace')
+        name = row[1].strip().decode('utf-8', 'replace')
+        if code:
+            yield code, name
+
+class DB(object):
+    ''' This class abstracts all the data access needs for other classes.
+    It also makes sure database is created and connected when the application
+    is used first time and database is connected when application is used
+    later. None of the classes in the system, except this class should attempt
+    to connect to the database.
+    All the other classes in the system which needs context and db awareness
+    should accept this class as one of constructor requirement
+    '''
+    def __init__(self, db_path, wal=True):
+        self.log = logging.getLogger('DB')
+        self.db_path = db_path
+        # in memory copy of the config table, see load_config
+        self.config = None
+        self.config_version = None
+        try:
+            # statements are parameterized, the cache keeps them prepared
+            self.db = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT,
+                                      cached_statements=256)
+            self.configure_connection(wal)
+        except Exception, err:
+            self.log.error('Error while connecting to database')
+            self.log.error(str(err))
+            sys.exit()
+
+    def configure_connection(self, wal=True):
+        ''' switches the database to WAL so that readers never wait for a
+        writer and commits don't fsync, several nsecli processes often use
+        the same database at once
+        '''
+        if wal:
+            mode = self.db.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+            if mode != 'wal':
+                self.log.debug('WAL is not available, using %s journal', mode)
+            self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.execute('PRAGMA temp_store = MEMORY')
+
+    def lock(self):
+        ''' returns the lock held while creating or migrating the schema '''
+        return FileLock(self.db_path + '.lock')
+
+    def schema_version(self):
+        return self.db.execute('PRAGMA user_version').fetchone()[0]
+
+    def bootstrap(self):
+        ''' creates the config table of a new database and migrates older
+        ones. concurrent processes take turns on the lock and a database
+        already at SCHEMA_VERSION is left alone without locking
+        '''
+        if self.schema_version() >= SCHEMA_VERSION:
+            return
+        with self.lock():
+            if not self.has_table('CONFIG'):
+                self.create_config_table()
+            if self.schema_version() < SCHEMA_VERSION:
+                self.migrate()
+
+    def create_stocks_table(self, data):
+        ''' creates the stocks table in the database from the contents
+        of EQUITY_L.csv
+        '''
+        # delete the table if it is already present
+        self.db.execute('DROP TABLE IF EXISTS STOCKS')
+        try:
+            self.db.execute('CREATE TABLE STOCKS\
+                            (ID INTEGER PRIMARY KEY AUTOINCREMENT, CODE TEXT, NAME TEXT)')
+            self.db.execute('CREATE INDEX STOCKS_CODE ON STOCKS (CODE)')
+        except Exception, e:
+            self.log.error('stocks table already exists !!')
+            print str(e)
+            sys.exit()
+
+        try:
+            with self.db:
+                self.db.executemany('INSERT INTO STOCKS (CODE, NAME) VALUES(?, ?)',
+                                    parse_stock_csv(data))
+        except Exception, e:
+            self.log.error('error while inserting rows to stocks table from csv file')
+            self.log.error(str(e))
+        else:
+            self.log.debug('all rows inserted to stocks table successfully')
+        self.build_search_index()
+        self.write_symbol_index()
+
+    def refresh_stocks_table(self, data):
+        ''' applies only the differences between the contents of
+        EQUITY_L.csv and the stocks table. returns the number of
+        (inserted, deleted, renamed) stocks
+        '''
+        existing = {}
+        for idx, code, name in self.db.execute('SELECT ID, CODE, NAME FROM STOCKS'):
+            existing[code] = (idx, name)
+        latest = dict(parse_stock_csv(data))
+
+        inserts = [(code, name) for code, name in latest.iteritems()
+                   if code not in existing]
+        deletes = [(existing[code][0],) for code in existing
+                   if code not in latest]
+        renames = [(latest[code], idx) for code, (idx, name)
+                   in existing.iteritems()
+                   if code in latest and latest[code] != name]
+        self.log.debug('%d inserts, %d deletes, %d renames',
+                       len(inserts), len(deletes), len(renames))
+        try:
+            with self.db:
+                c = self.db.cursor()
+                c.executemany('DELETE FROM STOCKS WHERE ID = ?', deletes)
+                c.executemany('UPDATE STOCKS SET NAME = ? WHERE ID = ?', renames)
+                stale = deletes + [(idx,) for name, idx in renames]
+                c.executemany('DELETE FROM STOCK_GRAMS WHERE STOCK_ID = ?', stale)
+                changed = []
+                for code, name in inserts:
+                    c.execute('INSERT INTO STOCKS (CODE, NAME) VALUES(?, ?)',
+                              (code, name))
+                    changed.append((c.lastrowid, code, name))
+                changed += [(idx, code, latest[code]) for code, (idx, name)
+                            in existing.iteritems()
+                            if code in latest and latest[code] != name]
+                c.executemany('INSERT INTO STOCK_GRAMS (GRAM, STOCK_ID) VALUES(?, ?)',
+                              ((gram, idx) for idx, code, name in changed
+                               for gram in stock_grams(code, name)))
+        except Exception, err:
+            self.log.error('error while refreshing stocks table')
+            self.log.error(str(err))
+            sys.exit()
+        if inserts or deletes:
+            self.write_symbol_index()
+        return len(inserts), len(deletes), len(renames)
+
+    def build_search_index(self):
+        ''' (re)builds the trigram index over the code and name of every
+        stock which backs search_stocks
+        '''
+        self.log.debug('building stock search index')
+        try:
+            self.db.execute('DROP TABLE IF EXISTS STOCK_GRAMS')
+            self.db.execute('CREATE TABLE STOCK_GRAMS (GRAM TEXT, STOCK_ID INTEGER)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS STOCKS_CODE ON STOCKS (CODE)')
+            rows = self.db.execute('SELECT ID, CODE, NAME FROM STOCKS').fetchall()
+            self.db.executemany('INSERT INTO STOCK_GRAMS (GRAM, STOCK_ID) VALUES(?, ?)',
+                                ((gram, idx) for idx, code, name in rows
+                                 for gram in stock_grams(code, name)))
+            self.db.execute('CREATE INDEX STOCK_GRAMS_GRAM ON STOCK_GRAMS (GRAM, STOCK_ID)')
+        except Exception, err:
+            self.log.error('error while building stock search index')
+            self.log.error(str(err))
+            self.db.rollback()
+        else:
+            self.db.commit()
+
+    def symbol_index_path(self):
+        return self.db_path + '.symbols'
+
+    def write_symbol_index(self):
+        ''' writes the stock codes and ALL_DISPLAY_FIELDS to the symbol
+        index read by nse.symbols, without the database
+        '''
+        codes = []
+        if self.has_table('STOCKS'):
+            codes = [code for code, in self.db.execute('SELECT CODE FROM STOCKS')]
+        # the config table of a new database only comes with bootstrap,
+        # which writes the index again
+        fields = []
+        if self.has_table('CONFIG'):
+            self.load_config()
+            fields = self.config.get('ALL_DISPLAY_FIELDS', [])
+        try:
+            write_index(self.symbol_index_path(), codes, fields)
+        except (IOError, OSError), err:
+            self.log.error('error while writing the symbol index')
+            self.log.error(str(err))
+
+    def search_stocks(self, text, limit=10):
+        ''' returns up to limit (code, name) tuples of the stocks matching
+        the text, ranked as exact code, prefix, token, substring and then
+        fuzzy (edit distance) matches
+        '''
+        with span('db.search_stocks'):
+            return self._search_stocks(text, limit)
+
+    def _search_stocks(self, text, limit):
+        query = ' '.join(text.upper().split())
+        if not query:
+            return []
+        c = self.db.cursor()
+        # codes starting with the query, straight from the CODE index
+        c.execute('SELECT ID, CODE, NAME FROM STOCKS WHERE CODE >= ? AND CODE < ?\
+                  LIMIT ?', (query, query + u'\uffff', limit))
+        candidates = dict((row[0], row) for row in c.fetchall())
+        # stocks sharing the most trigrams with the query
+        grams = list(query_grams(query))
+        c.execute('SELECT STOCKS.ID, CODE, NAME FROM STOCKS JOIN\
+                  (SELECT STOCK_ID, COUNT(*) AS HITS FROM STOCK_GRAMS\
+                   WHERE GRAM IN (%s) GROUP BY STOCK_ID\
+                   ORDER BY HITS DESC LIMIT ?) ON STOCKS.ID = STOCK_ID'
+                  % ','.join('?' * len(grams)), grams + [limit * 10])
+        for row in c.fetchall():
+            candidates[row[0]] = row
+
+        ranked = []
+        for idx, code, name in candidates.itervalues():
+            rank = match_rank(query, code.upper(), name.upper())
+            if rank is not None:
+                ranked.append((rank, len(name), code, name))
+        ranked.sort()
+        return [(code, name) for rank, size, code, name in ranked[:limit]]
+
+    def create_config_table(self):
+        ''' creates a table named 'config' to store application config '''
+
+        self.db.execute('DROP TABLE IF EXISTS CONFIG')
+        c = self.db.cursor()
+        try:
+            self.db.execute('CREATE TABLE CONFIG\
+                            (ID INTEGER PRIMARY KEY AUTOINCREMENT,\
+                            SETTING TEXT UNIQUE, VALUE TEXT)')
+        except Exception, e:
+            self.log.error('config table already exists !!')
+            print str(e)
+            sys.exit()
+        self.log.debug('config table created')
+
+        # create a row with default fields to show
+        c = self.db.cursor()
+        try:
+            c.execute("INSERT INTO CONFIG (SETTING, VALUE) VALUES(\
+                      'DISPLAY_FIELDS', \
+                      'lastPrice change pChange open dayHigh dayLow closePrice previousClose high52 low52')")
+            c.execute("INSERT INTO CONFIG (SETTING, VALUE) VALUES(\
+                      'DEFAULT_DISPLAY_FIELDS', \
+                      'lastPrice change pChange open dayHigh dayLow closePrice previousClose high52 low52')")
+        except Exception, err:
+            self.log.error('error while inserting DISPLAY_FIELDS or DEFAULT_DISPLAY_FIELDS setting')
+            self.log.error(str(err))
+            self.db.rollback()
+            sys.exit()
+        else:
+            self.db.commit()
+            self.log.debug('DISPLAY_FIELDS & DEFAULT_DISPLAY_FIELDS setting inserted successfully')
+
+        # create a row with all show fields
+        all_fields = 'adhocMargin applicableMargin averagePrice bcEndDate' + ' ' + \
+            'bcStartDate buyPrice1 buyPrice2 buyPrice3' + ' ' + \
+            'buyPrice4 buyPrice5 buyQuantity1 buyQuantity2' + ' ' + \
+            'buyQuantity3 buyQuantity4 buyQuantity5 change' + ' ' + \
+            'closePrice cm_adj_high cm_adj_high_dt cm_adj_low' + ' ' + \
+            'cm_adj_low_dt cm_ffm companyName dayHigh' + ' ' + \
+            'dayLow deliveryQuantity deliveryToTradedQuantity exDate' + ' ' + \
+            'extremeLossMargin faceValue high52 indexVar' + ' ' + \
+            'isinCode lastPrice low52 marketType ' + ' ' + \
+            'ndEndDate ndStartDate open pChange' + ' ' + \
+            'previousClose priceBand pricebandlower pricebandupper' + ' ' + \
+            'purpose quantityTraded recordDate secDate' + ' ' + \
+            'securityVar sellPrice1 sellPrice2 sellPrice3' + ' ' + \
+            'sellPrice4 sellPrice5 sellQuantity1 sellQuantity2' + ' ' + \
+            'sellQuantity3 sellQuantity4 sellQuantity5 series' + ' ' + \
+            'symbol totalBuyQuantity totalSellQuantity totalTradedValue' + ' ' + \
+            'totalTradedVolume varMargin'
+        c = self.db.cursor()
+        try:
+            c.execute("INSERT INTO CONFIG (SETTING, VALUE) VALUES(\
+                      'ALL_DISPLAY_FIELDS', ?)", (all_fields,))
+        except Exception, err:
+            self.log.error('error while inserting ALL_DISPLAY_FIELDS setting')
+            self.log.error(str(err))
+            self.db.rollback()
+            sys.exit()
+        else:
+            self.db.commit()
+            self.log.debug('ALL_DISPLAY_FIELDS setting inserted successfully')
+        self.config = None
+
+    def get_config_setting(self, setting, ret='as_list'):
+        ''' return setting as a list of strings'''
+        self.log.debug('getting config setting for %s', setting)
+        self.load_config()
+        try:
+            return list(self.config[setting])
+        except KeyError:
+            self.log.error('error while fetching setting %s', setting)
+            sys.exit()
+
+    def load_config(self):
+        ''' loads the whole config table into memory. it is loaded again
+        only when another connection changed the database, which sqlite
+        reports through PRAGMA data_version
+        '''
+        with span('db.data_version'):
+            version = self.db.execute('PRAGMA data_version').fetchone()
+        if self.config is not None and version == self.config_version:
+            return
+        self.log.debug('loading config table')
+        try:
+            rows = self.db.execute('SELECT SETTING, VALUE FROM CONFIG').fetchall()
+        except Exception, err:
+            self.log.error('error while loading config table')
+            self.log.error(str(err))
+            sys.exit()
+        self.config = dict((str(setting), [str(x) for x in value.split()])
+                           for setting, value in rows)
+        self.config_version = version
+
+    def update_config_setting(self, setting, value):
+        ''' updates a row with the new value in the config table '''
+        self.log.debug('updating field %s of config table', setting)
+        self.log.debug('value is :%s', value)
+
+        if type(value) is list:
+            value = " ".join(str(i) for i in value)
+        elif type(value) is str:
+            pass
+        else:
+            self.log.error('invalid type for %s, must be list or string',
+                           value)
+            sys.exit()
+        try:
+            with self.db:
+                updated = self.db.execute('UPDATE CONFIG SET VALUE = ? WHERE SETTING = ?',
+                                          (value, setting)).rowcount
+        except Exception, err:
+            self.log.error('error while updating %s', setting)
+            self.log.error(str(err))
+            sys.exit()
+        if not updated:
+            # the cache must not hold a setting the table doesn't
+            self.log.error('no setting %s in the config table', setting)
+            return
+        self.log.debug('%s setting updated successfully', setting)
+        # write through, our own commits don't change PRAGMA data_version
+        if self.config is not None:
+            self.config[setting] = value.split()
+        if setting == 'ALL_DISPLAY_FIELDS':
+            self.write_symbol_index()
+
+    def migrate(self):
+        ''' brings a database created by an older version up to date '''
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            self.make_config_unique()
+            self.db.execute('PRAGMA user_version = 1')
+        self.create_quotes_table()
+        self.create_alerts_table()
+        self.create_holdings_table()
+        self.ensure_config_setting('QUOTE_TTL', '5')
+        self.ensure_config_setting('SYMBOLS_ETAG', '')
+        self.ensure_config_setting('SYMBOLS_LAST_MODIFIED', '')
+        self.ensure_config_setting('SERVER_PORT', '8765')
+        self.ensure_config_setting('SNAPSHOT_TTL', '300')
+        # percent of the threshold an alert has to move back to re-arm
+        self.ensure_config_setting('ALERT_HYSTERESIS', '0.5')
+        # limits of the requests sent to nseindia.com, see nse.throttle
+        self.ensure_config_setting('RATE_LIMIT', '5')
+        self.ensure_config_setting('RATE_BURST', '10')
+        self.ensure_config_setting('MAX_RETRIES', '3')
+        self.ensure_config_setting('BACKOFF_BASE', '0.5')
+        self.ensure_config_setting('BACKOFF_MAX', '8')
+        self.ensure_config_setting('BREAKER_THRESHOLD', '5')
+        self.ensure_config_setting('BREAKER_COOLDOWN', '30')
+        if self.has_table('STOCKS') and not self.has_table('STOCK_GRAMS'):
+            self.build_search_index()
+        # indicator pseudo fields, see nse.indicators
+        all_fields = self.get_config_setting('ALL_DISPLAY_FIELDS')
+        missing = [f for f in INDICATOR_FIELDS if f not in all_fields]
+        if missing:
+            self.update_config_setting('ALL_DISPLAY_FIELDS', all_fields + missing)
+        else:
+            self.write_symbol_index()
+        self.db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self.db.commit()
+
+    def has_table(self, name):
+        ''' tells if the table exists in the database '''
+        c = self.db.execute('SELECT 1 FROM SQLITE_MASTER WHERE TYPE = ? AND NAME = ?',
+                            ('table', name))
+        return c.fetchone() is not None
+
+    def make_config_unique(self):
+        ''' rebuilds the config table of older databases with a UNIQUE
+        constraint on SETTING, keeping the latest row of every setting
+        '''
+        self.log.debug('adding unique constraint to config table')
+        try:
+            with self.db:
+                self.db.execute('CREATE TABLE CONFIG_NEW\
+                                (ID INTEGER PRIMARY KEY AUTOINCREMENT,\
+                                SETTING TEXT UNIQUE, VALUE TEXT)')
+                self.db.execute('INSERT INTO CONFIG_NEW (ID, SETTING, VALUE)\
+                                SELECT ID, SETTING, VALUE FROM CONFIG WHERE ID IN\
+                                (SELECT MAX(ID) FROM CONFIG GROUP BY SETTING)')
+                self.db.execute('DROP TABLE CONFIG')
+                self.db.execute('ALTER TABLE CONFIG_NEW RENAME TO CONFIG')
+        except Exception, err:
+            self.log.error('error while adding unique constraint to config table')
+            self.log.error(str(err))
+            sys.exit()
+        self.config = None
+
+    def ensure_config_setting(self, setting, value):
+        ''' inserts a config setting with the given value unless present '''
+        self.load_config()
+        if setting in self.config:
+            return
+        self.log.debug('adding missing setting %s', setting)
+        try:
+            with self.db:
+                self.db.execute('INSERT OR IGNORE INTO CONFIG (SETTING, VALUE)\
+                                VALUES(?, ?)', (setting, value))
+        except Exception, err:
+            self.log.error('error while adding setting %s', setting)
+            self.log.error(str(err))
+            sys.exit()
+        self.config[setting] = value.split()
+
+    def save_screen(self, name, expression):
+        ''' stores a screen expression as the SCREEN_<name> config setting '''
+        setting = SCREEN_PREFIX + name
+        try:
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO CONFIG (SETTING, VALUE)\
+                                VALUES(?, ?)', (setting, expression))
+        except Exception, err:
+            self.log.error('error while saving screen %s', name)
+            self.log.error(str(err))
+            sys.exit()
+        if self.config is not None:
+            self.config[setting] = expression.split()
+
+    def get_screens(self):
+        ''' returns the sorted list of saved (name, expression) screens '''
+        self.load_config()
+        return sorted((setting[len(SCREEN_PREFIX):], ' '.join(value))
+                      for setting, value in self.config.iteritems()
+                      if setting.startswith(SCREEN_PREFIX))
+
+    def remove_screen(self, name):
+        ''' deletes a saved screen, tells if it existed '''
+        with self.db:
+            c = self.db.execute('DELETE FROM CONFIG WHERE SETTING = ?',
+                                (SCREEN_PREFIX + name,))
+        if self.config is not None:
+            self.config.pop(SCREEN_PREFIX + name, None)
+        return c.rowcount > 0
+
+    def create_quotes_table(self):
+        ''' creates the QUOTES table used to cache fetched quotes '''
+        try:
+            self.db.execute('CREATE TABLE IF NOT EXISTS QUOTES\
+                            (CODE TEXT PRIMARY KEY, QUOTE TEXT, FETCHED REAL)')
+        except Exception, err:
+            self.log.error('error while creating quotes table')
+            self.log.error(str(err))
+            sys.exit()
+        self.db.commit()
+
+    def get_cached_quote(self, code):
+        ''' returns a (quote, fetched timestamp) tuple from the cache,
+        None when the code is not cached
+        '''
+        with span('db.get_cached_quote'):
+            c = self.db.cursor()
+            c.execute('SELECT QUOTE, FETCHED FROM QUOTES WHERE CODE = ?', (code,))
+            row = c.fetchone()
+            if row is None:
+                return None
+            return Quote(json.loads(row[0])), row[1]
+
+    def cache_quote(self, code, quote, fetched):
+        ''' stores a quote along with the time it was fetched '''
+        with span('db.cache_quote'):
+            try:
+                self.db.execute('INSERT OR REPLACE INTO QUOTES (CODE, QUOTE, FETCHED)\
+                                VALUES(?, ?, ?)', (code, json.dumps(quote), fetched))
+            except Exception, err:
+                self.log.error('error while caching quote for %s', code)
+                self.log.error(str(err))
+                self.db.rollback()
+            else:
+                self.db.commit()
+
+    def create_alerts_table(self):
+        ''' creates the ALERTS table of the alert rules, see nse.alerts, and
+        ALERT_STATE which remembers the alerts already fired
+        '''
+        try:
+            self.db.execute('CREATE TABLE IF NOT EXISTS ALERTS\
+                            (ID INTEGER PRIMARY KEY AUTOINCREMENT,\
+                            SYMBOL TEXT, RULE TEXT, SINK TEXT)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS ALERT_STATE\
+                            (RULE INTEGER, SYMBOL TEXT, ARMED INTEGER, SIDE INTEGER,\
+                            PRIMARY KEY (RULE, SYMBOL))')
+        except Exception, err:
+            self.log.error('error while creating alerts table')
+            self.log.error(str(err))
+            sys.exit()
+        self.db.commit()
+
+    def add_alert(self, symbol, rule, sink):
+        ''' stores an alert rule, returns its id '''
+        with self.db:
+            c = self.db.execute('INSERT INTO ALERTS (SYMBOL, RULE, SINK)\
+                                VALUES(?, ?, ?)', (symbol, rule, sink))
+        return c.lastrowid
+
+    def remove_alert(self, id):
+        ''' removes an alert rule, tells if it existed '''
+        with self.db:
+            c = self.db.execute('DELETE FROM ALERTS WHERE ID = ?', (id,))
+            self.db.execute('DELETE FROM ALERT_STATE WHERE RULE = ?', (id,))
+        return c.rowcount > 0
+
+    def get_alerts(self):
+        ''' returns the list of (id, symbol, rule, sink) alert rules '''
+        return self.db.execute('SELECT ID, SYMBOL, RULE, SINK FROM ALERTS\
+                               ORDER BY ID').fetchall()
+
+    def get_alert_states(self):
+        ''' returns a dict of (rule id, symbol) to (armed, side) '''
+        rows = self.db.execute('SELECT RULE, SYMBOL, ARMED, SIDE FROM ALERT_STATE')
+        return dict(((rule, symbol), (bool(armed), side))
+                    for rule, symbol, armed, side in rows)
+
+    def set_alert_states(self, states):
+        ''' saves a list of (rule id, symbol, armed, side) states '''
+        try:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO ALERT_STATE\
+                                    (RULE, SYMBOL, ARMED, SIDE) VALUES(?, ?, ?, ?)',
+                                    states)
+        except Exception, err:
+            self.log.error('error while saving alert states')
+            self.log.error(str(err))
+
+    def create_holdings_table(self):
+        ''' creates the HOLDINGS table of the portfolio '''
+        try:
+            self.db.execute('CREATE TABLE IF NOT EXISTS HOLDINGS\
+                            (SYMBOL TEXT PRIMARY KEY, QTY REAL, COST REAL)')
+        except Exception, err:
+            self.log.error('error while creating holdings table')
+            self.log.error(str(err))
+            sys.exit()
+        self.db.commit()
+
+    def set_holding(self, symbol, qty, cost):
+        ''' sets the quantity and average cost of a holding, a zero
+        quantity removes it
+        '''
+        with self.db:
+            if qty:
+                self.db.execute('INSERT OR REPLACE INTO HOLDINGS (SYMBOL, QTY, COST)\
+                                VALUES(?, ?, ?)', (symbol, qty, cost))
+            else:
+                self.db.execute('DELETE FROM HOLDINGS WHERE SYMBOL = ?', (symbol,))
+
+    def get_holdings(self):
+        ''' returns the list of (symbol, qty, cost) holdings '''
+        return self.db.execute('SELECT SYMBOL, QTY, COST FROM HOLDINGS\
+                               ORDER BY SYMBOL').fetchall()
+
+    def get_all_stock_list(self):
+        ''' returns a dict with all stock codes as
+        keys and names as values'''
+        cur = self.db.cursor()
+        try:
+            cur.execute('SELECT * FROM STOCKS')
+        except Exception, err:
+            self.log.error('error while fetch all stocks details')
+            sys.exit()
+        sdict = {}
+        for idx, code, name in cur.fetchall():
+            sdict[str(code)] = str(name)
+        return sdict
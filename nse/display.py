@@ -0,0 +1,561 @@
+''' displaying of quotes and display settings '''
+from collections import OrderedDict
+import csv
+import json
+import logging
+import sys
+import time
+
+from nse.book import LEVELS, OrderBook
+from nse.indicators import IndicatorSet, compute, is_indicator
+from nse.metrics import span
+from nse.portfolio import Portfolio
+from nse.quote import InvalidCodeError, Quote
+
+
+def number(fmt, value):
+    ''' formats a number, n/a for nan '''
+    return 'n/a' if value != value else fmt % value
+
+
+def utf8(value):
+    ''' returns a value as a utf-8 byte string for the csv module. byte
+    strings, the values parsed from the quote pages, are kept as they are
+    '''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+class NseDisplay(object):
+    ''' NseDisplay contains all the function related to displaying
+    and controlling display of results and quotes.
+    '''
+    def __init__(self, db, out=None, history=None):
+        self.log = logging.getLogger('NseDisplay')
+        self.db = db
+        self.out = out or sys.stdout
+        # HistoryStore the indicator pseudo fields are computed from
+        self.history = history
+        self.watch_indicators = {}
+        # state of the watch screen, see start_watch
+        self.watch_fields = []
+        self.watch_lines = {}
+        self.watch_values = {}
+        self.watch_height = 0
+        self.watch_books = {}
+        self.portfolio = None
+
+    def show_quote(self, quote):
+        ''' controls the display of a quote '''
+        display_fields = self.db.get_config_setting('DISPLAY_FIELDS')
+        quote = self.with_indicators(quote, display_fields)
+        with span('render'):
+            for key in display_fields:
+                print self.format_field(key, quote)
+
+    def with_indicators(self, quote, fields):
+        ''' returns the quote along with the indicator pseudo fields among
+        fields, computed over the recorded history of the stock
+        '''
+        pseudo = [f for f in fields if is_indicator(f)]
+        if not pseudo or self.history is None or 'symbol' not in quote:
+            return quote
+        with span('indicators'):
+            values = compute(pseudo, self.history.read(quote['symbol']))
+        return self._add_values(quote, values)
+
+    def _add_values(self, quote, values):
+        ''' returns a copy of the quote holding the formatted values '''
+        quote = Quote(quote)
+        for field, value in values.iteritems():
+            quote[field] = 'n/a' if value != value else '%.2f' % value
+        return quote
+
+    def watch_indicator_values(self, code, quote):
+        ''' updates the incremental indicators of a watched stock with the
+        new quote, the first call feeds them the recorded history
+        '''
+        tracker = self.watch_indicators.get(code)
+        if tracker is None:
+            tracker = IndicatorSet(self.watch_fields)
+            self.watch_indicators[code] = tracker
+            if self.history is not None:
+                return tracker.feed(self.history.read(code))
+        return tracker.update(time.time(), quote.num('lastPrice', float('nan')),
+                              quote.num('totalTradedVolume', float('nan')))
+
+    def format_field(self, key, quote):
+        ''' returns the display line of a field of the quote '''
+        if key not in quote:
+            return '%s is not present in the quote' % key
+        if key == 'pChange':
+            return '%s : %s %%' % (key, quote[key])
+        return '%s : %s' % (key, quote[key])
+
+    def start_watch(self, codes):
+        ''' draws the empty watch screen for the codes. DISPLAY_FIELDS is
+        read only once here, update_watch then redraws in place only the
+        lines whose values have changed
+        '''
+        self.watch_fields = self.db.get_config_setting('DISPLAY_FIELDS')
+        self.watch_indicators = {}
+        self.watch_lines = {}
+        self.watch_values = {}
+        lines = []
+        for code in codes:
+            self.watch_lines[(code, None)] = len(lines)
+            lines.append('[%s]' % code)
+            for key in self.watch_fields:
+                self.watch_lines[(code, key)] = len(lines)
+                lines.append('%s :' % key)
+        self.watch_height = len(lines)
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
+
+    def update_watch(self, results):
+        ''' redraws the lines of the watch screen which changed since the
+        last update, returns the number of lines redrawn
+        '''
+        changed = []
+        for code, quote, error in results:
+            if error is None:
+                header = '[%s]' % code
+            else:
+                header = '[%s] unable to fetch quote: %s' % (code, error)
+            changed.append(((code, None), header))
+            if quote is None:
+                continue
+            if any(is_indicator(key) for key in self.watch_fields):
+                quote = self._add_values(
+                    quote, self.watch_indicator_values(code, quote))
+            for key in self.watch_fields:
+                changed.append(((code, key), self.format_field(key, quote)))
+        return self._redraw(changed)
+
+    def _redraw(self, changed):
+        ''' rewrites the (slot, text) lines of the watch screen whose text
+        changed, returns the number of lines redrawn
+        '''
+        redrawn = 0
+        with span('render'):
+            for slot, text in changed:
+                if self.watch_values.get(slot) == text:
+                    continue
+                self.watch_values[slot] = text
+                up = self.watch_height - self.watch_lines[slot]
+                # move up to the line, rewrite it and come back down
+                self.out.write('\033[%dA\r\033[K%s\033[%dB\r' % (up, text, up))
+                redrawn += 1
+            self.out.flush()
+        return redrawn
+
+    def depth_slots(self):
+        ''' the rows of a depth ladder, asks above bids, best levels in
+        the middle
+        '''
+        return ([('ask', level) for level in range(LEVELS, 0, -1)] +
+                [('bid', level) for level in range(1, LEVELS + 1)])
+
+    def format_level(self, book, side, level):
+        ''' returns the ladder line of a level of the book '''
+        price, qty = book.bid(level) if side == 'bid' else book.ask(level)
+        if not price and not qty:
+            return '%s %d %12s %10s' % (side, level, '-', '-')
+        return '%s %d %12d %10.2f' % (side, level, qty, price)
+
+    def format_book_summary(self, book):
+        ''' returns the spread, mid and imbalance line of the book '''
+        return 'spread %.2f  mid %.2f  imbalance %+.2f  weighted %.2f' % (
+            book.spread(), book.mid(), book.imbalance(), book.weighted_price())
+
+    def show_depth(self, book):
+        ''' shows the order book of a stock as a price ladder '''
+        print '[%s] %s' % (book.symbol, self.format_book_summary(book))
+        print '%5s %12s %10s' % ('', 'quantity', 'price')
+        for side, level in self.depth_slots():
+            print self.format_level(book, side, level)
+        print 'total buy %d  total sell %d' % (book.total_buy, book.total_sell)
+
+    def show_depths(self, results):
+        ''' shows the order books of the results of NseDriver.get_quotes '''
+        for idx, (code, quote, error) in enumerate(results):
+            if idx > 0:
+                print
+            if error is None:
+                self.show_depth(OrderBook.from_quote(quote))
+            elif isinstance(error, InvalidCodeError):
+                self.show_invalid_code(code)
+            else:
+                print 'unable to fetch quote for %s: %s' % (code, error)
+
+    def start_depth_watch(self, codes):
+        ''' draws the empty depth ladders of the codes, update_depth_watch
+        then redraws only the levels which changed
+        '''
+        self.watch_books = {}
+        self.portfolio = None
+        self.watch_lines = {}
+        self.watch_values = {}
+        lines = []
+        for code in codes:
+            self.watch_lines[(code, None)] = len(lines)
+            lines.append('[%s]' % code)
+            for slot in self.depth_slots() + ['total']:
+                self.watch_lines[(code, slot)] = len(lines)
+                lines.append('')
+        self.watch_height = len(lines)
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
+
+    def update_depth_watch(self, results):
+        ''' redraws the levels of the books which changed since the last
+        update, returns the number of lines redrawn
+        '''
+        changed = []
+        for code, quote, error in results:
+            if error is not None:
+                changed.append(((code, None), '[%s] unable to fetch quote: %s'
+                                % (code, error)))
+                continue
+            book = OrderBook.from_quote(quote)
+            previous = self.watch_books.get(code)
+            self.watch_books[code] = book
+            levels = book.changed_levels(previous)
+            if previous is None or levels:
+                changed.append(((code, None), '[%s] %s' % (
+                    code, self.format_book_summary(book))))
+            for side, level in levels:
+                changed.append(((code, (side, level)),
+                                self.format_level(book, side, level)))
+            if (previous is None or book.total_buy != previous.total_buy or
+                    book.total_sell != previous.total_sell):
+                changed.append(((code, 'total'), 'total buy %d  total sell %d'
+                                % (book.total_buy, book.total_sell)))
+        return self._redraw(changed)
+
+    PORTFOLIO_HEADER = '%-12s %8s %10s %10s %13s %11s %12s %8s %7s' % (
+        'symbol', 'qty', 'avg cost', 'price', 'value', 'day change', 'P&L',
+        'P&L %', 'weight')
+
+    def format_position(self, portfolio, position):
+        ''' returns the line of a position of the portfolio '''
+        if position.price is None:
+            return '%-12s %8g %10.2f %10s' % (position.symbol, position.qty,
+                                              position.cost, '-')
+        return '%-12s %8g %10.2f %10.2f %13.2f %11.2f %12.2f %7.2f%% %6.2f%%' % (
+            position.symbol, position.qty, position.cost, position.price,
+            position.value(), position.day_change(), position.pnl(),
+            position.pnl() * 100 / (position.qty * position.cost)
+            if position.qty * position.cost else 0.0,
+            portfolio.weight(position))
+
+    def format_portfolio_total(self, portfolio):
+        ''' returns the totals line of the portfolio '''
+        return 'total value %.2f  day change %.2f (%.2f%%)  P&L %.2f (%.2f%%)' % (
+            portfolio.value, portfolio.day_change,
+            portfolio.day_change_percent(), portfolio.pnl(),
+            portfolio.pnl_percent())
+
+    def show_portfolio(self, portfolio, results):
+        ''' prices the portfolio with the results of NseDriver.get_quotes
+        and shows it
+        '''
+        for code, quote, error in results:
+            if error is None:
+                portfolio.update(code, quote)
+        print self.PORTFOLIO_HEADER
+        for position in portfolio.positions.itervalues():
+            print self.format_position(portfolio, position)
+        print self.format_portfolio_total(portfolio)
+        for code, quote, error in results:
+            if isinstance(error, InvalidCodeError):
+                print '%s is not a valid stock code' % code
+            elif error is not None:
+                print 'unable to fetch quote for %s: %s' % (code, error)
+
+    def start_portfolio_watch(self, codes):
+        ''' draws the empty portfolio of the holdings in the database,
+        update_portfolio_watch then prices the positions which changed
+        '''
+        self.portfolio = Portfolio(self.db.get_holdings())
+        self.watch_lines = {}
+        self.watch_values = {}
+        lines = [self.PORTFOLIO_HEADER]
+        for symbol in self.portfolio.symbols():
+            self.watch_lines[symbol] = len(lines)
+            lines.append(symbol)
+        self.watch_lines[None] = len(lines)
+        lines.append('')
+        self.watch_height = len(lines)
+        self.out.write('\n'.join(lines) + '\n')
+        self.out.flush()
+
+    def update_portfolio_watch(self, results):
+        ''' applies the quotes which changed to the portfolio totals,
+        returns the number of lines redrawn
+        '''
+        portfolio = self.portfolio
+        value = portfolio.value
+        changed = []
+        for code, quote, error in results:
+            if error is None and portfolio.update(code, quote):
+                changed.append(code)
+        if portfolio.value != value:
+            # the weights of all the positions moved
+            changed = [symbol for symbol, position in portfolio.positions.iteritems()
+                       if position.price is not None]
+        lines = [(symbol, self.format_position(portfolio, portfolio.positions[symbol]))
+                 for symbol in changed]
+        lines.append((None, self.format_portfolio_total(portfolio)))
+        return self._redraw(lines)
+
+    def show_quotes(self, results, corrected=None):
+        ''' displays the results of NseDriver.get_quotes in input order,
+        reporting failed symbols without aborting the rest. corrected maps
+        the codes fixed by cli.check_codes to the typed ones, noted with
+        their quote
+        '''
+        corrected = corrected or {}
+        for idx, (code, quote, error) in enumerate(results):
+            if len(results) > 1:
+                if idx > 0:
+                    print
+                print '[%s]' % code
+            if code in corrected:
+                print '"%s" is not a stock code, using %s' % (corrected[code], code)
+            if error is None:
+                self.show_quote(quote)
+            elif isinstance(error, InvalidCodeError):
+                self.show_invalid_code(code)
+            else:
+                print 'unable to fetch quote for %s: %s' % (code, error)
+
+    def write_batch(self, results, fmt='ndjson'):
+        ''' writes results of NseDriver.iter_quotes as they come, as json
+        lines or csv rows holding the DISPLAY_FIELDS of every quote. errors
+        are reported inline in an error field
+        '''
+        fields = self.db.get_config_setting('DISPLAY_FIELDS')
+        if fmt == 'csv':
+            writer = csv.writer(self.out)
+            writer.writerow(['symbol'] + fields + ['error'])
+        for code, quote, error in results:
+            row = OrderedDict(symbol=code)
+            if error is not None:
+                row['error'] = ('invalid stock code'
+                                if isinstance(error, InvalidCodeError) else str(error))
+            else:
+                quote = self.with_indicators(quote, fields)
+                row.update((key, quote[key]) for key in fields if key in quote)
+            with span('render'):
+                if fmt == 'csv':
+                    writer.writerow([utf8(code)] + [utf8(row.get(key, ''))
+                                                    for key in fields + ['error']])
+                else:
+                    self.out.write(json.dumps(row) + '\n')
+                self.out.flush()
+
+    def show_invalid_code(self, code):
+        ''' tells the user about an invalid code and lists probable matches '''
+        print '"%s" is invalid stock code' % code
+        print 'If you are not sure about the stock code, try typing few characters of company name'
+        print 'probable list based on current match:'
+        self.show_matches(code)
+
+    def show_matches(self, text, limit=10):
+        ''' lists the stocks best matching the text, best match first '''
+        for code, name in self.db.search_stocks(text, limit):
+            print code, '\t\t', name
+
+    def show_history(self, code, history, columns=None, daily=False):
+        ''' shows the recorded quotes of a stock, history being the dict
+        of columns returned by HistoryStore.read. daily histories are
+        shown by date
+        '''
+        from nse.history import COLUMNS
+        times = history['TIME']
+        if not len(times):
+            print 'no history recorded for %s' % code
+            return
+        columns = [(c, max(len(c), 10)) for c in (columns or COLUMNS)[1:]]
+        print '%-19s %s' % ('date' if daily else 'time',
+                            ' '.join('%*s' % (w, c) for c, w in columns))
+        for idx in xrange(len(times)):
+            if daily:
+                stamp = time.strftime('%Y-%m-%d', time.gmtime(times[idx]))
+            else:
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(times[idx]))
+            print '%-19s %s' % (stamp, ' '.join('%*.2f' % (w, history[c][idx])
+                                                for c, w in columns))
+
+    def show_backtest(self, result, limit=10):
+        ''' shows the summary and the last trades of a backtest Result '''
+        dates = result.panel.dates
+        summary = result.summary()
+        trades = result.trades()
+        won = sum(1 for trade in trades if trade[5] > 0)
+
+        def day(stamp):
+            return time.strftime('%Y-%m-%d', time.gmtime(stamp))
+        print 'period    : %s to %s, %d days' % (day(dates[0]), day(dates[-1]), len(dates))
+        print 'symbols   : %d' % len(result.panel.symbols)
+        print 'return    : %+.2f %%' % (summary['return'] * 100)
+        print 'cagr      : %+.2f %%' % (summary['cagr'] * 100)
+        print 'sharpe    : %.2f' % summary['sharpe']
+        print 'drawdown  : %.2f %%' % (summary['drawdown'] * 100)
+        print 'turnover  : %.2f x a year' % summary['turnover']
+        print 'trades    : %d, %.1f %% won' % (len(trades),
+                                              won * 100.0 / len(trades) if trades else 0)
+        if not trades or not limit:
+            return
+        print
+        print '%-12s %10s %10s %10s %10s %8s' % ('symbol', 'entry', 'exit', 'bought',
+                                                'sold', 'return')
+        for symbol, entry, exit, bought, sold, ret, open_ in sorted(
+                trades, key=lambda trade: trade[2])[-limit:]:
+            print '%-12s %10s %10s %10.2f %10.2f %+7.2f%%%s' % (
+                symbol, day(entry), day(exit), bought, sold, ret * 100,
+                ' open' if open_ else '')
+
+    def show_sweep(self, results, limit=10):
+        ''' shows the best limit (params, summary) of a backtest sweep by
+        sharpe ratio
+        '''
+        results = sorted(results, key=lambda result: -result[1]['sharpe'])
+        print '%-30s %9s %8s %7s %9s %9s %7s' % ('params', 'return', 'cagr', 'sharpe',
+                                                 'drawdown', 'turnover', 'trades')
+        for params, summary in results[:limit]:
+            print '%-30s %8.2f%% %7.2f%% %7.2f %8.2f%% %9.2f %7d' % (
+                ' '.join('%s=%s' % item for item in sorted(params.items())),
+                summary['return'] * 100, summary['cagr'] * 100, summary['sharpe'],
+                summary['drawdown'] * 100, summary['turnover'], summary['trades'])
+
+    def show_screen(self, snapshot, ranked, fields):
+        ''' shows the fields of the rows of a market Snapshot at the ranked
+        indexes
+        '''
+        if not ranked:
+            print 'no stock matches'
+            return
+        columns = [(f, max(len(f), 10)) for f in fields]
+        print '%-12s %s' % ('symbol', ' '.join('%*s' % (w, f) for f, w in columns))
+        for idx in ranked:
+            print '%-12s %s' % (snapshot.symbols[idx], ' '.join(
+                '%*.2f' % (w, snapshot.columns[f][idx]) for f, w in columns))
+
+    def show_screens(self, screens):
+        ''' shows the saved (name, expression) screens '''
+        if not screens:
+            print 'no saved screens, save one with -screen EXPR -save_screen NAME'
+            return
+        for name, expression in screens:
+            print '%s : %s' % (name, expression)
+
+    def show_ranking(self, snapshot, ranked):
+        ''' shows the rows of a market Snapshot at the ranked indexes, the
+        values missing from the bhavcopy as n/a
+        '''
+        print '%-12s %10s %9s %8s %15s' % ('symbol', 'lastPrice', 'change',
+                                           'pChange', 'totalTradedVolume')
+        for idx in ranked:
+            row = snapshot.row(idx)
+            print '%-12s %10s %9s %8s %15s' % (
+                row['symbol'], number('%.2f', row['lastPrice']),
+                number('%.2f', row['change']), number('%.2f%%', row['pChange']),
+                number('%d', row['totalTradedVolume']))
+
+    def show_advance_declines(self, snapshot):
+        ''' shows the breadth of the market '''
+        advances, declines, unchanged = snapshot.advance_declines()
+        print 'advances  :', advances
+        print 'declines  :', declines
+        print 'unchanged :', unchanged
+        if declines:
+            print 'ratio     : %.2f' % (float(advances) / declines)
+
+    def show_indices(self, indices):
+        ''' shows the closing values of the indices '''
+        print '%-32s %12s %10s %8s' % ('index', 'close', 'change', 'pChange')
+        for row in indices:
+            print '%-32s %12s %10s %7s%%' % (
+                row.get('Index Name', '')[:32], row.get('Closing Index Value', ''),
+                row.get('Points Change', ''), row.get('Change(%)', ''))
+
+    def show_alerts(self, alerts):
+        ''' lists the (id, symbol, rule, sink) alert rules '''
+        if not alerts:
+            print 'no alerts, add one with -add_alert'
+        for id, symbol, rule, sink in alerts:
+            print '%4d  %-40s %s' % (id, rule, sink)
+
+    def show_current_display_fields(self):
+        ''' shows current display fields '''
+        display_fields = self.db.get_config_setting('DISPLAY_FIELDS')
+        print 'Current display fields:'
+        for field in display_fields:
+            print field
+
+    def show_all_display_fields(self):
+        ''' shows all display fields '''
+        all_display_fields = self.db.get_config_setting('ALL_DISPLAY_FIELDS')
+        print 'All display fields:'
+        for field in all_display_fields:
+            print field
+
+    def add_display_fields(self, fields):
+        ''' adds all the display fields '''
+        self.log.debug('adding fileds %s', fields)
+        all_display_fields = self.db.get_config_setting('ALL_DISPLAY_FIELDS')
+        current_display_fields = self.db.get_config_setting('DISPLAY_FIELDS')
+        FLAG_1 = False
+        FLAG_2 = False
+        exists = []
+        invalid = []
+
+        for field in fields:
+            if field in current_display_fields:
+                exists.append(field)
+                FLAG_1 = True
+            if field not in all_display_fields and not is_indicator(field):
+                invalid.append(field)
+                FLAG_2 = True
+        if FLAG_1 is True:
+            print 'field %s already exists' % exists
+        if FLAG_2 is True:
+            print 'field %s is invalid' % invalid
+        if FLAG_1 is True or FLAG_2 is True:
+            print 'please provide valid inputs'
+            sys.exit()
+
+        # update the data base with current field
+        current_display_fields += fields
+        self.db.update_config_setting('DISPLAY_FIELDS',current_display_fields)
+
+    def remove_display_fields(self, fields):
+        ''' removed the given list of display fields '''
+        self.log.debug('removing fileds %s', fields)
+        current_display_fields = self.db.get_config_setting('DISPLAY_FIELDS')
+        FLAG = False
+        invalid = []
+
+        for field in fields:
+            if field not in current_display_fields:
+                invalid.append(field)
+                FLAG = True
+            else:
+                current_display_fields.remove(field)
+        if FLAG is True:
+            print "field %s doesn't in current display fields" % invalid
+            print 'please provide valid inputs'
+            sys.exit()
+
+        # update the data base with current field
+        self.db.update_config_setting('DISPLAY_FIELDS', current_display_fields)
+
+    def reset_display_fields(self):
+        ''' resets all the display fields to the default one '''
+        self.log.debug('reseting DISPLAY_FIELDS setting')
+        default_display_fields = self.db.get_config_setting(\
+                                        'DEFAULT_DISPLAY_FIELDS')
+        self.db.update_config_setting('DISPLAY_FIELDS', default_display_fields)
@@ -0,0 +1,401 @@
+''' fetching of quotes and the stock list from nseindia.com '''
+from collections import deque
+import logging
+import sys
+import threading
+import time
+
+from nse.metrics import count, span
+from nse.quote import QuoteError, InvalidCodeError, parse_quote
+from nse.throttle import TokenBucket, Backoff, CircuitBreaker
+
+
+class NseDriver(object):
+    ''' it accepts a Stock object and fetches it price
+    assosiated information'''
+
+    def __init__(self, db, workers=8, transport=None):
+        self.log = logging.getLogger('NseDriver')
+        self.db = db
+        self.baseurl = 'http://nseindia.com/live_market/dynaContent/live_watch/get_quote/GetQuote.jsp?'
+        self.pool = None
+        self._opener = None
+        # get_quotes threads may all want the opener on first use
+        self.opener_lock = threading.Lock()
+        self.headers = self.build_headers()
+        self.code_csv_url = 'http://www.nseindia.com/content/equities/EQUITY_L.csv'
+        # max number of quotes fetched in parallel by get_quotes
+        self.workers = workers
+        self.refresh_thread = None
+        self.refreshed = []
+        self.listeners = []
+        # callable wrapping the KeepAliveHandler into the urllib2 handler
+        # actually used, e.g. to record or replay responses
+        self.transport = transport
+        self.configure()
+
+    def configure(self):
+        ''' sets up the rate limiter, retries and circuit breaker shared by
+        all the requests from the RATE_LIMIT, RATE_BURST, MAX_RETRIES,
+        BACKOFF_BASE, BACKOFF_MAX, BREAKER_THRESHOLD and BREAKER_COOLDOWN
+        settings
+        '''
+        setting = lambda name: float(self.db.get_config_setting(name)[0])
+        self.limiter = TokenBucket(setting('RATE_LIMIT'), setting('RATE_BURST'))
+        self.backoff = Backoff(int(setting('MAX_RETRIES')),
+                               setting('BACKOFF_BASE'), setting('BACKOFF_MAX'))
+        self.breaker = CircuitBreaker(int(setting('BREAKER_THRESHOLD')),
+                                      setting('BREAKER_COOLDOWN'))
+        self.sleep = time.sleep
+
+    def open(self, request):
+        ''' opens a request through the rate limiter, retrying 429s, 5xxs,
+        timeouts and connection errors with jittered exponential backoff.
+        raises CircuitOpenError while the server is considered down
+        '''
+        from urllib2 import HTTPError, URLError
+        attempt = 0
+        while True:
+            self.breaker.before()
+            self.limiter.acquire()
+            try:
+                res = self.opener.open(request)
+            except HTTPError as error:
+                if error.code != 429 and error.code < 500:
+                    # the server is up, the request itself is at fault
+                    self.breaker.success()
+                    raise
+                failure = error
+            except URLError as error:
+                failure = error
+            else:
+                self.breaker.success()
+                return res
+            self.breaker.failure()
+            if attempt >= self.backoff.retries:
+                raise failure
+            delay = self.backoff.delay(attempt)
+            retry_after = getattr(failure, 'headers', None) and \
+                failure.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = min(max(delay, float(retry_after)), self.backoff.cap)
+            self.log.debug('%s, retrying %s in %.2fs',
+                           failure, request.get_full_url(), delay)
+            count('http.retries')
+            self.sleep(delay)
+            attempt += 1
+
+    def get_quote(self, code):
+        ''' gets the stock details by querying the market'''
+        try:
+            return self.fetch_quote(code)
+        except InvalidCodeError:
+            print '"%s" is invalid stock code' % code
+            print 'If you are not sure about the stock code, try typing few characters of company name'
+            print 'probable list based on current match:'
+            self.print_probable_matches(code)
+            sys.exit()
+        except QuoteError, err:
+            self.log.error(str(err))
+            sys.exit()
+
+    def get_quotes(self, codes, workers=None, max_age=0, stale=False):
+        ''' fetches quotes for several codes concurrently through a bounded
+        thread pool. returns a list of (code, quote, error) tuples in the
+        same order as codes, error being None when the fetch succeeded.
+
+        quotes cached in the db within max_age seconds are served without
+        a network call. with stale=True expired cache entries are served as
+        well and refreshed in the background, call wait_for_refresh() to
+        store the refreshed quotes before exiting.
+        '''
+        results = [None] * len(codes)
+        fetch = []
+        refresh = []
+        now = time.time()
+        for idx, code in enumerate(codes):
+            cached = None
+            if max_age > 0 or stale:
+                cached = self.db.get_cached_quote(code)
+            if cached is None:
+                fetch.append(idx)
+                continue
+            quote, fetched = cached
+            if now - fetched <= max_age:
+                self.log.debug('serving %s from cache', code)
+                count('quotes.cached')
+                results[idx] = (code, quote, None)
+            elif stale:
+                self.log.debug('serving stale %s, refreshing', code)
+                results[idx] = (code, quote, None)
+                refresh.append(code)
+            else:
+                fetch.append(idx)
+
+        fetched = self._fetch_results([codes[idx] for idx in fetch], workers)
+        for idx, result in zip(fetch, fetched):
+            results[idx] = result
+        self._cache_results(fetched)
+
+        if refresh:
+            self.refresh_thread = threading.Thread(
+                target=self._refresh, args=(refresh, workers))
+            self.refresh_thread.start()
+        return results
+
+    def iter_quotes(self, codes, max_age=0, window=None):
+        ''' generator version of get_quotes for long or endless iterables
+        of codes. at most window codes are in flight at a time and results
+        are yielded in input order as soon as they are ready, so memory use
+        doesn't depend on the number of codes
+        '''
+        from multiprocessing.pool import ThreadPool
+        window = window or self.workers * 2
+        pool = ThreadPool(self.workers)
+        pending = deque()
+        try:
+            for code in codes:
+                pending.append(self._submit(pool, code, max_age))
+                while pending and (len(pending) >= window or pending[0].ready()):
+                    yield self._collect(pending.popleft())
+            while pending:
+                yield self._collect(pending.popleft())
+        finally:
+            pool.terminate()
+
+    def _submit(self, pool, code, max_age):
+        ''' starts fetching a code for iter_quotes unless it is cached '''
+        if max_age > 0:
+            cached = self.db.get_cached_quote(code)
+            if cached is not None and time.time() - cached[1] <= max_age:
+                return _Cached((code, cached[0], None))
+        return pool.apply_async(self._fetch_result, (code,))
+
+    def _collect(self, pending):
+        ''' waits for a result submitted by _submit '''
+        result = pending.get()
+        if not isinstance(pending, _Cached):
+            self._cache_results([result])
+        return result
+
+    def wait_for_refresh(self):
+        ''' waits for the background refresh started by get_quotes and
+        stores the refreshed quotes in the cache
+        '''
+        if self.refresh_thread is None:
+            return
+        self.refresh_thread.join()
+        self.refresh_thread = None
+        self._cache_results(self.refreshed)
+        self.refreshed = []
+
+    def _refresh(self, codes, workers):
+        ''' runs in the background thread, the db is written afterwards
+        from the main thread by wait_for_refresh
+        '''
+        self.refreshed = self._fetch_results(codes, workers)
+
+    def _cache_results(self, results):
+        ''' stores the successfully fetched quotes in the cache and hands
+        them to the listeners
+        '''
+        now = time.time()
+        for code, quote, error in results:
+            if error is None:
+                self.db.cache_quote(code, quote, now)
+                for listener in self.listeners:
+                    listener(code, quote, now)
+
+    def add_listener(self, listener):
+        ''' registers listener(code, quote, fetched) to be called from the
+        main thread for every quote fetched from the market, quotes served
+        from the cache are not passed on
+        '''
+        self.listeners.append(listener)
+
+    def _fetch_results(self, codes, workers=None):
+        ''' fetches the codes from the market through the thread pool '''
+        if not codes:
+            return []
+        if workers is None:
+            workers = self.workers
+        workers = max(1, min(workers, len(codes)))
+        if workers == 1:
+            return [self._fetch_result(code) for code in codes]
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        try:
+            return pool.map(self._fetch_result, codes)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _fetch_result(self, code):
+        ''' wraps fetch_quote so that failures are returned, not raised '''
+        try:
+            return (code, self.fetch_quote(code), None)
+        except QuoteError, err:
+            return (code, None, err)
+
+    def fetch_quote(self, code):
+        ''' fetches the quote for a code, raises QuoteError on failure.
+        safe to call from several threads at once
+        '''
+        with span('quote'):
+            return self._fetch_quote(code)
+
+    def _fetch_quote(self, code):
+        from urllib2 import HTTPError, URLError, Request
+        url = self.build_url(code)
+        request = Request(url, None, self.headers)
+        try:
+            res = self.open(request)
+        except HTTPError as error:
+            self.log.error('unable to open the link %s', url)
+            count('quotes.errors')
+            raise QuoteError(str(error))
+        except URLError as error:
+            self.log.error('no internet connection')
+            count('quotes.errors')
+            raise QuoteError(str(error))
+        try:
+            with span('parse'):
+                quote = parse_quote(res.read())
+        except Exception, err:
+            # control can come here when the stock code is invalid
+            self.log.debug('unable to parse quote for %s: %s', code, err)
+            count('quotes.invalid')
+            raise InvalidCodeError(code)
+        else:
+            count('quotes.fetched')
+            return quote
+
+    def build_headers(self):
+        ''' builds the headers for making http request '''
+        headers = {'Accept' : '*/*',
+            'Accept-Language': 'en-US,en;q=0.5',
+            'Host':    'nseindia.com',
+            'Referer': 'http://nseindia.com/live_market/dynaContent/live_watch/get_quote/GetQuote.jsp?symbol=INFY&illiquid=0',
+            'User-Agent' : 'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:28.0) Gecko/20100101 Firefox/28.0',
+            'X-Requested-With':    'XMLHttpRequest'
+            }
+        return headers
+
+    def download_stock_csv(self):
+        ''' downloads the csv file '''
+        return self.download_stock_csv_if_modified()[0]
+
+    def download_stock_csv_if_modified(self, etag=None, last_modified=None):
+        ''' downloads the csv file unless it matches the given ETag or
+        Last-Modified values. returns a (data, etag, last_modified) tuple,
+        data being None when the file did not change. raises QuoteError
+        when the file can't be downloaded, after the retries of open
+        '''
+        from urllib2 import HTTPError, URLError, Request
+        headers = dict(self.headers)
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            request = Request(self.code_csv_url, None, headers)
+            res = self.open(request)
+        except HTTPError as error:
+            if error.code == 304:
+                self.log.debug('%s not modified', self.code_csv_url)
+                return None, etag, last_modified
+            raise QuoteError('unable to open the link %s: %s' % (self.code_csv_url, error))
+        except URLError as error:
+            raise QuoteError('no internet connection: %s' % error)
+        info = res.info()
+        return res.read(), info.getheader('ETag'), info.getheader('Last-Modified')
+
+    def download_file(self, url):
+        ''' downloads a bulk file like the bhavcopy, returns None when the
+        server does not have it
+        '''
+        from urllib2 import HTTPError, URLError, Request
+        try:
+            return self.open(Request(url, None, self.headers)).read()
+        except HTTPError as error:
+            if error.code == 404:
+                self.log.debug('%s not found', url)
+                return None
+            raise QuoteError(str(error))
+        except URLError as error:
+            raise QuoteError(str(error))
+
+    def refresh_symbols(self):
+        ''' brings the stocks table up to date with the latest csv file,
+        returns the (inserted, deleted, renamed) counts or None when the
+        file did not change since the last refresh
+        '''
+        etag = ' '.join(self.db.get_config_setting('SYMBOLS_ETAG'))
+        last_modified = ' '.join(self.db.get_config_setting('SYMBOLS_LAST_MODIFIED'))
+        data, etag, last_modified = self.download_stock_csv_if_modified(
+            etag, last_modified)
+        if data is None:
+            return None
+        counts = self.db.refresh_stocks_table(data)
+        self.db.update_config_setting('SYMBOLS_ETAG', etag or '')
+        self.db.update_config_setting('SYMBOLS_LAST_MODIFIED', last_modified or '')
+        return counts
+
+    @property
+    def opener(self):
+        ''' the opener is built on first use, importing urllib2 and
+        cookielib takes longer than the rest of a cached run. it is built
+        once under a lock so that concurrent fetches share its connection
+        pool and cookies
+        '''
+        if self._opener is None:
+            with self.opener_lock:
+                if self._opener is None:
+                    self._opener = self.build_opener()
+        return self._opener
+
+    def build_opener(self):
+        ''' builds the opener required for the making http req '''
+        from cookielib import CookieJar
+        import urllib2
+        from nse.transport import ConnectionPool, KeepAliveHandler
+        self.pool = ConnectionPool(maxsize=self.workers)
+        self.cookies = CookieJar()
+        handler = KeepAliveHandler(self.pool)
+        if self.transport is not None:
+            handler = self.transport(handler)
+        opener = urllib2.build_opener(handler,
+                                      urllib2.HTTPCookieProcessor(self.cookies))
+        return opener
+
+    def connection_stats(self):
+        ''' returns the new vs. reused connection counters of the pool '''
+        if self.pool is None:
+            return {'new': 0, 'reused': 0, 'idle': 0}
+        return self.pool.stats()
+
+    def build_url(self, code):
+        ''' makes the right url string for fetching a quote '''
+        import urllib
+        encoded_args = urllib.urlencode({'symbol':code, 'illiquid': '0'})
+        url = self.baseurl + encoded_args
+        return url
+
+    def print_probable_matches(self, code):
+        ''' list all the probable matches of stocks and
+        there respective codes
+        '''
+        for key, value in self.db.search_stocks(code):
+            print key,'\t\t', value
+
+
+class _Cached(object):
+    ''' a cache hit looking like the AsyncResult of a fetch '''
+    def __init__(self, result):
+        self.result = result
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.result
@@ -0,0 +1,251 @@
+''' local store of the quote history.
+
+Every symbol gets a directory holding one append-only file per column, each
+file being a plain array of native doubles. Reads memory map the files and
+only copy the requested time range, numpy arrays are returned without any
+copy when numpy is installed.
+'''
+from array import array
+import errno
+import logging
+import mmap
+import os
+import struct
+
+from nse.lock import FileLock
+
+# fields of the quote recorded for every fetch, TIME is the fetch time
+COLUMNS = ('TIME', 'lastPrice', 'open', 'dayHigh', 'dayLow', 'closePrice',
+           'previousClose', 'averagePrice', 'totalTradedVolume',
+           'totalTradedValue')
+ITEMSIZE = array('d').itemsize
+# written once every column of a merge is in its .tmp file, see recover
+JOURNAL = '.merge'
+
+
+class HistoryStore(object):
+    ''' columnar, append-only history of the fetched quotes '''
+
+    def __init__(self, root, columns=COLUMNS):
+        self.log = logging.getLogger('HistoryStore')
+        self.root = root
+        self.columns = columns
+
+    def path(self, code, column=None):
+        ''' returns the directory of a symbol or the file of a column '''
+        directory = os.path.join(self.root, code.upper())
+        if column is None:
+            return directory
+        return os.path.join(directory, column + '.f8')
+
+    def symbols(self):
+        ''' returns the symbols having a history '''
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(os.listdir(self.root))
+
+    def append(self, code, quote, fetched):
+        ''' appends a quote fetched at the given time, has the signature of
+        NseDriver listeners
+        '''
+        row = [fetched] + [quote.num(column, float('nan'))
+                           for column in self.columns[1:]]
+        self.append_rows(code, [row])
+
+    def append_rows(self, code, rows):
+        ''' appends rows of values ordered like self.columns. rows older than
+        the last stored time are dropped, which keeps every column sorted by
+        time and makes re-appending the same rows harmless
+        '''
+        self.makedirs(code)
+        with self.lock(code):
+            self.recover(code)
+            last = self.last_time(code)
+            if last is not None:
+                rows = [row for row in rows if row[0] > last]
+            if not rows:
+                return 0
+            for idx, column in enumerate(self.columns):
+                with open(self.path(code, column), 'ab') as f:
+                    array('d', [row[idx] for row in rows]).tofile(f)
+        self.log.debug('appended %d rows to %s', len(rows), code)
+        return len(rows)
+
+    def merge(self, code, columns):
+        ''' merges rows given as a dict of column name to array('d') in any
+        time order. rows after the stored ones are appended, the others
+        replace the stored row of the same TIME or are inserted in place,
+        which rewrites the files. returns the number of rows added or
+        changed, so merging rows already stored returns 0
+        '''
+        times = columns['TIME']
+        # the last of several rows with the same time wins
+        latest = dict((times[idx], idx) for idx in xrange(len(times)))
+        order = [latest[t] for t in sorted(latest)]
+        if not order:
+            return 0
+        self.makedirs(code)
+        with self.lock(code):
+            self.recover(code)
+            n = self.length(code)
+            last = self.last_time(code, n)
+            if last is None or times[order[0]] > last:
+                for column in self.columns:
+                    values = columns[column]
+                    with open(self.path(code, column), 'ab') as f:
+                        array('d', [values[idx] for idx in order]).tofile(f)
+                return len(order)
+            stored = [self.load(code, column, n) for column in self.columns]
+            rows = dict((stored[0][idx], [values[idx] for values in stored])
+                        for idx in xrange(n))
+            changed = 0
+            for idx in order:
+                row = [columns[column][idx] for column in self.columns]
+                old = rows.get(row[0])
+                # compared as bytes so that nan equals nan
+                if old is None or array('d', old).tostring() != array('d', row).tostring():
+                    rows[row[0]] = row
+                    changed += 1
+            if not changed:
+                return 0
+            merged = [rows[t] for t in sorted(rows)]
+            for idx, column in enumerate(self.columns):
+                with open(self.path(code, column) + '.tmp', 'wb') as f:
+                    array('d', [row[idx] for row in merged]).tofile(f)
+            # from here on the merge is finished by recover, also after a
+            # crash between the renames
+            open(os.path.join(self.path(code), JOURNAL), 'w').close()
+            self.recover(code)
+        self.log.debug('merged %d rows into %s', changed, code)
+        return changed
+
+    def load(self, code, column, n):
+        ''' returns the first n values of a column as an array('d') '''
+        values = array('d')
+        with open(self.path(code, column), 'rb') as f:
+            values.fromfile(f, n)
+        return values
+
+    def makedirs(self, code):
+        if os.path.isdir(self.path(code)):
+            return
+        try:
+            os.makedirs(self.path(code))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+
+    def lock(self, code):
+        ''' returns a context manager locking the symbol against appends
+        from other processes
+        '''
+        return FileLock(os.path.join(self.path(code), '.lock'))
+
+    def recover(self, code):
+        ''' brings the files of a symbol back to whole rows after a process
+        died writing them, called under the lock. a merge which wrote its
+        journal is finished, the .tmp files of one which did not are
+        removed, and the columns of an interrupted append are cut to the
+        rows all of them hold
+        '''
+        journal = os.path.join(self.path(code), JOURNAL)
+        committed = os.path.exists(journal)
+        for column in self.columns:
+            tmp = self.path(code, column) + '.tmp'
+            if not os.path.exists(tmp):
+                continue
+            if committed:
+                os.rename(tmp, self.path(code, column))
+            else:
+                self.log.warning('discarding the unfinished merge of %s', code)
+                os.remove(tmp)
+        if committed:
+            os.remove(journal)
+        size = self.length(code) * ITEMSIZE
+        for column in self.columns:
+            path = self.path(code, column)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                self.log.warning('cutting %s of %s to whole rows', column, code)
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def length(self, code):
+        ''' returns the number of complete rows stored for a symbol '''
+        sizes = []
+        for column in self.columns:
+            try:
+                sizes.append(os.path.getsize(self.path(code, column)))
+            except OSError:
+                return 0
+        # an append interrupted half way leaves some columns longer until
+        # recover
+        return min(sizes) // ITEMSIZE
+
+    def last_time(self, code, n=None):
+        ''' returns the time of the last row of a symbol, None if empty.
+        n is the length when the caller knows it already
+        '''
+        if n is None:
+            n = self.length(code)
+        if n == 0:
+            return None
+        with open(self.path(code, 'TIME'), 'rb') as f:
+            f.seek((n - 1) * ITEMSIZE)
+            return struct.unpack('d', f.read(ITEMSIZE))[0]
+
+    def read(self, code, start=None, end=None, columns=None):
+        ''' returns a dict of column name to array holding the rows with
+        start <= TIME < end. values are numpy arrays backed by the memory
+        mapped files when numpy is installed, array('d') otherwise. the
+        files are opened under the lock, so that the columns all come from
+        the same merge
+        '''
+        columns = columns or self.columns
+        if not os.path.isdir(self.path(code)):
+            return dict((column, array('d')) for column in columns)
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        with self.lock(code):
+            self.recover(code)
+            n = self.length(code)
+            if n == 0:
+                return dict((column, array('d')) for column in columns)
+            lo, hi = self.bounds(code, n, start, end)
+            result = {}
+            for column in columns:
+                if numpy is not None:
+                    data = numpy.memmap(self.path(code, column), dtype='d',
+                                        mode='r', shape=(n,))
+                    result[column] = data[lo:hi]
+                    continue
+                with open(self.path(code, column), 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        result[column] = array('d', mm[lo * ITEMSIZE:hi * ITEMSIZE])
+                    finally:
+                        mm.close()
+        return result
+
+    def bounds(self, code, n, start=None, end=None):
+        ''' binary searches the memory mapped TIME column for the row range
+        of [start, end)
+        '''
+        with open(self.path(code, 'TIME'), 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                def search(value):
+                    lo, hi = 0, n
+                    while lo < hi:
+                        mid = (lo + hi) // 2
+                        if struct.unpack_from('d', mm, mid * ITEMSIZE)[0] < value:
+                            lo = mid + 1
+                        else:
+                            hi = mid
+                    return lo
+                lo = 0 if start is None else search(start)
+                hi = n if end is None else search(end)
+            finally:
+                mm.close()
+        return lo, max(lo, hi)
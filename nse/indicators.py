@@ -0,0 +1,452 @@
+''' technical indicators over the quote history.
+
+Every indicator has an incremental tracker whose update() is O(1) per tick
+(amortized for the rolling extremes), used by -watch. The array functions
+compute a whole series at once, vectorized with numpy when it is installed
+and by running the trackers otherwise, the recursive averages of ema, rsi
+and macd being solved in closed form over blocks of the series. Indicators
+are exposed as pseudo display fields like sma20 or rsi14, see compute().
+'''
+from collections import deque
+import math
+import re
+
+NAN = float('nan')
+YEAR = 365 * 24 * 60 * 60
+
+# pseudo fields offered through ALL_DISPLAY_FIELDS, smaN, emaN and rsiN work
+# for any N from 1
+FIELDS = ('sma20', 'sma50', 'ema20', 'rsi14', 'macd', 'macdSignal', 'macdHist',
+          'bbUpper', 'bbMiddle', 'bbLower', 'vwap', 'high52w', 'low52w')
+FIELD_RE = re.compile(r'^(?:(sma|ema|rsi)([1-9]\d*)|macd|macdSignal|macdHist|'
+                      r'bbUpper|bbMiddle|bbLower|vwap|high52w|low52w)$')
+
+
+def is_indicator(field):
+    ''' tells if a display field is an indicator pseudo field '''
+    return FIELD_RE.match(field) is not None
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class SMA(object):
+    ''' simple moving average over the last n values '''
+    __slots__ = ('n', 'window', 'total')
+
+    def __init__(self, n):
+        self.n = n
+        self.window = deque()
+        self.total = 0.0
+
+    def update(self, value):
+        self.window.append(value)
+        self.total += value
+        if len(self.window) > self.n:
+            self.total -= self.window.popleft()
+        if len(self.window) < self.n:
+            return NAN
+        return self.total / self.n
+
+
+class EMA(object):
+    ''' exponential moving average seeded with the sma of the first n
+    values
+    '''
+    __slots__ = ('n', 'alpha', 'value', 'count')
+
+    def __init__(self, n):
+        self.n = n
+        self.alpha = 2.0 / (n + 1)
+        self.value = 0.0
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+        if self.count < self.n:
+            self.value += value
+            return NAN
+        if self.count == self.n:
+            self.value = (self.value + value) / self.n
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class RSI(object):
+    ''' relative strength index with Wilder's smoothing '''
+    __slots__ = ('n', 'previous', 'gain', 'loss', 'count')
+
+    def __init__(self, n=14):
+        self.n = n
+        self.previous = None
+        self.gain = 0.0
+        self.loss = 0.0
+        self.count = 0
+
+    def update(self, value):
+        if self.previous is None:
+            self.previous = value
+            return NAN
+        change = value - self.previous
+        self.previous = value
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        self.count += 1
+        if self.count <= self.n:
+            self.gain += gain / self.n
+            self.loss += loss / self.n
+            if self.count < self.n:
+                return NAN
+        else:
+            self.gain = (self.gain * (self.n - 1) + gain) / self.n
+            self.loss = (self.loss * (self.n - 1) + loss) / self.n
+        if self.loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + self.gain / self.loss)
+
+
+class MACD(object):
+    ''' moving average convergence divergence, update returns the
+    (macd, signal, histogram) tuple
+    '''
+    __slots__ = ('fast', 'slow', 'signal')
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def update(self, value):
+        fast = self.fast.update(value)
+        slow = self.slow.update(value)
+        if math.isnan(slow):
+            return NAN, NAN, NAN
+        macd = fast - slow
+        signal = self.signal.update(macd)
+        return macd, signal, macd - signal
+
+
+class Bollinger(object):
+    ''' bollinger bands, update returns the (upper, middle, lower) tuple '''
+    __slots__ = ('n', 'k', 'window', 'total', 'squares')
+
+    def __init__(self, n=20, k=2.0):
+        self.n = n
+        self.k = k
+        self.window = deque()
+        self.total = 0.0
+        self.squares = 0.0
+
+    def update(self, value):
+        self.window.append(value)
+        self.total += value
+        self.squares += value * value
+        if len(self.window) > self.n:
+            old = self.window.popleft()
+            self.total -= old
+            self.squares -= old * old
+        if len(self.window) < self.n:
+            return NAN, NAN, NAN
+        mean = self.total / self.n
+        std = math.sqrt(max(self.squares / self.n - mean * mean, 0.0))
+        return mean + self.k * std, mean, mean - self.k * std
+
+
+class VWAP(object):
+    ''' volume weighted average price of the session. volume is the
+    cumulative traded volume of the day as sent by the market, a drop in it
+    starts a new session
+    '''
+    __slots__ = ('volume', 'turnover', 'shares')
+
+    def __init__(self):
+        self.volume = None
+        self.turnover = 0.0
+        self.shares = 0.0
+
+    def update(self, price, volume):
+        if self.volume is None or volume < self.volume:
+            self.volume = 0.0
+            self.turnover = 0.0
+            self.shares = 0.0
+        traded = volume - self.volume
+        self.volume = volume
+        self.turnover += price * traded
+        self.shares += traded
+        if self.shares == 0:
+            return NAN
+        return self.turnover / self.shares
+
+
+class RollingExtreme(object):
+    ''' maximum (or minimum) over a time window, kept in a monotonic deque
+    so that update is amortized O(1)
+    '''
+    __slots__ = ('window', 'sign', 'values')
+
+    def __init__(self, window=YEAR, maximum=True):
+        self.window = window
+        self.sign = 1 if maximum else -1
+        self.values = deque()
+
+    def update(self, when, value):
+        keyed = self.sign * value
+        while self.values and self.values[-1][1] <= keyed:
+            self.values.pop()
+        self.values.append((when, keyed))
+        while self.values[0][0] <= when - self.window:
+            self.values.popleft()
+        return self.sign * self.values[0][1]
+
+
+class IndicatorSet(object):
+    ''' incremental trackers for a list of pseudo fields of one symbol '''
+
+    def __init__(self, fields):
+        self.fields = [f for f in fields if is_indicator(f)]
+        self.trackers = {}
+        self.values = dict((field, NAN) for field in self.fields)
+        for field in self.fields:
+            match = FIELD_RE.match(field)
+            if match.group(1):
+                kind, n = match.group(1), int(match.group(2))
+                self.trackers[field] = {'sma': SMA, 'ema': EMA, 'rsi': RSI}[kind](n)
+            elif field.startswith('macd'):
+                self.trackers.setdefault('macd', MACD())
+            elif field.startswith('bb'):
+                self.trackers.setdefault('bb', Bollinger())
+            elif field == 'vwap':
+                self.trackers['vwap'] = VWAP()
+            else:
+                self.trackers[field] = RollingExtreme(maximum=field == 'high52w')
+
+    def update(self, when, price, volume=NAN):
+        ''' feeds one tick, returns the dict of field to current value '''
+        for name, tracker in self.trackers.iteritems():
+            if name == 'macd':
+                (self.values['macd'], self.values['macdSignal'],
+                 self.values['macdHist']) = tracker.update(price)
+            elif name == 'bb':
+                (self.values['bbUpper'], self.values['bbMiddle'],
+                 self.values['bbLower']) = tracker.update(price)
+            elif name == 'vwap':
+                if not math.isnan(volume):
+                    self.values['vwap'] = tracker.update(price, volume)
+            elif name in ('high52w', 'low52w'):
+                self.values[name] = tracker.update(when, price)
+            else:
+                self.values[name] = tracker.update(price)
+        return dict((field, self.values[field]) for field in self.fields)
+
+    def feed(self, history):
+        ''' feeds all the rows of a dict returned by HistoryStore.read '''
+        times = history['TIME']
+        prices = history['lastPrice']
+        volumes = history.get('totalTradedVolume')
+        values = dict((field, NAN) for field in self.fields)
+        for idx in xrange(len(times)):
+            price = prices[idx]
+            if math.isnan(price):
+                continue
+            volume = volumes[idx] if volumes is not None else NAN
+            values = self.update(times[idx], price, volume)
+        return values
+
+
+def _run(tracker, values):
+    ''' runs an incremental tracker over a series '''
+    return [tracker.update(value) for value in values]
+
+
+def sma(values, n):
+    ''' simple moving average series '''
+    np = _numpy()
+    if np is None:
+        return _run(SMA(n), values)
+    values = np.asarray(values, dtype='d')
+    result = np.empty(len(values))
+    result[:n - 1] = NAN
+    if len(values) >= n:
+        total = np.cumsum(values)
+        result[n - 1] = total[n - 1]
+        result[n:] = total[n:] - total[:-n]
+        result[n - 1:] /= n
+    return result
+
+
+def _smooth(np, values, alpha, start):
+    ''' solves y[i] = y[i - 1] + alpha * (values[i] - y[i - 1]) from
+    y[-1] = start without a loop per value: with d = 1 - alpha,
+    y[k] = d ** k * (start + alpha * sum(values[j] * d ** -j for j <= k)).
+    the series is cut in blocks short enough for d ** -k to stay finite
+    '''
+    decay = 1.0 - alpha
+    if decay <= 0:
+        return np.array(values, dtype='d')
+    block = max(1, int(100 / -math.log10(decay)))
+    scale = decay ** -np.arange(1.0, min(block, len(values)) + 1)
+    result = np.empty(len(values))
+    for idx in xrange(0, len(values), block):
+        chunk = values[idx:idx + block]
+        weights = scale[:len(chunk)]
+        result[idx:idx + len(chunk)] = (start + alpha * np.cumsum(chunk * weights)) / weights
+        start = result[idx + len(chunk) - 1]
+    return result
+
+
+def ema(values, n):
+    ''' exponential moving average series '''
+    np = _numpy()
+    if np is None:
+        return _run(EMA(n), values)
+    values = np.asarray(values, dtype='d')
+    result = np.full(len(values), NAN)
+    if len(values) >= n:
+        seed = values[:n].sum() / n
+        result[n - 1] = seed
+        result[n:] = _smooth(np, values[n:], 2.0 / (n + 1), seed)
+    return result
+
+
+def rsi(values, n=14):
+    ''' relative strength index series '''
+    np = _numpy()
+    if np is None:
+        return _run(RSI(n), values)
+    values = np.asarray(values, dtype='d')
+    result = np.full(len(values), NAN)
+    changes = np.diff(values)
+    if len(changes) < n:
+        return result
+    averages = []
+    for moves in (np.maximum(changes, 0.0), np.maximum(-changes, 0.0)):
+        seed = moves[:n].sum() / n
+        averages.append(np.concatenate(([seed], _smooth(np, moves[n:], 1.0 / n, seed))))
+    gain, loss = averages
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result[n:] = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+    return result
+
+
+def macd(values, fast=12, slow=26, signal=9):
+    ''' returns the macd, signal and histogram series '''
+    np = _numpy()
+    if np is None:
+        rows = _run(MACD(fast, slow, signal), values)
+        return [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]
+    values = np.asarray(values, dtype='d')
+    line = ema(values, fast) - ema(values, slow)
+    signals = np.full(len(values), NAN)
+    # the signal line starts with the first macd value
+    start = max(fast, slow) - 1
+    if len(values) > start:
+        signals[start:] = ema(line[start:], signal)
+    return line, signals, line - signals
+
+
+def bollinger(values, n=20, k=2.0):
+    ''' returns the upper, middle and lower band series '''
+    np = _numpy()
+    if np is None:
+        rows = _run(Bollinger(n, k), values)
+        return [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows]
+    values = np.asarray(values, dtype='d')
+    middle = sma(values, n)
+    squares = sma(values * values, n)
+    std = np.sqrt(np.maximum(squares - middle * middle, 0))
+    return middle + k * std, middle, middle - k * std
+
+
+def vwap(prices, volumes):
+    ''' session vwap series from prices and cumulative day volumes. ticks
+    without a volume keep the previous value, like IndicatorSet
+    '''
+    np = _numpy()
+    if np is None:
+        tracker = VWAP()
+        result = []
+        value = NAN
+        for price, volume in zip(prices, volumes):
+            if not math.isnan(volume):
+                value = tracker.update(price, volume)
+            result.append(value)
+        return result
+    prices = np.asarray(prices, dtype='d')
+    volumes = np.asarray(volumes, dtype='d')
+    known = ~np.isnan(volumes)
+    result = np.full(len(prices), NAN)
+    if not known.any():
+        return result
+    result[known] = _session_vwap(np, prices[known], volumes[known])
+    rows = np.arange(len(result))
+    return result[np.maximum.accumulate(np.where(known, rows, 0))]
+
+
+def _session_vwap(np, prices, volumes):
+    traded = np.diff(volumes, prepend=0.0)
+    # a drop in the cumulative volume starts a new session
+    new = traded < 0
+    traded[new] = volumes[new]
+    new[0] = True
+    first = np.flatnonzero(new)[np.cumsum(new) - 1]
+    turnover = np.cumsum(prices * traded)
+    shares = np.cumsum(traded)
+    prior_turnover = np.where(first > 0, turnover[first - 1], 0.0)
+    prior_shares = np.where(first > 0, shares[first - 1], 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (turnover - prior_turnover) / (shares - prior_shares)
+
+
+def rolling_max(times, values, window=YEAR):
+    ''' maximum of the values over the trailing time window '''
+    tracker = RollingExtreme(window, maximum=True)
+    return [tracker.update(t, v) for t, v in zip(times, values)]
+
+
+def rolling_min(times, values, window=YEAR):
+    ''' minimum of the values over the trailing time window '''
+    tracker = RollingExtreme(window, maximum=False)
+    return [tracker.update(t, v) for t, v in zip(times, values)]
+
+
+def compute(fields, history):
+    ''' returns a dict of the latest value of every indicator in fields,
+    computed over a dict of columns returned by HistoryStore.read
+    '''
+    fields = [f for f in fields if is_indicator(f)]
+    if not fields:
+        return {}
+    np = _numpy()
+    if np is None:
+        return IndicatorSet(fields).feed(history)
+    times = np.asarray(history['TIME'], dtype='d')
+    prices = np.asarray(history['lastPrice'], dtype='d')
+    keep = ~np.isnan(prices)
+    times, prices = times[keep], prices[keep]
+    if not len(prices):
+        return dict((field, NAN) for field in fields)
+    values = {}
+    for field in fields:
+        match = FIELD_RE.match(field)
+        if match.group(1):
+            kind, n = match.group(1), int(match.group(2))
+            values[field] = {'sma': sma, 'ema': ema, 'rsi': rsi}[kind](prices, n)[-1]
+        elif field.startswith('macd'):
+            series = dict(zip(('macd', 'macdSignal', 'macdHist'), macd(prices)))
+            values[field] = series[field][-1]
+        elif field.startswith('bb'):
+            series = dict(zip(('bbUpper', 'bbMiddle', 'bbLower'), bollinger(prices)))
+            values[field] = series[field][-1]
+        elif field == 'vwap':
+            volumes = np.asarray(history['totalTradedVolume'], dtype='d')[keep]
+            values[field] = vwap(prices, volumes)[-1]
+        else:
+            recent = times >= times[-1] - YEAR
+            extreme = np.max if field == 'high52w' else np.min
+            values[field] = extreme(prices[recent])
+    return values
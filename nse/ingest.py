@@ -0,0 +1,243 @@
+''' bulk loading of bhavcopy archives into the daily price history.
+
+Every bhavcopy holds one trading day. A pool of processes decompresses and
+parses the archives as streams and sends back the rows of the symbols known
+to the STOCKS table as flat arrays. The parent transposes them into columns
+and hands a batch of days back to the pool, which merges them into the
+HistoryStore one symbol at a time, so that years of files cost a few writes
+per symbol. Days are stored at midnight UTC of their date, loading a day
+again finds the same rows and writes nothing.
+'''
+from array import array
+import calendar
+import itertools
+import logging
+import multiprocessing
+import os
+import re
+import time
+import zipfile
+
+from nse.history import HistoryStore
+from nse.market import BHAVCOPY_URL, BHAV_FIELDS, day_time, read_bhavcopy
+from nse.symbols import SymbolIndex
+
+# columns of the daily history, TIME being the day
+DAILY_COLUMNS = ('TIME',) + tuple(field for bhav, field in BHAV_FIELDS)
+# names of the bhavcopy archives, like cm02APR2014bhav.csv.zip
+ARCHIVE_NAME = re.compile(r'cm(\d\d[A-Za-z]{3}\d{4})bhav\.csv(\.zip)?$')
+
+# the codes of the STOCKS table and the store of the worker processes,
+# codes being None keeps all the symbols
+_codes = None
+_store = None
+
+
+def archive_day(path):
+    ''' returns the time of the day in the name of an archive, None when
+    the name doesn't tell
+    '''
+    match = ARCHIVE_NAME.search(os.path.basename(path))
+    if match is None:
+        return None
+    return float(calendar.timegm(time.strptime(match.group(1), '%d%b%Y')))
+
+
+def open_bhavcopy(path):
+    ''' returns a file object streaming the csv of a bhavcopy, zipped or
+    not. zip members are decompressed while they are read
+    '''
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        try:
+            return archive.open(archive.namelist()[0])
+        finally:
+            archive.close()
+    return open(path, 'rb')
+
+
+def parse_day(path, codes=None, series=('EQ',)):
+    ''' parses a bhavcopy, returns (time, symbols, values, unknown) where
+    the values of symbols[i] are values[i * len(BHAV_FIELDS):] and unknown
+    counts the rows of symbols missing from codes. time is None when the
+    file has no row of the series
+    '''
+    symbols = []
+    values = array('d')
+    unknown = 0
+    day = None
+    f = open_bhavcopy(path)
+    try:
+        for symbol, day, row in read_bhavcopy(f, series):
+            if codes is not None and symbol not in codes:
+                unknown += 1
+                continue
+            symbols.append(symbol)
+            values.extend(row)
+    finally:
+        f.close()
+    return (day_time(day) if day else None), symbols, values, unknown
+
+
+def _init_worker(index_path, root, columns):
+    global _codes, _store
+    _store = HistoryStore(root, columns)
+    _codes = None
+    if index_path is None:
+        return
+    try:
+        codes = SymbolIndex(index_path).codes
+    except (IOError, ValueError):
+        return
+    if len(codes):
+        # a set is faster than the binary search for every row
+        _codes = frozenset(codes)
+
+
+def _parse(path):
+    ''' parse_day in a worker, errors are sent back instead of raised '''
+    try:
+        day, symbols, values, unknown = parse_day(path, _codes)
+    except (IOError, ValueError, zipfile.BadZipfile) as err:
+        return path, None, str(err)
+    # tostring pickles much faster than the array
+    return path, (day, symbols, values.tostring(), unknown), None
+
+
+def _merge(symbols):
+    ''' merges (symbol, columns as strings) into the store of the worker,
+    returns the number of rows written
+    '''
+    rows = 0
+    for symbol, data in symbols:
+        columns = {}
+        for column, values in zip(_store.columns, data):
+            columns[column] = array('d')
+            columns[column].fromstring(values)
+        rows += _store.merge(symbol, columns)
+    return rows
+
+
+def find_archives(sources):
+    ''' returns the bhavcopy files of the given files and directories,
+    directories being searched for archive names
+    '''
+    paths = []
+    for source in sources:
+        if not os.path.isdir(source):
+            paths.append(source)
+            continue
+        for root, dirs, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files
+                         if ARCHIVE_NAME.search(name))
+    return paths
+
+
+def download_archives(nse, root, urls=(), start=None, end=None):
+    ''' downloads the given urls and the bhavcopies of the week days in
+    [start, end) into root, skipping the files already there. returns the
+    local paths, days without a bhavcopy like holidays are left out
+    '''
+    urls = list(urls)
+    if start is not None:
+        day = start
+        while day < end:
+            local = time.localtime(day)
+            if local.tm_wday < 5:
+                urls.append(time.strftime(BHAVCOPY_URL, local).replace(
+                    time.strftime('%b', local), time.strftime('%b', local).upper()))
+            day += 24 * 60 * 60
+    if not os.path.isdir(root):
+        os.makedirs(root)
+    paths = []
+    for url in urls:
+        path = os.path.join(root, url.rstrip('/').rsplit('/', 1)[-1])
+        if not os.path.isfile(path):
+            data = nse.download_file(url)
+            if data is None:
+                continue
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.rename(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+
+class Ingester(object):
+    ''' loads bhavcopy files into a HistoryStore of DAILY_COLUMNS '''
+
+    def __init__(self, store, index_path=None, processes=None, batch_days=250):
+        ''' index_path is the symbol index of the STOCKS table, rows of other
+        symbols are dropped. batch_days is the number of days merged at once,
+        bounding the memory to about 80 bytes per row of the batch
+        '''
+        self.log = logging.getLogger('Ingester')
+        self.store = store
+        self.index_path = index_path
+        self.processes = processes or multiprocessing.cpu_count()
+        self.batch_days = batch_days
+
+    def ingest(self, paths):
+        ''' loads the files, oldest day first so that the batches are
+        mostly appended. returns a dict of counters: days, rows stored,
+        unknown rows and errors
+        '''
+        stats = {'days': 0, 'rows': 0, 'unknown': 0, 'errors': 0}
+        paths = sorted(paths, key=lambda path: (archive_day(path), path))
+        args = (self.index_path, self.store.root, self.store.columns)
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes, _init_worker, args)
+            parse, merge = pool.imap, pool.imap_unordered
+        else:
+            pool = None
+            _init_worker(*args)
+            parse = merge = itertools.imap
+        batch = {}
+        days = 0
+        try:
+            for path, parsed, error in parse(_parse, paths):
+                if error is not None:
+                    self.log.error('unable to load %s: %s', path, error)
+                    stats['errors'] += 1
+                    continue
+                day, symbols, values, unknown = parsed
+                stats['unknown'] += unknown
+                if day is None:
+                    self.log.debug('%s has no rows', path)
+                    continue
+                self.add(batch, day, symbols, values)
+                stats['days'] += 1
+                days += 1
+                if days == self.batch_days:
+                    stats['rows'] += sum(merge(_merge, self.chunks(batch)))
+                    batch, days = {}, 0
+            stats['rows'] += sum(merge(_merge, self.chunks(batch)))
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return stats
+
+    def add(self, batch, day, symbols, data):
+        ''' transposes the rows of a day into the columns of the batch '''
+        values = array('d')
+        values.fromstring(data)
+        width = len(BHAV_FIELDS)
+        for idx, symbol in enumerate(symbols):
+            columns = batch.get(symbol)
+            if columns is None:
+                columns = batch[symbol] = [array('d') for column in DAILY_COLUMNS]
+            columns[0].append(day)
+            row = values[idx * width:(idx + 1) * width]
+            for column, value in zip(columns[1:], row):
+                column.append(value)
+
+    def chunks(self, batch, size=64):
+        ''' yields the symbols of the batch for _merge, size at a time '''
+        chunk = []
+        for symbol, columns in batch.iteritems():
+            chunk.append((symbol, [values.tostring() for values in columns]))
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
@@ -0,0 +1,240 @@
+''' market wide snapshots built from the bulk end of day files of NSE: the
+bhavcopy, one row per traded security, and the closing values of all the
+indices. Rankings are computed column wise over the whole market, with numpy
+when it is installed.
+'''
+from array import array
+from cStringIO import StringIO
+import calendar
+import csv
+import heapq
+import logging
+import os
+import time
+import zipfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BHAVCOPY_URL = 'http://www.nseindia.com/content/historical/EQUITIES/%Y/%b/cm%d%b%Ybhav.csv.zip'
+INDICES_URL = 'http://www.nseindia.com/content/indices/ind_close_all_%d%m%Y.csv'
+
+# bhavcopy columns and the quote fields they are exposed as
+BHAV_FIELDS = (('OPEN', 'open'), ('HIGH', 'dayHigh'), ('LOW', 'dayLow'),
+               ('CLOSE', 'closePrice'), ('LAST', 'lastPrice'),
+               ('PREVCLOSE', 'previousClose'),
+               ('TOTTRDQTY', 'totalTradedVolume'),
+               ('TOTTRDVAL', 'totalTradedValue'))
+
+
+class Snapshot(object):
+    ''' columnar snapshot of the market, symbols[i] is described by the
+    i-th value of every column. columns are numpy arrays when numpy is
+    installed and array('d') otherwise
+    '''
+    def __init__(self, symbols, columns, day=None):
+        self.symbols = symbols
+        self.columns = columns
+        self.day = day
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @classmethod
+    def from_bhavcopy(cls, data, series=('EQ',)):
+        ''' builds the snapshot from the csv text of a bhavcopy, keeping
+        only the given series
+        '''
+        symbols = []
+        columns = [array('d') for bhav, field in BHAV_FIELDS]
+        day = None
+        for symbol, day, values in read_bhavcopy(StringIO(data), series):
+            symbols.append(symbol)
+            for column, value in zip(columns, values):
+                column.append(value)
+        return cls(symbols, derive(dict((field, column) for (bhav, field), column
+                                        in zip(BHAV_FIELDS, columns))), day)
+
+    def add_year_range(self, store):
+        ''' adds the high52 and low52 columns, the extremes of the snapshot
+        and of the year before it in a daily HistoryStore, see nse.ingest
+        '''
+        end = day_time(self.day) if self.day else time.time()
+        start = end - 365 * 24 * 60 * 60
+        highs, lows = [], []
+        for idx, symbol in enumerate(self.symbols):
+            history = store.read(symbol, start, end, ['dayHigh', 'dayLow'])
+            highs.append(extreme(history['dayHigh'], self.columns['dayHigh'][idx], max))
+            lows.append(extreme(history['dayLow'], self.columns['dayLow'][idx], min))
+        for field, values in (('high52', highs), ('low52', lows)):
+            if numpy is not None:
+                self.columns[field] = numpy.array(values, dtype='d')
+            else:
+                self.columns[field] = array('d', values)
+
+    def column(self, field):
+        return self.columns[field]
+
+    def top(self, field, n=10, ascending=False):
+        ''' returns the indexes of the n largest (or smallest) values of a
+        column, largest first. nan values are never ranked
+        '''
+        values = self.columns[field]
+        if numpy is not None:
+            keys = values if ascending else -values
+            keys = numpy.where(numpy.isnan(keys), numpy.inf, keys)
+            n = min(n, len(keys))
+            if n == 0:
+                return []
+            best = numpy.argpartition(keys, n - 1)[:n]
+            best = best[numpy.argsort(keys[best], kind='mergesort')]
+            return [int(i) for i in best if keys[i] != numpy.inf]
+        pick = heapq.nsmallest if ascending else heapq.nlargest
+        return pick(n, (i for i in xrange(len(values)) if values[i] == values[i]),
+                    key=values.__getitem__)
+
+    def advance_declines(self):
+        ''' returns the number of (advances, declines, unchanged) stocks '''
+        change = self.columns['change']
+        if numpy is not None:
+            known = change[~numpy.isnan(change)]
+            advances = int((known > 0).sum())
+            declines = int((known < 0).sum())
+            return advances, declines, len(known) - advances - declines
+        advances = declines = unchanged = 0
+        for value in change:
+            if value > 0:
+                advances += 1
+            elif value < 0:
+                declines += 1
+            elif value == 0:
+                unchanged += 1
+        return advances, declines, unchanged
+
+    def row(self, idx):
+        ''' returns the values of a symbol as a dict of field to value '''
+        row = dict((field, self.columns[field][idx]) for field in self.columns)
+        row['symbol'] = self.symbols[idx]
+        return row
+
+
+def day_time(text):
+    ''' returns the time of a bhavcopy day like 02-APR-2014, midnight UTC '''
+    return float(calendar.timegm(time.strptime(text, '%d-%b-%Y')))
+
+
+def extreme(values, value, pick):
+    ''' returns pick, max or min, of the values and value ignoring nan,
+    nan when they are all nan
+    '''
+    known = [v for v in values if v == v]
+    if value == value:
+        known.append(value)
+    return pick(known) if known else float('nan')
+
+
+def read_bhavcopy(lines, series=('EQ',)):
+    ''' yields (symbol, day, values) for the rows of the given series of a
+    bhavcopy, values being ordered like BHAV_FIELDS. lines is any iterable of
+    csv lines, like an open file, so a bhavcopy is parsed as it is read.
+    raises ValueError when it is not a bhavcopy
+    '''
+    rows = csv.reader(lines)
+    header = [h.strip() for h in next(rows, [])]
+    names = ['SYMBOL', 'SERIES', 'TIMESTAMP'] + [b for b, f in BHAV_FIELDS]
+    missing = [name for name in names if name not in header]
+    if missing:
+        raise ValueError('not a bhavcopy, missing %s' % ', '.join(missing))
+    symbol, kind, day = [header.index(name) for name in names[:3]]
+    fields = [header.index(bhav) for bhav, field in BHAV_FIELDS]
+    for row in rows:
+        if len(row) < len(header) or row[kind].strip() not in series:
+            continue
+        yield (row[symbol].strip(), row[day].strip(),
+               [float(row[idx] or 'nan') for idx in fields])
+
+
+def derive(columns):
+    ''' adds the change and pChange columns, converting the columns to
+    numpy arrays first when numpy is installed
+    '''
+    if numpy is not None:
+        columns = dict((field, numpy.frombuffer(values, dtype='d').copy())
+                       for field, values in columns.iteritems())
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            columns['change'] = columns['closePrice'] - columns['previousClose']
+            columns['pChange'] = columns['change'] * 100 / columns['previousClose']
+        return columns
+    close, previous = columns['closePrice'], columns['previousClose']
+    columns['change'] = array('d', [c - p for c, p in zip(close, previous)])
+    columns['pChange'] = array('d', [(c - p) * 100 / p if p else float('nan')
+                                     for c, p in zip(close, previous)])
+    return columns
+
+
+def read_archive(data):
+    ''' returns the text of a csv file, unzipping it when needed '''
+    if data[:2] != 'PK':
+        return data
+    archive = zipfile.ZipFile(StringIO(data))
+    return archive.read(archive.namelist()[0])
+
+
+class MarketData(object):
+    ''' downloads the bulk files of the latest trading day and keeps them in
+    a local directory for ttl seconds
+    '''
+    def __init__(self, driver, root, ttl=300, clock=time.time):
+        ''' driver is a callable returning the NseDriver used to download,
+        it is only called when the local files are stale
+        '''
+        self.log = logging.getLogger('MarketData')
+        self.driver = driver
+        self.root = root
+        self.ttl = ttl
+        self.clock = clock
+
+    def snapshot(self, path=None):
+        ''' returns the Snapshot of the latest bhavcopy, or of the given
+        local bhavcopy file
+        '''
+        if path is not None:
+            return Snapshot.from_bhavcopy(read_archive(open(path, 'rb').read()))
+        return Snapshot.from_bhavcopy(self.fetch('bhavcopy.csv', BHAVCOPY_URL))
+
+    def indices(self):
+        ''' returns the closing values of all the indices as a list of
+        dicts, keyed by the column names of the csv file
+        '''
+        rows = csv.DictReader(StringIO(self.fetch('indices.csv', INDICES_URL)))
+        return [dict((k.strip(), v.strip()) for k, v in row.iteritems() if k)
+                for row in rows]
+
+    def fetch(self, name, url_format, days=7):
+        ''' returns the cached file, downloading the file of the latest of
+        the last days trading days when it is older than the ttl
+        '''
+        path = os.path.join(self.root, name)
+        if os.path.isfile(path) and self.clock() - os.path.getmtime(path) < self.ttl:
+            self.log.debug('using cached %s', path)
+            return open(path, 'rb').read()
+        nse = self.driver()
+        now = self.clock()
+        for back in range(days):
+            day = time.localtime(now - back * 24 * 60 * 60)
+            url = time.strftime(url_format, day).replace(
+                time.strftime('%b', day), time.strftime('%b', day).upper())
+            data = nse.download_file(url)
+            if data is not None:
+                break
+        else:
+            raise IOError('no %s found for the last %d days' % (name, days))
+        data = read_archive(data)
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.rename(path + '.tmp', path)
+        return data
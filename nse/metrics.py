@@ -0,0 +1,157 @@
+''' timing spans, counters and histograms of the hot paths.
+
+Metrics are disabled unless -profile or -metrics is given, a span then costs
+a method call returning a shared no-op context manager. Timings go to
+histograms with power of two buckets from one microsecond up, so the
+percentiles of the report are upper bounds within a factor of two.
+'''
+import json
+import os
+import threading
+import time
+
+# upper bounds of the histogram buckets in seconds, the last one is open
+BUCKETS = tuple(1e-6 * 2 ** n for n in range(28))
+
+
+class Histogram(object):
+    ''' count, total, min, max and bucket counts of observed durations '''
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        idx = 0
+        while idx < len(BUCKETS) and value > BUCKETS[idx]:
+            idx += 1
+        self.buckets[idx] += 1
+
+    def percentile(self, p):
+        ''' returns the upper bound of the bucket holding the p quantile '''
+        if not self.count:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(BUCKETS[idx], self.max) if idx < len(BUCKETS) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count, 'total': self.total, 'min': self.min,
+                'max': self.max,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(0.5), 'p99': self.percentile(0.99),
+                'buckets': dict(('%g' % BUCKETS[idx] if idx < len(BUCKETS) else 'inf', n)
+                                for idx, n in enumerate(self.buckets) if n)}
+
+
+class Span(object):
+    ''' times a with block into a histogram '''
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.time() - self.started)
+        return False
+
+
+class _NoSpan(object):
+    ''' the span of disabled metrics '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NO_SPAN = _NoSpan()
+
+
+class Metrics(object):
+    ''' thread safe registry of counters and histograms '''
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.time()
+
+    def span(self, name):
+        ''' returns a context manager timing its block as name '''
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        ''' returns the counters and histograms as a json friendly dict '''
+        with self.lock:
+            return {'uptime': time.time() - self.started,
+                    'counters': dict(self.counters),
+                    'histograms': dict((name, h.as_dict())
+                                       for name, h in self.histograms.iteritems())}
+
+    def dump(self, path):
+        ''' writes the snapshot to a json file '''
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f, indent=1, sort_keys=True)
+        os.rename(path + '.tmp', path)
+
+    def report(self, out):
+        ''' writes the per phase breakdown of -profile '''
+        snapshot = self.snapshot()
+        wall = snapshot['uptime']
+        out.write('%-24s %7s %10s %9s %9s %9s %6s\n' % (
+            'phase', 'count', 'total ms', 'mean ms', 'p50 ms', 'p99 ms', 'wall'))
+        for name, h in sorted(snapshot['histograms'].iteritems()):
+            out.write('%-24s %7d %10.2f %9.3f %9.3f %9.3f %5.1f%%\n' % (
+                name, h['count'], h['total'] * 1000, h['mean'] * 1000,
+                h['p50'] * 1000, h['p99'] * 1000,
+                h['total'] * 100 / wall if wall else 0))
+        for name, n in sorted(snapshot['counters'].iteritems()):
+            out.write('%-24s %7d\n' % (name, n))
+        out.write('%-24s %7s %10.2f\n' % ('wall', '', wall * 1000))
+
+
+METRICS = Metrics()
+span = METRICS.span
+count = METRICS.count
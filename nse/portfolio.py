@@ -0,0 +1,84 @@
+''' valuation of the holdings stored in the HOLDINGS table '''
+from collections import OrderedDict
+
+
+class Position(object):
+    ''' a holding along with the last price and change of the stock '''
+    __slots__ = ('symbol', 'qty', 'cost', 'price', 'change')
+
+    def __init__(self, symbol, qty, cost):
+        self.symbol = symbol
+        self.qty = qty
+        self.cost = cost
+        self.price = None
+        self.change = None
+
+    def value(self):
+        return self.qty * self.price
+
+    def day_change(self):
+        return self.qty * self.change
+
+    def pnl(self):
+        ''' unrealized profit or loss '''
+        return self.qty * (self.price - self.cost)
+
+
+class Portfolio(object):
+    ''' the positions of the holdings and their totals. update() applies
+    the difference a new quote makes to the totals instead of summing all
+    the positions again, so a tick costs as much as the quotes that changed
+    '''
+    def __init__(self, holdings):
+        ''' holdings is a list of (symbol, qty, cost) rows '''
+        self.positions = OrderedDict((symbol, Position(symbol, qty, cost))
+                                     for symbol, qty, cost in holdings)
+        self.value = 0.0
+        self.day_change = 0.0
+        # cost of the positions which have a price
+        self.cost = 0.0
+        self.priced = 0
+
+    def symbols(self):
+        return list(self.positions)
+
+    def update(self, symbol, quote):
+        ''' prices the position of the symbol with a quote, tells if the
+        position changed
+        '''
+        position = self.positions.get(symbol)
+        price = quote.num('lastPrice')
+        if position is None or price is None:
+            return False
+        change = quote.num('change')
+        if change is None:
+            change = price - quote.num('previousClose', price)
+        if position.price == price and position.change == change:
+            return False
+        if position.price is None:
+            self.priced += 1
+            self.cost += position.qty * position.cost
+        else:
+            self.value -= position.value()
+            self.day_change -= position.day_change()
+        position.price, position.change = price, change
+        self.value += position.value()
+        self.day_change += position.day_change()
+        return True
+
+    def pnl(self):
+        ''' unrealized profit or loss of the priced positions '''
+        return self.value - self.cost
+
+    def pnl_percent(self):
+        return self.pnl() * 100 / self.cost if self.cost else 0.0
+
+    def day_change_percent(self):
+        previous = self.value - self.day_change
+        return self.day_change * 100 / previous if previous else 0.0
+
+    def weight(self, position):
+        ''' share of the position in the value of the portfolio, percent '''
+        if position.price is None or not self.value:
+            return 0.0
+        return position.value() * 100 / self.value
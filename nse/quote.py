@@ -0,0 +1,78 @@
+''' the quote returned by the market and its parser '''
+import json
+
+
+class QuoteError(Exception):
+    ''' raised when a quote could not be fetched from the market '''
+    pass
+
+
+class InvalidCodeError(QuoteError):
+    ''' raised when the market does not return a quote for the code '''
+    pass
+
+
+class Quote(dict):
+    ''' a quote as returned by the market, every value is kept as the raw
+    string sent by the server. num() converts values like "1,234.50"
+    to numbers on first access and remembers the result
+    '''
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self._numbers = {}
+
+    def num(self, key, default=None):
+        ''' returns the value of key as an int or a float, default when
+        the key is missing or not numeric
+        '''
+        try:
+            return self._numbers[key]
+        except KeyError:
+            pass
+        value = to_number(self.get(key))
+        if value is None:
+            value = default
+        self._numbers[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._numbers.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+
+def to_number(value):
+    ''' converts a market value like "12,34,567" or "1,234.50" to an int
+    or a float, returns None for blanks like "-"
+    '''
+    if isinstance(value, (int, long, float)):
+        return value
+    if not value:
+        return None
+    value = value.replace(',', '').strip()
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_quote(body):
+    ''' extracts the quote from a GetQuote.jsp response. the json payload
+    of the responseDiv element is located with plain string searches
+    instead of building an html tree. raises ValueError when the response
+    does not contain a quote
+    '''
+    start = body.find('id="responseDiv"')
+    if start < 0:
+        raise ValueError('responseDiv not found')
+    start = body.find('>', start) + 1
+    end = body.find('</div>', start)
+    if start <= 0 or end < 0:
+        raise ValueError('responseDiv is not terminated')
+    data = json.loads(body[start:end])['data']
+    if not data:
+        raise ValueError('no quote in the response')
+    return Quote(data[0])
@@ -0,0 +1,198 @@
+''' screener expressions over a market Snapshot, like
+
+    pChange > 3 and totalTradedVolume > 1e6 and lastPrice > 0.9 * high52
+
+An expression is parsed with the ast module, checked against a whitelist of
+arithmetic, comparisons, and/or/not and abs() over the display fields, and
+compiled once into a function of the fields it uses. With numpy the function
+is called once with the whole columns of the snapshot, and/or/not being
+turned into their element wise numpy counterparts, otherwise once per
+symbol.
+'''
+import __future__
+import ast
+import itertools
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAN = float('nan')
+INF = float('inf')
+
+ALLOWED = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not,
+           ast.USub, ast.UAdd, ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div,
+           ast.Mod, ast.Compare, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+           ast.Eq, ast.NotEq, ast.Name, ast.Load, ast.Num, ast.Call)
+FUNCTIONS = ('abs',)
+
+
+def _and(a, b):
+    return a and b
+
+
+def _or(a, b):
+    return a or b
+
+
+def _not(a):
+    return not a
+
+
+def _div(a, b):
+    ''' a / b giving inf or nan for a zero b, like numpy does for the
+    columns, instead of raising
+    '''
+    try:
+        return float(a) / b
+    except ZeroDivisionError:
+        if a != a or a == 0:
+            return NAN
+        return math.copysign(INF, a) * math.copysign(1, b)
+
+# globals of the compiled functions, per symbol and column wise
+SCALAR = {'__builtins__': {}, 'abs': abs, '_and': _and, '_or': _or, '_not': _not,
+          '_div': _div}
+if numpy is not None:
+    VECTOR = {'__builtins__': {}, 'abs': numpy.absolute, '_and': numpy.logical_and,
+              '_or': numpy.logical_or, '_not': numpy.logical_not,
+              '_div': numpy.true_divide}
+
+
+def _call(name, *args):
+    return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=list(args),
+                    keywords=[], starargs=None, kwargs=None)
+
+
+class _Compiler(ast.NodeTransformer):
+    ''' rejects the nodes out of the whitelist and rewrites the boolean
+    operators, chained comparisons and divisions into calls of _and, _or,
+    _not and _div
+    '''
+    def __init__(self, fields, names):
+        self.fields = fields
+        self.names = names
+
+    def visit(self, node):
+        if not isinstance(node, ALLOWED):
+            raise ValueError('%s is not allowed in a screen' % type(node).__name__)
+        return ast.NodeTransformer.visit(self, node)
+
+    def visit_Name(self, node):
+        if node.id not in self.fields:
+            raise ValueError('unknown field %s, see -all_display_fields' % node.id)
+        if node.id not in self.names:
+            self.names.append(node.id)
+        return node
+
+    def visit_BoolOp(self, node):
+        helper = '_and' if isinstance(node.op, ast.And) else '_or'
+        return reduce(lambda a, b: _call(helper, a, b),
+                      [self.visit(value) for value in node.values])
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return _call('_not', operand)
+        node.operand = operand
+        return node
+
+    def visit_BinOp(self, node):
+        self.visit(node.op)
+        left, right = self.visit(node.left), self.visit(node.right)
+        if isinstance(node.op, ast.Div):
+            return _call('_div', left, right)
+        node.left, node.right = left, right
+        return node
+
+    def visit_Compare(self, node):
+        left = self.visit(node.left)
+        parts = []
+        for op, right in zip(node.ops, node.comparators):
+            right = self.visit(right)
+            parts.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+            left = right
+        return reduce(lambda a, b: _call('_and', a, b), parts)
+
+    def visit_Call(self, node):
+        if (not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or
+                node.keywords or node.starargs or node.kwargs or len(node.args) != 1):
+            raise ValueError('only %s(x) can be called in a screen' % ', '.join(FUNCTIONS))
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+class Screen(object):
+    ''' an expression over the columns of a Snapshot, compiled once. with
+    condition=True it must be a comparison or a combination of them.
+    raises ValueError for invalid expressions and unknown fields
+    '''
+    def __init__(self, text, fields, condition=True):
+        self.text = ' '.join(text.split())
+        try:
+            tree = ast.parse(self.text, mode='eval')
+        except SyntaxError as err:
+            raise ValueError('invalid screen "%s": %s' % (self.text, err.msg))
+        if condition and not (isinstance(tree.body, (ast.Compare, ast.BoolOp)) or
+                              isinstance(tree.body, ast.UnaryOp) and
+                              isinstance(tree.body.op, ast.Not)):
+            raise ValueError('"%s" is not a condition, compare fields like pChange > 3'
+                             % self.text)
+        # the fields in the order of their first use
+        self.names = []
+        body = _Compiler(fields, self.names).visit(tree.body)
+        args = ast.arguments(args=[ast.Name(id=name, ctx=ast.Param()) for name in self.names],
+                             vararg=None, kwarg=None, defaults=[])
+        tree = ast.fix_missing_locations(ast.Expression(body=ast.Lambda(args=args, body=body)))
+        code = compile(tree, '<screen>', 'eval', __future__.division.compiler_flag, True)
+        self.scalar = eval(code, dict(SCALAR))
+        self.vector = eval(code, dict(VECTOR)) if numpy is not None else None
+
+    def evaluate(self, snapshot):
+        ''' returns the value of the expression for every symbol, a numpy
+        array or a list. raises ValueError when a field is not a column of
+        the snapshot
+        '''
+        missing = [name for name in self.names if name not in snapshot.columns]
+        if missing:
+            raise ValueError('%s not in the market snapshot, screens can use %s' % (
+                ', '.join(missing), ' '.join(sorted(snapshot.columns))))
+        columns = [snapshot.columns[name] for name in self.names]
+        if numpy is not None:
+            with numpy.errstate(all='ignore'):
+                values = numpy.asarray(self.vector(*columns))
+            if values.ndim == 0:
+                values = numpy.repeat(values, len(snapshot))
+            return values
+        values = []
+        rows = itertools.izip(*columns) if columns else [()] * len(snapshot)
+        for row in rows:
+            try:
+                values.append(self.scalar(*row))
+            except (ArithmeticError, ValueError):
+                values.append(NAN)
+        return values
+
+
+def screen(snapshot, where, order=None, ascending=False, limit=None):
+    ''' returns the indexes of the symbols for which the where Screen holds,
+    sorted by the values of the order Screen, largest first unless
+    ascending, and cut to limit. symbols whose sort value is nan come last
+    '''
+    if numpy is not None:
+        matches = numpy.flatnonzero(where.evaluate(snapshot).astype(bool))
+        if order is not None and len(matches):
+            keys = order.evaluate(snapshot).astype('d')[matches]
+            keys = keys if ascending else -keys
+            keys = numpy.where(numpy.isnan(keys), numpy.inf, keys)
+            matches = matches[numpy.argsort(keys, kind='mergesort')]
+        return [int(idx) for idx in matches[:limit]]
+    matches = [idx for idx, value in enumerate(where.evaluate(snapshot))
+               if value is True]
+    if order is not None:
+        keys = order.evaluate(snapshot)
+        sign = 1 if ascending else -1
+        matches.sort(key=lambda idx: (keys[idx] != keys[idx], sign * keys[idx]))
+    return matches[:limit]
@@ -0,0 +1,64 @@
+''' ranking helpers for the stock search, see DB.search_stocks '''
+
+
+def edit_distance(a, b):
+    ''' returns the levenshtein distance between two strings '''
+    if len(a) < len(b):
+        a, b = b, a
+    previous = range(len(b) + 1)
+    for i, ca in enumerate(a):
+        current = [i + 1]
+        for j, cb in enumerate(b):
+            current.append(min(previous[j + 1] + 1, current[j] + 1,
+                               previous[j] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def stock_grams(code, name):
+    ''' returns the set of trigrams indexed for a stock. every token is
+    padded with blanks so that token prefixes get grams of their own
+    '''
+    grams = set()
+    for token in ('%s %s' % (code, name)).upper().split():
+        token = ' %s ' % token
+        for i in range(len(token) - 2):
+            grams.add(token[i:i + 3])
+    return grams
+
+
+def query_grams(query):
+    ''' returns the trigrams to look up for a search query, tokens of the
+    query may be prefixes so only the leading blank is added
+    '''
+    grams = set()
+    for token in query.split():
+        token = ' ' + token
+        for i in range(max(1, len(token) - 2)):
+            grams.add(token[i:i + 3])
+    return grams
+
+
+def match_rank(query, code, name):
+    ''' ranks how well a stock matches an upper cased query, lower is
+    better and None means no match
+    '''
+    if code == query:
+        return (0, 0)
+    if code.startswith(query) or name.startswith(query):
+        return (1, 0)
+    words = query.split()
+    tokens = name.split()
+    if all(any(token.startswith(word) for token in tokens) for word in words):
+        return (2, 0)
+    if query in name or query in code:
+        return (3, 0)
+    # fuzzy match, every word must be close to the code or a name token
+    distance = 0
+    for word in words:
+        best = min(edit_distance(word, token[:len(word) + 1])
+                   for token in tokens + [code])
+        if best > max(1, len(word) // 3):
+            return None
+        distance += best
+    return (4, distance)
@@ -0,0 +1,270 @@
+''' the quote server started by nsecli.py -serve.
+
+It owns a single NseDriver, keeps fetched quotes in memory and coalesces
+concurrent requests for the same symbol into one upstream fetch. nsecli.py
+uses it transparently through DaemonDriver when it is running.
+'''
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import httplib
+import json
+import logging
+import socket
+import threading
+import time
+import urlparse
+
+from nse.metrics import METRICS
+from nse.quote import Quote, QuoteError, InvalidCodeError
+
+DEFAULT_PORT = 8765
+
+
+class SingleFlight(object):
+    ''' runs at most one call per key at a time, callers asking for a key
+    already in flight wait for that call and share its result
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        ''' returns (result, shared), shared telling if the result came
+        from a call started by another caller
+        '''
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QuoteService(object):
+    ''' in memory quote cache in front of an NseDriver, safe to use from
+    many threads
+    '''
+    def __init__(self, nse, ttl=5, listeners=()):
+        self.log = logging.getLogger('QuoteService')
+        self.nse = nse
+        self.ttl = ttl
+        self.listeners = list(listeners)
+        self.flight = SingleFlight()
+        self.lock = threading.Lock()
+        self.quotes = {}
+        self.counters = {'requests': 0, 'hits': 0, 'upstream': 0,
+                         'coalesced': 0, 'errors': 0}
+        # shared by the handler threads, see get_many
+        from multiprocessing.pool import ThreadPool
+        self.pool = ThreadPool(nse.workers)
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def stats(self):
+        ''' returns a copy of the counters '''
+        with self.lock:
+            stats = dict(self.counters)
+        stats['cached'] = len(self.quotes)
+        return stats
+
+    def get(self, code, max_age=None):
+        ''' returns (quote, fetched) for the code, from memory when younger
+        than max_age, raises QuoteError
+        '''
+        if max_age is None:
+            max_age = self.ttl
+        self.count('requests')
+        cached = self.quotes.get(code)
+        if cached is not None and time.time() - cached[1] <= max_age:
+            self.count('hits')
+            return cached
+        result, shared = self.flight.do(code, lambda: self.fetch(code))
+        if shared:
+            self.count('coalesced')
+        return result
+
+    def fetch(self, code):
+        ''' fetches a code upstream and remembers it '''
+        self.count('upstream')
+        try:
+            quote = self.nse.fetch_quote(code)
+        except QuoteError:
+            self.count('errors')
+            raise
+        fetched = time.time()
+        self.quotes[code] = (quote, fetched)
+        for listener in self.listeners:
+            try:
+                listener(code, quote, fetched)
+            except Exception, err:
+                self.log.error('listener failed for %s: %s', code, err)
+        return quote, fetched
+
+    def get_many(self, codes, max_age=None):
+        ''' fetches several codes concurrently, returns a list of
+        (code, quote, fetched, error) tuples in input order
+        '''
+        def one(code):
+            try:
+                quote, fetched = self.get(code, max_age)
+                return code, quote, fetched, None
+            except QuoteError as err:
+                return code, None, None, err
+        if len(codes) == 1:
+            return [one(codes[0])]
+        return self.pool.map(one, codes)
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    ''' GET /quotes?symbols=A,B[&max_age=S], GET /stats, GET /metrics and
+    GET /ping
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        args = urlparse.parse_qs(url.query)
+        if url.path == '/ping':
+            self.reply(200, {'server': 'nsecli'})
+        elif url.path == '/stats':
+            self.reply(200, self.server.service.stats())
+        elif url.path == '/metrics':
+            self.reply(200, METRICS.snapshot())
+        elif url.path == '/quotes':
+            codes = [c for c in ','.join(args.get('symbols', [])).split(',') if c]
+            max_age = float(args['max_age'][0]) if 'max_age' in args else None
+            results = []
+            for code, quote, fetched, error in self.server.service.get_many(codes, max_age):
+                if error is None:
+                    results.append({'symbol': code, 'quote': quote, 'fetched': fetched})
+                else:
+                    results.append({'symbol': code, 'error': str(error),
+                                    'invalid': isinstance(error, InvalidCodeError)})
+            self.reply(200, {'results': results})
+        else:
+            self.reply(404, {'error': 'unknown path %s' % url.path})
+
+    def reply(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        logging.getLogger('QuoteHandler').debug(fmt, *args)
+
+
+class QuoteServer(ThreadingMixIn, HTTPServer):
+    ''' threaded http server listening on localhost only '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, service, port=DEFAULT_PORT):
+        HTTPServer.__init__(self, ('127.0.0.1', port), QuoteHandler)
+        self.service = service
+
+
+class DaemonDriver(object):
+    ''' stands in for NseDriver in the cli when the quote server is
+    running, quotes are then fetched through the server
+    '''
+    def __init__(self, port=DEFAULT_PORT, timeout=30):
+        self.log = logging.getLogger('DaemonDriver')
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    @staticmethod
+    def available(port=DEFAULT_PORT, timeout=0.05):
+        ''' tells if the quote server is listening on the port, anything
+        else listening there is not
+        '''
+        try:
+            sock = socket.create_connection(('127.0.0.1', port), timeout)
+        except socket.error:
+            return False
+        sock.close()
+        try:
+            reply = DaemonDriver(port, timeout=1).request('/ping')
+        except (httplib.HTTPException, socket.error, ValueError, IOError):
+            return False
+        return isinstance(reply, dict) and reply.get('server') == 'nsecli'
+
+    def request(self, path):
+        ''' sends a GET over a persistent connection, returns the json '''
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = httplib.HTTPConnection('127.0.0.1', self.port,
+                                                   timeout=self.timeout)
+            try:
+                self.conn.request('GET', path)
+                return json.loads(self.conn.getresponse().read())
+            except (httplib.HTTPException, socket.error):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def get_quotes(self, codes, workers=None, max_age=0, stale=False):
+        ''' same as NseDriver.get_quotes, served by the quote server '''
+        import urllib
+        path = '/quotes?' + urllib.urlencode({'symbols': ','.join(codes),
+                                              'max_age': max_age})
+        try:
+            results = self.request(path)['results']
+        except (httplib.HTTPException, socket.error, ValueError, IOError,
+                KeyError, TypeError) as err:
+            return [(code, None, QuoteError('quote server failed: %s' % err))
+                    for code in codes]
+        return [(r['symbol'], Quote(r['quote']), None) if 'quote' in r else
+                (r['symbol'], None, InvalidCodeError(r['symbol'])
+                 if r['invalid'] else QuoteError(r['error']))
+                for r in results]
+
+    def iter_quotes(self, codes, max_age=0, window=64):
+        ''' same as NseDriver.iter_quotes, codes are sent in chunks '''
+        chunk = []
+        for code in codes:
+            chunk.append(code)
+            if len(chunk) == window:
+                for result in self.get_quotes(chunk, max_age=max_age):
+                    yield result
+                chunk = []
+        if chunk:
+            for result in self.get_quotes(chunk, max_age=max_age):
+                yield result
+
+    def add_listener(self, listener):
+        ''' listeners run inside the quote server '''
+        pass
+
+    def wait_for_refresh(self):
+        pass
+
+    def connection_stats(self):
+        return self.request('/stats')
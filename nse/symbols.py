@@ -0,0 +1,138 @@
+''' memory mapped index of the stock codes and display fields.
+
+The index is a file next to the database, written whenever the STOCKS table
+or ALL_DISPLAY_FIELDS change. A header is followed by the sorted codes and
+then the sorted fields, each section made of NUL padded records of the width
+of its longest entry, so that a lookup is a binary search over the mapped
+file. Opening it costs a mmap and no parsing, which keeps the shell
+completion fast enough to run on every TAB and lets the codes given on the
+command line be checked before any request is sent.
+'''
+import mmap
+import os
+import struct
+
+from nse.search import edit_distance
+
+MAGIC = 'NSESYM01'
+# magic, width and count of the codes, width and count of the fields
+HEADER = struct.Struct('<8sIIII')
+
+
+class Section(object):
+    ''' sorted fixed width records of the mapped index '''
+    __slots__ = ('map', 'offset', 'width', 'count')
+
+    def __init__(self, map, offset, width, count):
+        self.map = map
+        self.offset = offset
+        self.width = width
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+        start = self.offset + idx * self.width
+        return self.map[start:start + self.width].rstrip('\0')
+
+    def __iter__(self):
+        for idx in xrange(self.count):
+            yield self[idx]
+
+    def bisect(self, key):
+        ''' returns the index of the first record not less than key '''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def __contains__(self, key):
+        idx = self.bisect(key)
+        return idx < self.count and self[idx] == key
+
+    def prefixed(self, prefix):
+        ''' yields the records starting with prefix in order '''
+        for idx in xrange(self.bisect(prefix), self.count):
+            record = self[idx]
+            if not record.startswith(prefix):
+                break
+            yield record
+
+
+class SymbolIndex(object):
+    ''' read only view of an index file, raises IOError when it is
+    missing and ValueError when it is not an index
+    '''
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error):
+                raise ValueError('%s is not a symbol index' % path)
+        if len(self.map) < HEADER.size:
+            raise ValueError('%s is not a symbol index' % path)
+        magic, code_width, codes, field_width, fields = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError('%s is not a symbol index' % path)
+        self.codes = Section(self.map, HEADER.size, code_width, codes)
+        self.fields = Section(self.map, HEADER.size + code_width * codes,
+                              field_width, fields)
+
+    def has_code(self, code):
+        return code.upper().encode('utf-8') in self.codes
+
+    def complete_code(self, prefix):
+        ''' returns the codes starting with prefix, in any case '''
+        return list(self.codes.prefixed(prefix.upper().encode('utf-8')))
+
+    def complete_field(self, prefix):
+        ''' returns the display fields starting with prefix, in any case.
+        fields are camel case and few, so they are simply scanned
+        '''
+        prefix = prefix.lower()
+        return [field for field in self.fields if field.lower().startswith(prefix)]
+
+    def close_codes(self, code, distance=1):
+        ''' returns the codes within the edit distance of code '''
+        code = code.upper().encode('utf-8')
+        return [c for c in self.codes if abs(len(c) - len(code)) <= distance and
+                edit_distance(c, code) <= distance]
+
+    def correct(self, code):
+        ''' returns the stock code meant by code: itself in upper case when
+        it is known, the only code a single typo away from it, or None
+        '''
+        if self.has_code(code):
+            return code.upper()
+        close = self.close_codes(code)
+        if len(close) == 1:
+            return close[0]
+        return None
+
+    def close(self):
+        self.map.close()
+
+
+def write_index(path, codes, fields):
+    ''' writes the index of the codes and fields to path, replacing the
+    previous one at once so that readers never map a partial file
+    '''
+    sections = []
+    for names in (codes, fields):
+        names = sorted(set(name.encode('utf-8') if isinstance(name, unicode)
+                           else name for name in names))
+        sections.append((max(len(name) for name in names) if names else 0, names))
+    (code_width, codes), (field_width, fields) = sections
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, code_width, len(codes), field_width, len(fields)))
+        for width, names in sections:
+            f.write(''.join(name.ljust(width, '\0') for name in names))
+    os.rename(tmp, path)
@@ -0,0 +1,105 @@
+''' client side protection of nseindia.com: a token bucket rate limiter,
+jittered exponential backoff for retries and a circuit breaker. NseDriver
+shares one of each between all its threads and request paths.
+'''
+import logging
+import random
+import threading
+import time
+
+from nse.quote import QuoteError
+
+
+class CircuitOpenError(QuoteError):
+    ''' raised instead of sending a request while the circuit is open '''
+    pass
+
+
+class TokenBucket(object):
+    ''' allows rate requests per second on average with bursts of up to
+    burst requests. acquire() blocks until a token is available
+    '''
+    def __init__(self, rate, burst=1, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def acquire(self):
+        ''' takes a token, returns the number of seconds waited for it '''
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # the token is taken right away, callers queue up behind it
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class Backoff(object):
+    ''' exponential backoff with full jitter, delay(n) is a random time up
+    to base * 2 ** n seconds, capped at cap
+    '''
+    def __init__(self, retries=3, base=0.5, cap=8.0, rand=random.random):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+        self.rand = rand
+
+    def delay(self, attempt):
+        return self.rand() * min(self.cap, self.base * 2 ** attempt)
+
+
+class CircuitBreaker(object):
+    ''' stops requests for cooldown seconds after threshold failures in a
+    row. after the cooldown a single trial request is let through, its
+    outcome closes the circuit again or reopens it
+    '''
+    def __init__(self, threshold=5, cooldown=30.0, clock=time.time):
+        self.log = logging.getLogger('CircuitBreaker')
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+
+    def before(self):
+        ''' raises CircuitOpenError when requests must not be sent '''
+        if self.threshold <= 0:
+            return
+        with self.lock:
+            if self.opened is None:
+                return
+            if self.clock() - self.opened < self.cooldown or self.trial:
+                raise CircuitOpenError('too many failures, not contacting the '
+                                       'server for %ds' % self.cooldown)
+            self.trial = True
+
+    def success(self):
+        with self.lock:
+            if self.opened is not None:
+                self.log.info('server is back, closing the circuit')
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or (self.opened is None and
+                              self.failures >= self.threshold > 0):
+                self.log.warning('opening the circuit after %d failures',
+                                 self.failures)
+                self.opened = self.clock()
+            self.trial = False
@@ -0,0 +1,253 @@
+''' http transport with persistent connections used by NseDriver, and
+the handlers recording its responses to an archive and replaying them
+'''
+from urllib2 import URLError
+import urllib2
+import urllib
+import hashlib
+import httplib
+import json
+import logging
+import random
+import socket
+import threading
+import time
+import urlparse
+import zipfile
+from cStringIO import StringIO
+
+from nse.metrics import count, span
+
+
+class ConnectionPool(object):
+    ''' keeps idle HTTP/1.1 connections around per host so that repeated
+    requests skip the TCP and DNS handshake. It is shared by all the threads
+    of NseDriver and counts new vs. reused connections.
+    '''
+    def __init__(self, maxsize=4, timeout=10):
+        self.log = logging.getLogger('ConnectionPool')
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    def get(self, host):
+        ''' returns a (connection, reused) tuple for the host '''
+        with self.lock:
+            conns = self.idle.get(host)
+            if conns:
+                self.reused_connections += 1
+                return conns.pop(), True
+        return self.connect(host), False
+
+    def connect(self, host):
+        ''' returns a brand new connection to the host '''
+        with self.lock:
+            self.new_connections += 1
+        self.log.debug('opening new connection to %s', host)
+        return httplib.HTTPConnection(host, timeout=self.timeout)
+
+    def put(self, host, conn):
+        ''' hands a connection back to the pool for later reuse '''
+        with self.lock:
+            conns = self.idle.setdefault(host, [])
+            if len(conns) < self.maxsize:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        ''' closes all the idle connections '''
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def stats(self):
+        ''' returns the connection counters as a dict '''
+        with self.lock:
+            return {'new': self.new_connections,
+                    'reused': self.reused_connections,
+                    'idle': sum(len(c) for c in self.idle.values())}
+
+
+class KeepAliveHandler(urllib2.HTTPHandler):
+    ''' urllib2 handler which sends http requests over the persistent
+    connections of a ConnectionPool instead of one connection per request
+    '''
+    def __init__(self, pool):
+        urllib2.HTTPHandler.__init__(self)
+        self.pool = pool
+
+    def http_open(self, req):
+        host = req.get_host()
+        if not host:
+            raise URLError('no host given')
+        headers = dict(self.parent.addheaders)
+        headers.update(req.headers)
+        headers.update(req.unredirected_hdrs)
+        headers['Connection'] = 'keep-alive'
+
+        conn, reused = self.pool.get(host)
+        try:
+            res, body = self._request(conn, req, headers)
+        except (httplib.HTTPException, socket.error), err:
+            conn.close()
+            if not reused:
+                raise URLError(err)
+            # the server dropped the idle connection, retry on a fresh one
+            conn = self.pool.connect(host)
+            try:
+                res, body = self._request(conn, req, headers)
+            except (httplib.HTTPException, socket.error), err:
+                conn.close()
+                raise URLError(err)
+
+        if res.will_close:
+            conn.close()
+        else:
+            self.pool.put(host, conn)
+        resp = urllib.addinfourl(StringIO(body), res.msg,
+                                 req.get_full_url(), res.status)
+        resp.msg = res.reason
+        return resp
+
+    def _request(self, conn, req, headers):
+        ''' sends the request and reads the whole body, so that the
+        connection is free to be reused afterwards
+        '''
+        if conn.sock is None:
+            self._connect(conn)
+        with span('http.request'):
+            conn.request(req.get_method(), req.get_selector(), req.data, headers)
+            res = conn.getresponse()
+        with span('http.read'):
+            return res, res.read()
+
+    def _connect(self, conn):
+        ''' resolves and connects a new connection, trying every address
+        of the host in turn, IPv4 or IPv6
+        '''
+        with span('http.connect'):
+            conn.sock = socket.create_connection((conn.host, conn.port), conn.timeout)
+        count('http.connections')
+
+
+class Archive(object):
+    ''' http responses recorded in a zip file. every response is an entry
+    named after the sha1 of the path and query of its url, so that the host
+    does not matter, and a sequence number, holding a json
+    line with the url, status, reason and raw headers followed by the body
+    '''
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.zip = zipfile.ZipFile(path, mode, zipfile.ZIP_DEFLATED)
+        self.counts = {}
+        for name in self.zip.namelist():
+            key = name.split('/')[0]
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    @staticmethod
+    def key(url):
+        parts = urlparse.urlsplit(url)
+        return hashlib.sha1('%s?%s' % (parts.path, parts.query)).hexdigest()
+
+    def add(self, url, status, reason, headers, body):
+        ''' appends a response, safe to call from several threads '''
+        meta = json.dumps({'url': url, 'status': status, 'reason': reason,
+                           'headers': headers})
+        with self.lock:
+            key = self.key(url)
+            seq = self.counts.get(key, 0)
+            self.counts[key] = seq + 1
+            self.zip.writestr('%s/%06d' % (key, seq), '%s\n%s' % (meta, body))
+
+    def load(self):
+        ''' returns a dict of url key to the list of recorded (meta, body)
+        responses in the order they were recorded
+        '''
+        responses = {}
+        with self.lock:
+            for name in sorted(self.zip.namelist()):
+                meta, body = self.zip.read(name).split('\n', 1)
+                responses.setdefault(name.split('/')[0], []).append(
+                    (json.loads(meta), body))
+        return responses
+
+    def urls(self):
+        ''' returns the urls of the recorded responses '''
+        return sorted(set(meta['url'] for responses in self.load().itervalues()
+                          for meta, body in responses))
+
+    def close(self):
+        with self.lock:
+            self.zip.close()
+
+
+class RecordingHandler(urllib2.HTTPHandler):
+    ''' urllib2 handler passing the requests to another handler, usually a
+    KeepAliveHandler, and saving every response to an Archive
+    '''
+    def __init__(self, handler, archive):
+        urllib2.HTTPHandler.__init__(self)
+        self.handler = handler
+        self.archive = archive
+
+    def add_parent(self, parent):
+        urllib2.HTTPHandler.add_parent(self, parent)
+        self.handler.add_parent(parent)
+
+    def http_open(self, req):
+        res = self.handler.http_open(req)
+        body = res.read()
+        url = req.get_full_url()
+        self.archive.add(url, res.code, res.msg, str(res.info()), body)
+        resp = urllib.addinfourl(StringIO(body), res.info(), url, res.code)
+        resp.msg = res.msg
+        return resp
+
+
+class ReplayHandler(urllib2.HTTPHandler):
+    ''' urllib2 handler answering requests with the responses of an
+    Archive after latency seconds plus up to jitter seconds. the responses
+    recorded for a url are served in turn, starting over after the last
+    one, urls which were not recorded get a 404
+    '''
+    def __init__(self, archive, latency=0, jitter=0, sleep=time.sleep,
+                 rand=random.random):
+        urllib2.HTTPHandler.__init__(self)
+        self.log = logging.getLogger('ReplayHandler')
+        self.responses = archive.load()
+        self.latency = latency
+        self.jitter = jitter
+        self.sleep = sleep
+        self.rand = rand
+        self.lock = threading.Lock()
+        self.served = {}
+
+    def http_open(self, req):
+        url = req.get_full_url()
+        key = Archive.key(url)
+        responses = self.responses.get(key)
+        delay = self.latency + self.jitter * self.rand()
+        if delay > 0:
+            self.sleep(delay)
+        if not responses:
+            self.log.debug('%s was not recorded', url)
+            resp = urllib.addinfourl(StringIO(''), httplib.HTTPMessage(StringIO('')),
+                                     url, 404)
+            resp.msg = 'Not Found'
+            return resp
+        with self.lock:
+            served = self.served.get(key, 0)
+            self.served[key] = served + 1
+        meta, body = responses[served % len(responses)]
+        resp = urllib.addinfourl(StringIO(body),
+                                 httplib.HTTPMessage(StringIO(meta['headers'])),
+                                 url, meta['status'])
+        resp.msg = meta['reason']
+        return resp
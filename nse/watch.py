@@ -0,0 +1,61 @@
+''' the -watch mode '''
+import logging
+import time
+
+from nse.metrics import span
+from nse.quote import InvalidCodeError
+
+
+class NseWatcher(object):
+    ''' polls quotes for a list of codes on a schedule and redraws them in
+    place. One NseDriver and NseDisplay are reused for the whole session.
+    The interval backs off when the server is slow or failing and comes
+    back to the requested interval once it recovers. The view is 'quotes'
+    for the display fields, 'depth' for the order books or 'portfolio'.
+    '''
+    def __init__(self, nse, disp, interval=2, max_interval=60,
+                 clock=time.time, sleep=time.sleep, view='quotes'):
+        self.log = logging.getLogger('NseWatcher')
+        self.nse = nse
+        self.disp = disp
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.current_interval = interval
+        self.clock = clock
+        self.sleep = sleep
+        if view == 'quotes':
+            self.start, self.update = disp.start_watch, disp.update_watch
+        else:
+            self.start = getattr(disp, 'start_%s_watch' % view)
+            self.update = getattr(disp, 'update_%s_watch' % view)
+
+    def run(self, codes, ticks=None):
+        ''' watches the codes until interrupted, or for the given number of
+        ticks
+        '''
+        self.start(codes)
+        tick = 0
+        while ticks is None or tick < ticks:
+            started = self.clock()
+            with span('watch.fetch'):
+                results = self.nse.get_quotes(codes)
+            elapsed = self.clock() - started
+            self.update(results)
+            failed = any(error is not None and
+                         not isinstance(error, InvalidCodeError)
+                         for code, quote, error in results)
+            self.current_interval = self.next_interval(elapsed, failed)
+            tick += 1
+            if ticks is None or tick < ticks:
+                self.sleep(max(0, self.current_interval - elapsed))
+
+    def next_interval(self, elapsed, failed):
+        ''' doubles the interval when a tick took more than half of it or
+        failed, otherwise halves it back towards the requested interval
+        '''
+        if failed or elapsed > self.current_interval / 2.0:
+            interval = min(self.current_interval * 2, self.max_interval)
+            if interval != self.current_interval:
+                self.log.debug('server is slow, backing off to %ss', interval)
+            return interval
+        return max(self.current_interval / 2.0, self.interval)
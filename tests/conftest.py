@@ -0,0 +1,177 @@
+''' fixtures shared by the tests: a scratch database, a local stand in for
+the GetQuote.jsp endpoint of nseindia.com and a fake clock
+'''
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import json
+import os
+import sys
+import threading
+import time
+import urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nse.db import DB
+from nse.driver import NseDriver
+
+STOCKS = ('SYMBOL,NAME OF COMPANY\nINFY,Infosys Limited\n'
+          'TCS,Tata Consultancy Services Limited\n'
+          'RELIANCE,Reliance Industries Limited\n')
+
+
+def quote_body(symbol, price='1,234.50'):
+    ''' a GetQuote.jsp response holding one quote, or none for symbol None '''
+    data = [] if symbol is None else [{'symbol': symbol, 'lastPrice': price,
+                                       'pChange': '0.98'}]
+    return ('<html><body>\n<div id="responseDiv" style="display:none">\n%s\n'
+            '</div></body></html>' % json.dumps({'data': data}))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    ''' answers every GET with a quote of its symbol argument, symbols
+    starting with BAD get a response without quote. /EQUITY_L.csv serves
+    the stocks of the server with an ETag, or the status of EQUITY_L.csv
+    in statuses
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if self.path.startswith('/EQUITY_L.csv'):
+            return self.send_stocks()
+        symbol = urlparse.parse_qs(urlparse.urlparse(self.path).query).get(
+            'symbol', [''])[0]
+        server.started(self.client_address)
+        try:
+            time.sleep(server.delays.get(symbol, server.delay))
+            status = server.statuses.get(symbol, 200)
+            if symbol.startswith('BAD'):
+                body = quote_body(None)
+            else:
+                body = quote_body(symbol, server.prices.get(symbol, '1,234.50'))
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            if server.close:
+                self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(body)
+            # drop_idle closes the connection without telling the client
+            if server.close or server.drop_idle:
+                self.close_connection = 1
+        finally:
+            server.finished()
+
+    def send_stocks(self):
+        server = self.server
+        server.started(self.client_address)
+        etag = '"%x"' % (hash(server.stocks) & 0xffffffff)
+        status = server.statuses.get('EQUITY_L.csv', 200)
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.headers.getheader('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(server.stocks)))
+            self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(server.stocks)
+        server.finished()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    ''' GetQuote.jsp on a free port of localhost. delays, statuses and
+    prices are per symbol, requests, clients and max_in_flight tell what
+    the server saw
+    '''
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.url = 'http://127.0.0.1:%d' % self.server_address[1]
+        self.delay = 0
+        self.delays = {}
+        self.statuses = {}
+        self.prices = {}
+        self.stocks = STOCKS
+        self.close = False
+        self.drop_idle = False
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.clients = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def started(self, client):
+        with self.lock:
+            self.requests += 1
+            self.clients.add(client)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+class FakeClock(object):
+    ''' time() and sleep() of a clock which only moves when slept on '''
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def db(tmpdir):
+    ''' a database knowing INFY, TCS and RELIANCE, without rate limit '''
+    db = DB(str(tmpdir.join('nse.db')))
+    db.bootstrap()
+    db.create_stocks_table(STOCKS)
+    db.update_config_setting('RATE_LIMIT', '0')
+    yield db
+    db.db.close()
+
+
+@pytest.fixture
+def driver(db, stub):
+    ''' an NseDriver fetching from the stub, retrying without sleeping '''
+    nse = NseDriver(db)
+    nse.baseurl = stub.url + '/GetQuote.jsp?'
+    nse.code_csv_url = stub.url + '/EQUITY_L.csv'
+    nse.sleep = lambda seconds: None
+    return nse
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,117 @@
+''' alert rules: parsing, threshold ladders and hysteresis '''
+from cStringIO import StringIO
+
+import pytest
+
+from nse.alerts import AlertEngine, ExecSink, Rule
+from nse.quote import Quote
+
+
+def engine(*rules, **kwargs):
+    rows = [(idx, None, text, None) for idx, text in enumerate(rules)]
+    return AlertEngine(rows, out=StringIO(), **kwargs)
+
+
+def fire(alerts, price, code='INFY'):
+    ''' feeds a quote, returns the ids of the rules which fired '''
+    quote = Quote({'symbol': code, 'lastPrice': str(price)})
+    return sorted(alert['id'] for alert in alerts.on_quote(code, quote, 1000.0))
+
+
+def test_parse():
+    rule = Rule.parse('INFY lastPrice > 1800')
+    assert (rule.symbol, rule.left, rule.op, rule.right) == ('INFY', 'lastPrice', '>', 1800)
+    rule = Rule.parse('pChange < -3')
+    assert (rule.symbol, rule.left, rule.op, rule.right) == (None, 'pChange', '<', -3)
+    rule = Rule.parse('infy price crosses above SMA20')
+    assert (rule.symbol, rule.left, rule.op, rule.right) == \
+        ('INFY', 'lastPrice', 'crosses_above', 'sma20')
+
+
+def test_parse_flips_a_number_on_the_left():
+    rule = Rule.parse('INFY 1800 < price')
+    assert (rule.left, rule.op, rule.right) == ('lastPrice', '>', 1800)
+    assert rule.is_threshold()
+
+
+@pytest.mark.parametrize('text', ['INFY price', 'price > 1 > 2', '1 < 2',
+                                  '1800 crosses price', 'A B price > 1'])
+def test_parse_rejects(text):
+    with pytest.raises(ValueError):
+        Rule.parse(text)
+
+
+def test_fires_once_and_rearms_beyond_the_band():
+    alerts = engine('price > 1800')
+    assert fire(alerts, 1801) == [0]
+    assert fire(alerts, 1805) == []
+    # back under the threshold but within the 0.5% band
+    assert fire(alerts, 1795) == []
+    assert fire(alerts, 1801) == []
+    assert fire(alerts, 1790) == []
+    assert fire(alerts, 1801) == [0]
+
+
+def test_flipped_operands_behave_the_same():
+    alerts = engine('1800 < price', 'price > 1800')
+    assert fire(alerts, 1700) == []
+    assert fire(alerts, 1801) == [0, 1]
+    assert fire(alerts, 1790) == []
+    assert fire(alerts, 1850) == [0, 1]
+
+
+def test_many_thresholds_on_one_symbol():
+    alerts = engine('price > 100', 'price > 200', 'price > 300', 'price < 50',
+                    'price <= 150')
+    assert fire(alerts, 250) == [0, 1]
+    assert fire(alerts, 350) == [2]
+    assert fire(alerts, 120) == [4]
+    assert fire(alerts, 40) == [3]
+    # every rule above was re-armed on the way down
+    assert fire(alerts, 350) == [0, 1, 2]
+    # the rules of another symbol have their own state
+    assert fire(alerts, 350, code='TCS') == [0, 1, 2]
+
+
+def test_crossings():
+    alerts = engine('price crosses 100', 'price crosses_above 100')
+    assert fire(alerts, 95) == []
+    assert fire(alerts, 105) == [0, 1]
+    assert fire(alerts, 100.2) == []
+    assert fire(alerts, 99) == [0]
+    assert fire(alerts, 101) == [0, 1]
+
+
+def test_states_are_saved_and_restored():
+    saved = []
+    alerts = engine('price > 1800', store=saved.extend)
+    fire(alerts, 1801)
+    assert saved == [(0, 'INFY', False, None)]
+    # a new session starts with the rule disarmed
+    states = dict(((id, code), (armed, side)) for id, code, armed, side in saved)
+    alerts = engine('price > 1800', states=states)
+    assert fire(alerts, 1850) == []
+    assert fire(alerts, 1700) == []
+    assert fire(alerts, 1850) == [0]
+
+
+def test_alerts_go_to_the_sink():
+    out = StringIO()
+    alerts = AlertEngine([(7, 'INFY', 'INFY price > 1800', None)], out=out)
+    assert fire(alerts, 1801, code='TCS') == []
+    assert fire(alerts, 1801) == [7]
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 1 and lines[0].startswith('ALERT ')
+    assert lines[0].endswith(' INFY price > 1800 (1801)')
+
+
+def test_exec_sink_reaps_the_commands_which_exited(tmpdir):
+    path = tmpdir.join('alerts')
+    sink = ExecSink('sh -c \'echo "$NSE_ALERT_CODE $0" >> %s\'' % path)
+    sink({'code': 'INFY', 'message': 'first'})
+    first = sink.running[0]
+    first.wait()
+    sink({'code': 'TCS', 'message': 'second'})
+    assert sink.running[0] is not first and len(sink.running) == 1
+    sink.running[0].wait()
+    assert path.read().splitlines() == ['INFY first', 'TCS second']
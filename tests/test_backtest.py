@@ -0,0 +1,142 @@
+''' vectorized backtests against plain per bar loops '''
+from array import array
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from nse.backtest import (Panel, Result, breakout, parse_grid, rolling_extreme,
+                          rolling_mean, rolling_std, run, sweep)
+from nse.history import HistoryStore
+
+
+@pytest.fixture
+def panel():
+    ''' 60 days of 3 random walks, the second starting late and the third
+    missing a few days
+    '''
+    rand = numpy.random.RandomState(7)
+    close = 100 * numpy.exp(numpy.cumsum(rand.normal(0, 0.02, (60, 3)), axis=0))
+    close[:12, 1] = numpy.nan
+    close[30:33, 2] = numpy.nan
+    return Panel(numpy.arange(60) * 86400.0, ['INFY', 'TCS', 'WIPRO'], close)
+
+
+def windows(values, n):
+    ''' yields (row, column, window) for every complete window of n rows '''
+    for col in range(values.shape[1]):
+        for row in range(values.shape[0]):
+            if row >= n - 1:
+                window = values[row - n + 1:row + 1, col]
+                if not numpy.isnan(window).any():
+                    yield row, col, list(window)
+
+
+def reference(values, n, fn):
+    expected = numpy.full(values.shape, numpy.nan)
+    for row, col, window in windows(values, n):
+        expected[row, col] = fn(window)
+    return expected
+
+
+def mean(window):
+    return sum(window) / len(window)
+
+
+def std(window):
+    return (sum((x - mean(window)) ** 2 for x in window) / len(window)) ** 0.5
+
+
+@pytest.mark.parametrize('n', [1, 2, 5, 7, 60, 61])
+def test_rolling_windows(panel, n):
+    close = panel.close
+    numpy.testing.assert_allclose(rolling_mean(close, n), reference(close, n, mean))
+    # the variance comes from running sums of squares, which lose the last
+    # digits of a variance much smaller than the squared prices
+    numpy.testing.assert_allclose(rolling_std(close, n), reference(close, n, std),
+                                  rtol=1e-6, atol=1e-4)
+    numpy.testing.assert_array_equal(rolling_extreme(close, n), reference(close, n, max))
+    numpy.testing.assert_array_equal(rolling_extreme(close, n, maximum=False),
+                                     reference(close, n, min))
+
+
+def naive_result(close, positions, cost):
+    ''' the equity, drawdown and turnover of the positions, one bar at a time '''
+    days, width = close.shape
+    last = [None] * width
+    equity, peak = 1.0, 1.0
+    curve, drawdowns, turnovers = [], [], []
+    for day in range(days):
+        total = traded = 0.0
+        for col in range(width):
+            price = close[day, col]
+            previous = positions[day - 1, col] if day else 0.0
+            change = abs(positions[day, col] - previous)
+            ret = 0.0
+            if day and last[col] is not None and not numpy.isnan(price):
+                ret = price / last[col] - 1
+            total += previous * ret - cost * change
+            traded += change
+            if not numpy.isnan(price):
+                last[col] = price
+        equity *= 1 + total / width
+        peak = max(peak, equity)
+        curve.append(equity)
+        drawdowns.append(equity / peak - 1)
+        turnovers.append(traded / width)
+    return curve, drawdowns, turnovers
+
+
+@pytest.mark.parametrize('strategy', ['random', 'breakout'])
+def test_result_matches_the_per_bar_loop(panel, strategy):
+    if strategy == 'random':
+        positions = numpy.random.RandomState(3).randint(0, 2, panel.close.shape).astype('d')
+    else:
+        positions = breakout(panel.close, entry=5, exit=3)
+        assert positions.sum() > 0
+    result = Result(panel, positions, cost=0.001)
+    equity, drawdown, turnover = naive_result(panel.close, positions, 0.001)
+    numpy.testing.assert_allclose(result.equity, equity)
+    numpy.testing.assert_allclose(result.drawdown, drawdown, atol=1e-12)
+    numpy.testing.assert_allclose(result.turnover, turnover)
+    assert result.summary()['drawdown'] == pytest.approx(min(drawdown))
+
+
+def test_breakout_matches_the_per_bar_loop(panel):
+    close = panel.close
+    highs = reference(close, 5, max)
+    lows = reference(close, 3, min)
+    expected = numpy.zeros(close.shape)
+    for col in range(close.shape[1]):
+        held = 0.0
+        for day in range(1, len(close)):
+            if close[day, col] < lows[day - 1, col]:
+                held = 0.0
+            elif close[day, col] > highs[day - 1, col]:
+                held = 1.0
+            expected[day, col] = held
+    numpy.testing.assert_array_equal(breakout(close, entry=5, exit=3), expected)
+
+
+def test_sweep_over_a_two_point_grid(panel):
+    grid = parse_grid('sma_cross', ['fast=3,5', 'slow=10'])
+    assert grid == [{'fast': 3, 'slow': 10}, {'fast': 5, 'slow': 10}]
+    swept = sweep(panel, 'sma_cross', grid, processes=2)
+    assert [params for params, summary in swept] == grid
+    for params, summary in swept:
+        expected = run(panel, 'sma_cross', params).summary()
+        assert sorted(summary) == sorted(expected)
+        for key in expected:
+            assert summary[key] == pytest.approx(expected[key], nan_ok=True)
+    with pytest.raises(ValueError):
+        parse_grid('sma_cross', ['fast=0'])
+
+
+def test_panel_load_aligns_the_days(tmpdir):
+    store = HistoryStore(str(tmpdir), ('TIME', 'closePrice'))
+    store.merge('INFY', {'TIME': array('d', [1, 2, 3]), 'closePrice': array('d', [10, 11, 12])})
+    store.merge('TCS', {'TIME': array('d', [2, 4]), 'closePrice': array('d', [20, 21])})
+    panel = Panel.load(store)
+    assert list(panel.dates) == [1, 2, 3, 4] and panel.symbols == ['INFY', 'TCS']
+    numpy.testing.assert_array_equal(panel.close, [[10, numpy.nan], [11, 20],
+                                                   [12, numpy.nan], [numpy.nan, 21]])
@@ -0,0 +1,80 @@
+''' nse.cli.main over a temp database and recorded responses '''
+import json
+import logging
+import socket
+
+import pytest
+
+from nse import cli
+from nse.driver import NseDriver
+from nse.transport import Archive
+
+from conftest import quote_body
+
+
+def replay_archive(db, tmpdir, *codes):
+    path = str(tmpdir.join('quotes.zip'))
+    archive = Archive(path, 'w')
+    for code in codes:
+        archive.add(NseDriver(db).build_url(code), 200, 'OK',
+                    'Content-Type: text/html\r\n', quote_body(code))
+    archive.close()
+    return path
+
+
+def test_connection_stats_are_only_asked_for_debug(db, tmpdir, monkeypatch, capsys):
+    calls = []
+    monkeypatch.setattr(NseDriver, 'connection_stats', lambda self: calls.append(1))
+    argv = ['-db', db.db_path, '-replay', replay_archive(db, tmpdir, 'INFY'), 'INFY']
+    cli.main(argv)
+    assert calls == [] and 'lastPrice : 1,234.50' in capsys.readouterr()[0]
+    monkeypatch.setattr(logging.getLogger('NseCli'), 'level', logging.DEBUG)
+    cli.main(argv)
+    assert calls == [1]
+
+
+def test_serve_on_a_port_in_use(db, capsys):
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    with pytest.raises(SystemExit) as exit:
+        cli.main(['-db', db.db_path, '-serve', '-port', str(port)])
+    listener.close()
+    assert exit.value.code == 1
+    assert 'port %d is already in use' % port in capsys.readouterr()[1]
+
+
+def test_unknown_and_corrected_codes_are_reported_in_place(db, tmpdir, capsys):
+    archive = replay_archive(db, tmpdir, 'INFY', 'TCS')
+    cli.main(['-db', db.db_path, '-replay', archive, 'TCZ', 'WIPRO', 'INFY', 'INFYY'])
+    out, err = capsys.readouterr()
+    blocks = out.split('\n\n')
+    assert [block.split('\n')[0] for block in blocks] == ['[TCS]', '[WIPRO]', '[INFY]']
+    assert blocks[0].split('\n')[1] == '"TCZ" is not a stock code, using TCS'
+    assert blocks[1].split('\n')[1] == '"WIPRO" is invalid stock code'
+    assert 'lastPrice : 1,234.50' in blocks[2] and err == ''
+
+
+def test_batch_records_follow_the_input(db, tmpdir, capsys):
+    codes = tmpdir.join('codes')
+    codes.write('WIPRO TCZ\nINFYY # a comment\nINFY ZZ\n')
+    cli.main(['-db', db.db_path, '-replay', replay_archive(db, tmpdir, 'INFY', 'TCS'),
+              '-batch', str(codes)])
+    records = [json.loads(line) for line in capsys.readouterr()[0].splitlines()]
+    assert [record['symbol'] for record in records] == ['WIPRO', 'TCS', 'INFY', 'ZZ']
+    assert [record.get('error') for record in records] == \
+        ['invalid stock code', None, None, 'invalid stock code']
+
+
+def test_failed_symbol_downloads_exit_non_zero(db, tmpdir, capsys):
+    # nothing recorded, the replay answers 404
+    archive = replay_archive(db, tmpdir)
+    with pytest.raises(SystemExit) as exit:
+        cli.main(['-db', db.db_path, '-replay', archive, '-refresh_symbols'])
+    assert exit.value.code == 1
+    assert 'unable to refresh the stock codes: ' in capsys.readouterr()[1]
+    with pytest.raises(SystemExit) as exit:
+        cli.main(['-db', str(tmpdir.join('new.db')), '-replay', archive, 'INFY'])
+    assert exit.value.code == 1
+    assert 'unable to download the stock codes: ' in capsys.readouterr()[1]
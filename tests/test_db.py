@@ -0,0 +1,92 @@
+''' nse.db: the in memory config table, schema migrations and concurrent
+processes
+'''
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from nse.bench import stress_worker
+from nse.db import DB, SCHEMA_VERSION
+
+
+def test_config_is_written_through(db):
+    db.update_config_setting('DISPLAY_FIELDS', 'lastPrice open')
+    assert db.get_config_setting('DISPLAY_FIELDS') == ['lastPrice', 'open']
+    # callers may change the list they get
+    db.get_config_setting('DISPLAY_FIELDS').append('close')
+    assert db.get_config_setting('DISPLAY_FIELDS') == ['lastPrice', 'open']
+
+
+def test_config_is_reloaded_after_another_connection_changed_it(db):
+    assert db.get_config_setting('QUOTE_TTL') == ['5']
+    other = DB(db.db_path)
+    other.update_config_setting('QUOTE_TTL', '30')
+    other.db.close()
+    assert db.get_config_setting('QUOTE_TTL') == ['30']
+
+
+def test_unknown_setting_is_not_cached(db):
+    db.load_config()
+    db.update_config_setting('NO_SUCH_SETTING', 'value')
+    assert 'NO_SUCH_SETTING' not in db.config
+    assert db.db.execute("SELECT COUNT(*) FROM CONFIG WHERE SETTING = 'NO_SUCH_SETTING'"
+                         ).fetchone() == (0,)
+
+
+def test_config_is_not_reloaded_without_changes(db):
+    db.load_config()
+    loaded = db.config
+    db.get_config_setting('QUOTE_TTL')
+    assert db.config is loaded
+    # our own writes don't invalidate it either
+    db.update_config_setting('QUOTE_TTL', '7')
+    db.get_config_setting('QUOTE_TTL')
+    assert db.config is loaded and db.config['QUOTE_TTL'] == ['7']
+
+
+def test_migrate_makes_config_settings_unique(tmpdir, db):
+    path = str(tmpdir.join('old.db'))
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE STOCKS (ID INTEGER PRIMARY KEY AUTOINCREMENT,'
+                 ' CODE TEXT, NAME TEXT)')
+    conn.execute('CREATE TABLE CONFIG (ID INTEGER PRIMARY KEY AUTOINCREMENT,'
+                 ' SETTING TEXT, VALUE TEXT)')
+    conn.executemany('INSERT INTO CONFIG (SETTING, VALUE) VALUES(?, ?)',
+                     db.db.execute('SELECT SETTING, VALUE FROM CONFIG'))
+    conn.execute("INSERT INTO CONFIG (SETTING, VALUE) VALUES('DISPLAY_FIELDS', 'open')")
+    conn.commit()
+    conn.close()
+    old = DB(path)
+    old.migrate()
+    rows = old.db.execute("SELECT VALUE FROM CONFIG WHERE SETTING = 'DISPLAY_FIELDS'")
+    # the latest of the duplicated rows is kept
+    assert rows.fetchall() == [('open',)]
+    assert old.get_config_setting('DISPLAY_FIELDS') == ['open']
+    old.db.close()
+
+
+@pytest.mark.parametrize('wal', [True, False])
+def test_concurrent_processes_bootstrap_and_share_the_database(tmpdir, wal):
+    db_path = str(tmpdir.join('nse.db'))
+    results = multiprocessing.Queue()
+    # all of them find a new database and bootstrap it at once
+    workers = [multiprocessing.Process(target=stress_worker,
+                                       args=(db_path, 200, wal, seed, results))
+               for seed in range(8)]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=120) for worker in workers]
+    for worker in workers:
+        worker.join()
+    assert [(done, errors) for done, seconds, errors in outcomes] == [(200, 0)] * 8
+
+    db = DB(db_path, wal=wal)
+    assert db.db.execute('PRAGMA journal_mode').fetchone()[0] == ('wal' if wal else 'delete')
+    assert db.schema_version() == SCHEMA_VERSION
+    rows = db.db.execute('SELECT SETTING FROM CONFIG GROUP BY SETTING HAVING COUNT(*) > 1')
+    assert rows.fetchall() == []
+    with pytest.raises(sqlite3.IntegrityError):
+        db.db.execute("INSERT INTO CONFIG (SETTING, VALUE) VALUES('QUOTE_TTL', '1')")
+    assert 1 <= int(db.get_config_setting('QUOTE_TTL')[0]) <= 10
+    db.db.close()
@@ -0,0 +1,41 @@
+''' output of NseDisplay '''
+from cStringIO import StringIO
+import json
+
+from nse.display import NseDisplay
+from nse.quote import InvalidCodeError, Quote, QuoteError
+
+RESULTS = [('INFY', Quote({'symbol': 'INFY', 'lastPrice': '1,234.50',
+                           'pChange': '0.98'}), None),
+           ('BADCODE', None, InvalidCodeError('BADCODE')),
+           ('TCS', None, QuoteError('timed out'))]
+
+
+def test_write_batch_ndjson(db):
+    db.update_config_setting('DISPLAY_FIELDS', 'lastPrice pChange')
+    out = StringIO()
+    NseDisplay(db, out=out).write_batch(iter(RESULTS))
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert rows == [{'symbol': 'INFY', 'lastPrice': '1,234.50', 'pChange': '0.98'},
+                    {'symbol': 'BADCODE', 'error': 'invalid stock code'},
+                    {'symbol': 'TCS', 'error': 'timed out'}]
+
+
+def test_write_batch_csv(db):
+    db.update_config_setting('DISPLAY_FIELDS', 'lastPrice pChange')
+    out = StringIO()
+    NseDisplay(db, out=out).write_batch(iter(RESULTS), 'csv')
+    assert out.getvalue().splitlines() == [
+        'symbol,lastPrice,pChange,error', 'INFY,"1,234.50",0.98,',
+        'BADCODE,,,invalid stock code', 'TCS,,,timed out']
+
+
+def test_write_batch_csv_keeps_non_ascii_values(db):
+    db.update_config_setting('DISPLAY_FIELDS', 'companyName lastPrice')
+    out = StringIO()
+    results = [('NESTLE', Quote({'companyName': 'Nestl\xc3\xa9 India', 'lastPrice': '1.00'}),
+                None),
+               (u'INFY', Quote({'companyName': u'Infosys \u20b9', 'lastPrice': u'2.00'}), None)]
+    NseDisplay(db, out=out).write_batch(iter(results), 'csv')
+    assert out.getvalue().splitlines()[1:] == [
+        'NESTLE,Nestl\xc3\xa9 India,1.00,', 'INFY,Infosys \xe2\x82\xb9,2.00,']
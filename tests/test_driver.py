@@ -0,0 +1,91 @@
+''' concurrent fetching of quotes by NseDriver '''
+import time
+
+from nse.quote import InvalidCodeError, QuoteError
+
+
+def test_get_quotes_keeps_input_order(driver, stub):
+    # the first codes are the slowest to answer
+    stub.delays = {'INFY': 0.3, 'TCS': 0.2, 'RELIANCE': 0.1}
+    results = driver.get_quotes(['INFY', 'TCS', 'RELIANCE', 'WIPRO'])
+    assert [code for code, quote, error in results] == ['INFY', 'TCS', 'RELIANCE', 'WIPRO']
+    assert [quote['symbol'] for code, quote, error in results] == \
+        ['INFY', 'TCS', 'RELIANCE', 'WIPRO']
+    assert all(error is None for code, quote, error in results)
+
+
+def test_get_quotes_fetches_concurrently(driver, stub):
+    stub.delay = 0.2
+    driver.get_quotes(['C%d' % idx for idx in range(6)])
+    assert stub.max_in_flight > 1
+    # the threads shared one opener and its connection pool
+    stats = driver.connection_stats()
+    assert stats['new'] + stats['reused'] == 6
+    assert stats['new'] == len(stub.clients)
+
+
+def test_workers_bound_requests_in_flight(driver, stub):
+    stub.delay = 0.1
+    driver.get_quotes(['C%d' % idx for idx in range(6)], workers=2)
+    assert stub.max_in_flight <= 2
+    assert stub.requests == 6
+
+
+def test_invalid_code_does_not_fail_the_others(driver):
+    results = driver.get_quotes(['INFY', 'BADCODE', 'TCS'])
+    assert results[0][1]['symbol'] == 'INFY'
+    assert results[1][1] is None
+    assert isinstance(results[1][2], InvalidCodeError)
+    assert results[2][1]['symbol'] == 'TCS'
+
+
+def test_server_error_does_not_fail_the_others(driver, stub):
+    stub.statuses = {'TCS': 500}
+    results = driver.get_quotes(['INFY', 'TCS', 'RELIANCE'])
+    code, quote, error = results[1]
+    assert quote is None
+    assert isinstance(error, QuoteError) and not isinstance(error, InvalidCodeError)
+    assert results[0][2] is None and results[2][2] is None
+
+
+def test_iter_quotes_yields_in_input_order(driver, stub):
+    stub.delays = {'C0': 0.2, 'C1': 0.1}
+    codes = ('C%d' % idx for idx in range(5))
+    results = list(driver.iter_quotes(codes, window=2))
+    assert [code for code, quote, error in results] == ['C%d' % idx for idx in range(5)]
+    assert all(quote['symbol'] == code for code, quote, error in results)
+
+
+def test_get_quotes_serves_the_cache_within_max_age(driver, stub):
+    driver.get_quotes(['INFY'])
+    requests = stub.requests
+    results = driver.get_quotes(['INFY', 'TCS'], max_age=60)
+    assert stub.requests == requests + 1
+    assert [quote['symbol'] for code, quote, error in results] == ['INFY', 'TCS']
+
+
+def test_expired_quotes_are_fetched_again(driver, stub, db):
+    db.cache_quote('INFY', {'symbol': 'INFY', 'lastPrice': '1.00'}, time.time() - 60)
+    results = driver.get_quotes(['INFY'], max_age=30)
+    assert stub.requests == 1
+    assert results[0][1]['lastPrice'] == '1,234.50'
+    # without max_age the cache is bypassed
+    driver.get_quotes(['INFY'])
+    assert stub.requests == 2
+
+
+def test_stale_quotes_are_served_and_refreshed_in_the_background(driver, stub, db):
+    db.cache_quote('INFY', {'symbol': 'INFY', 'lastPrice': '1.00'}, time.time() - 60)
+    stub.prices = {'INFY': '2.00'}
+    stub.delay = 0.2
+    started = time.time()
+    results = driver.get_quotes(['INFY'], max_age=30, stale=True)
+    assert time.time() - started < 0.2
+    assert results[0][1]['lastPrice'] == '1.00'
+    # the cache is only written from this thread, once the refresh is done
+    assert db.get_cached_quote('INFY')[0]['lastPrice'] == '1.00'
+    driver.wait_for_refresh()
+    quote, fetched = db.get_cached_quote('INFY')
+    assert quote['lastPrice'] == '2.00' and fetched >= started
+    assert driver.get_quotes(['INFY'], max_age=30)[0][1]['lastPrice'] == '2.00'
+    assert stub.requests == 1
@@ -0,0 +1,63 @@
+''' the indicator series against their incremental trackers '''
+import math
+import random
+
+import pytest
+
+from nse import indicators
+from nse.indicators import EMA, MACD, RSI, VWAP, is_indicator
+
+NAN = float('nan')
+
+
+@pytest.fixture
+def prices():
+    rand = random.Random(7)
+    values = [100.0]
+    for idx in range(2500):
+        values.append(values[-1] * (1 + rand.gauss(0, 0.02)))
+    return values
+
+
+def same(series, expected, tolerance=1e-7):
+    assert len(series) == len(expected)
+    for value, wanted in zip(series, expected):
+        if math.isnan(wanted):
+            assert math.isnan(value)
+        else:
+            assert abs(value - wanted) <= tolerance * max(1, abs(wanted))
+
+
+def test_zero_periods_are_not_indicators():
+    assert is_indicator('sma1') and is_indicator('ema200') and is_indicator('rsi14')
+    assert not is_indicator('sma0') and not is_indicator('rsi0')
+    assert not is_indicator('ema007')
+
+
+@pytest.mark.parametrize('n', [1, 2, 20, 200])
+def test_ema_and_rsi_match_the_trackers(prices, n):
+    if indicators._numpy() is None:
+        pytest.skip('numpy is not installed')
+    same(indicators.ema(prices, n), indicators._run(EMA(n), prices))
+    same(indicators.rsi(prices, n), indicators._run(RSI(n), prices))
+    # shorter than the period
+    same(indicators.ema(prices[:n - 1], n), [NAN] * (n - 1))
+
+
+def test_macd_matches_the_tracker(prices):
+    if indicators._numpy() is None:
+        pytest.skip('numpy is not installed')
+    rows = indicators._run(MACD(), prices)
+    for series, column in zip(indicators.macd(prices), zip(*rows)):
+        same(series, column)
+
+
+def test_vwap_keeps_its_value_over_ticks_without_volume():
+    prices = [10.0, 11.0, 12.0, 13.0, 9.0, 10.0]
+    volumes = [100.0, NAN, 300.0, NAN, 50.0, 150.0]
+    # the volume drop at 9.0 starts a new session
+    expected = [10.0, 10.0, 11.333333333, 11.333333333, 9.0, 9.666666667]
+    same(indicators.vwap(prices, volumes), expected, 1e-9)
+    tracker = VWAP()
+    same([tracker.update(p, v) for p, v in zip(prices, volumes) if v == v],
+         [e for e, v in zip(expected, volumes) if v == v], 1e-9)
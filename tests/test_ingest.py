@@ -0,0 +1,136 @@
+''' loading bhavcopy archives into the daily history '''
+from array import array
+import os
+import zipfile
+
+import pytest
+
+from nse import history
+from nse.history import HistoryStore
+from nse.ingest import DAILY_COLUMNS, Ingester, archive_day, day_time, parse_day
+
+HEADER = 'SYMBOL,SERIES,OPEN,HIGH,LOW,CLOSE,LAST,PREVCLOSE,TOTTRDQTY,TOTTRDVAL,TIMESTAMP,TOTALTRADES,ISIN,\n'
+
+
+def bhavcopy(tmpdir, day, closes):
+    ''' writes the zipped bhavcopy of a day like 14OCT2026 holding the EQ
+    closes of some symbols, returns its path
+    '''
+    stamp = '%s-%s-%s' % (day[:2], day[2:5], day[5:])
+    lines = [HEADER] + ['%s,EQ,1,2,0.5,%s,%s,1,100,100,%s,1,INE,\n'
+                        % (symbol, close, close, stamp)
+                        for symbol, close in sorted(closes.items())]
+    lines.append('INFY,BE,1,2,0.5,99,99,1,100,100,%s,1,INE,\n' % stamp)
+    path = str(tmpdir.join('cm%sbhav.csv.zip' % day))
+    archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+    archive.writestr('cm%sbhav.csv' % day, ''.join(lines))
+    archive.close()
+    return path
+
+
+def column(store, code, name):
+    return list(store.read(code)[name])
+
+
+def test_merge_appends_inserts_and_replaces(tmpdir):
+    store = HistoryStore(str(tmpdir), ('TIME', 'closePrice'))
+    merge = lambda times, closes: store.merge('INFY', {
+        'TIME': times, 'closePrice': closes})
+    assert merge([3, 1, 2], [30, 10, 20]) == 3
+    assert column(store, 'INFY', 'TIME') == [1, 2, 3]
+    assert column(store, 'INFY', 'closePrice') == [10, 20, 30]
+    # the same rows again change nothing
+    assert merge([1, 2, 3], [10, 20, 30]) == 0
+    assert merge([2.5], [25]) == 1
+    assert merge([2, 4], [21, 40]) == 2
+    assert column(store, 'INFY', 'TIME') == [1, 2, 2.5, 3, 4]
+    assert column(store, 'INFY', 'closePrice') == [10, 21, 25, 30, 40]
+    # nan equals nan, a reloaded day without close is left alone
+    assert merge([3], [float('nan')]) == 1
+    assert merge([3], [float('nan')]) == 0
+    assert store.length('INFY') == 5
+
+
+def test_merge_interrupted_between_the_columns_is_finished(tmpdir, monkeypatch):
+    store = HistoryStore(str(tmpdir), ('TIME', 'closePrice'))
+    store.merge('INFY', {'TIME': [2, 3], 'closePrice': [20, 30]})
+    renames = []
+    real_rename = os.rename
+
+    def rename(src, dst):
+        if renames:
+            raise OSError('killed')
+        renames.append(src)
+        real_rename(src, dst)
+    monkeypatch.setattr(os, 'rename', rename)
+    with pytest.raises(OSError):
+        store.merge('INFY', {'TIME': [1], 'closePrice': [10]})
+    monkeypatch.undo()
+    # TIME was replaced, closePrice is still the old file
+    assert os.path.getsize(store.path('INFY', 'TIME')) == 3 * history.ITEMSIZE
+    assert column(store, 'INFY', 'TIME') == [1, 2, 3]
+    assert column(store, 'INFY', 'closePrice') == [10, 20, 30]
+    assert sorted(os.listdir(store.path('INFY'))) == ['.lock', 'TIME.f8', 'closePrice.f8']
+
+
+def test_merge_without_its_journal_is_discarded(tmpdir):
+    store = HistoryStore(str(tmpdir), ('TIME', 'closePrice'))
+    store.merge('INFY', {'TIME': [2, 3], 'closePrice': [20, 30]})
+    # the process died writing the .tmp files
+    with open(store.path('INFY', 'TIME') + '.tmp', 'wb') as f:
+        array('d', [1, 2, 3]).tofile(f)
+    assert column(store, 'INFY', 'TIME') == [2, 3]
+    assert not os.path.exists(store.path('INFY', 'TIME') + '.tmp')
+
+
+def test_append_after_an_interrupted_append_stays_aligned(tmpdir):
+    store = HistoryStore(str(tmpdir), ('TIME', 'closePrice'))
+    store.append_rows('INFY', [(1, 10)])
+    # the process died between the columns of the second row
+    with open(store.path('INFY', 'TIME'), 'ab') as f:
+        array('d', [2]).tofile(f)
+    assert store.append_rows('INFY', [(3, 30)]) == 1
+    assert column(store, 'INFY', 'TIME') == [1, 3]
+    assert column(store, 'INFY', 'closePrice') == [10, 30]
+
+
+def test_parse_day_keeps_the_known_codes(tmpdir):
+    path = bhavcopy(tmpdir, '14OCT2026', {'INFY': 10, 'TCS': 20, 'WIPRO': 5})
+    assert archive_day(path) == day_time('14-OCT-2026')
+    day, symbols, values, unknown = parse_day(path, frozenset(['INFY', 'TCS']))
+    assert day == day_time('14-OCT-2026')
+    assert symbols == ['INFY', 'TCS'] and unknown == 1
+    width = len(DAILY_COLUMNS) - 1
+    assert len(values) == 2 * width
+    # CLOSE is the fourth bhavcopy field
+    assert values[3] == 10 and values[width + 3] == 20
+
+
+def test_ingest_loads_days_in_any_order(tmpdir, db):
+    root = tmpdir.mkdir('bhav')
+    days = [bhavcopy(root, '%02dOCT2026' % day, {'INFY': day, 'TCS': 2 * day, 'WIPRO': 1})
+            for day in (13, 14, 15, 16)]
+    store = HistoryStore(str(tmpdir.join('daily')), DAILY_COLUMNS)
+    ingester = Ingester(store, db.symbol_index_path(), processes=1, batch_days=2)
+    stats = ingester.ingest([days[3], days[1]])
+    assert stats == {'days': 2, 'rows': 4, 'unknown': 2, 'errors': 0}
+    stats = ingester.ingest([days[2], days[0]])
+    assert stats['rows'] == 4
+    assert column(store, 'INFY', 'TIME') == [day_time('%02d-OCT-2026' % day)
+                                             for day in (13, 14, 15, 16)]
+    assert column(store, 'TCS', 'closePrice') == [26, 28, 30, 32]
+    assert store.symbols() == ['INFY', 'TCS']
+    # loading the days again writes nothing
+    assert ingester.ingest(days)['rows'] == 0
+
+
+def test_ingest_in_a_process_pool(tmpdir, db):
+    days = [bhavcopy(tmpdir, '%02dOCT2026' % day, {'INFY': day, 'RELIANCE': day})
+            for day in (13, 14, 15)]
+    broken = tmpdir.join('cm16OCT2026bhav.csv')
+    broken.write('SYMBOL,NAME OF COMPANY\n')
+    store = HistoryStore(str(tmpdir.join('daily')), DAILY_COLUMNS)
+    stats = Ingester(store, db.symbol_index_path(), processes=2,
+                     batch_days=1).ingest(days + [str(broken)])
+    assert stats == {'days': 3, 'rows': 6, 'unknown': 0, 'errors': 1}
+    assert column(store, 'RELIANCE', 'closePrice') == [13, 14, 15]
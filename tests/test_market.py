@@ -0,0 +1,63 @@
+''' market wide snapshots, with and without numpy '''
+import pytest
+
+from nse import market
+from nse.display import NseDisplay
+from nse.market import Snapshot
+
+BHAVCOPY = '''SYMBOL,SERIES,OPEN,HIGH,LOW,CLOSE,LAST,PREVCLOSE,TOTTRDQTY,TOTTRDVAL,TIMESTAMP,TOTALTRADES,ISIN,
+INFY,EQ,100,110,95,105,105,100,1000,105000,16-OCT-2026,10,INE009A01021,
+INFY,BE,100,110,95,120,120,100,10,1200,16-OCT-2026,1,INE009A01021,
+TCS,EQ,200,205,190,190,190,200,500,95000,16-OCT-2026,5,INE467B01029,
+RELIANCE,EQ,50,52,49,51,51,50,3000,153000,16-OCT-2026,30,INE002A01018,
+WIPRO,EQ,10,10,10,10,10,10,200,2000,16-OCT-2026,2,INE075A01022,
+NEWCO,EQ,20,21,19,20,20,,100,2000,16-OCT-2026,1,INE000A01000,
+'''
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def snapshot(request, monkeypatch):
+    if request.param == 'numpy' and market.numpy is None:
+        pytest.skip('numpy is not installed')
+    if request.param == 'array':
+        monkeypatch.setattr(market, 'numpy', None)
+    return Snapshot.from_bhavcopy(BHAVCOPY)
+
+
+def symbols(snapshot, ranked):
+    return [snapshot.symbols[idx] for idx in ranked]
+
+
+def test_from_bhavcopy_keeps_the_series(snapshot):
+    assert snapshot.symbols == ['INFY', 'TCS', 'RELIANCE', 'WIPRO', 'NEWCO']
+    assert snapshot.day == '16-OCT-2026'
+    assert snapshot.row(0)['pChange'] == 5
+    assert snapshot.row(1)['change'] == -10
+
+
+def test_top_ranks_without_nan(snapshot):
+    assert symbols(snapshot, snapshot.top('pChange', 3)) == ['INFY', 'RELIANCE', 'WIPRO']
+    assert symbols(snapshot, snapshot.top('pChange', 2, ascending=True)) == ['TCS', 'WIPRO']
+    # NEWCO has no previous close, so no change to rank
+    assert symbols(snapshot, snapshot.top('pChange', 10)) == \
+        ['INFY', 'RELIANCE', 'WIPRO', 'TCS']
+    assert symbols(snapshot, snapshot.top('totalTradedVolume', 2)) == ['RELIANCE', 'INFY']
+
+
+def test_advance_declines(snapshot):
+    assert snapshot.advance_declines() == (2, 1, 1)
+
+
+def test_not_a_bhavcopy():
+    with pytest.raises(ValueError):
+        Snapshot.from_bhavcopy('SYMBOL,NAME OF COMPANY\nINFY,Infosys Limited\n')
+
+
+def test_ranking_shows_missing_values(snapshot, db, capsys):
+    # NEWCO has no previous close, SUSPENDED no traded volume
+    snapshot = Snapshot.from_bhavcopy(BHAVCOPY + 'SUSPENDED,EQ,5,5,5,5,5,5,,,'
+                                      '16-OCT-2026,,INE000A01001,\n')
+    NseDisplay(db).show_ranking(snapshot, snapshot.top('lastPrice', 10, ascending=True))
+    lines = capsys.readouterr()[0].splitlines()
+    assert lines[1].split() == ['SUSPENDED', '5.00', '0.00', '0.00%', 'n/a']
+    assert lines[3].split() == ['NEWCO', '20.00', 'n/a', 'n/a', '100']
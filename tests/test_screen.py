@@ -0,0 +1,93 @@
+''' screen expressions, per symbol and column wise '''
+from array import array
+
+import pytest
+
+from nse import market, screen as screen_module
+from nse.history import HistoryStore
+from nse.market import Snapshot, day_time
+from nse.screen import Screen, screen
+
+from test_market import BHAVCOPY
+
+FIELDS = ('lastPrice', 'change', 'pChange', 'previousClose', 'closePrice',
+          'totalTradedVolume', 'high52', 'low52')
+
+
+@pytest.fixture(params=['numpy', 'scalar'])
+def mode(request, monkeypatch):
+    if request.param == 'numpy' and market.numpy is None:
+        pytest.skip('numpy is not installed')
+    if request.param == 'scalar':
+        monkeypatch.setattr(market, 'numpy', None)
+        monkeypatch.setattr(screen_module, 'numpy', None)
+    return request.param
+
+
+def symbols(snapshot, ranked):
+    return [snapshot.symbols[idx] for idx in ranked]
+
+
+@pytest.mark.parametrize('text', [
+    'INFY.lastPrice > 1', 'lastPrice.real > 1', 'open(lastPrice) > 1',
+    'lastPrice[0] > 1', 'lastPrice ** 2 > 1', '9 ** 9 ** 9 > 1',
+    'max(lastPrice, 1) > 1', 'abs(lastPrice, 1) > 1', 'abs(x=lastPrice) > 1',
+    '[lastPrice] > 1', 'lambda: 1', 'lastPrice if change else 1 > 1',
+    'symbol > 1', 'lastPrice * 2', '__import__("os") > 1', 'lastPrice >'])
+def test_rejected_expressions(text):
+    with pytest.raises(ValueError):
+        Screen(text, FIELDS)
+
+
+def test_screen_and_sort(mode):
+    snapshot = Snapshot.from_bhavcopy(BHAVCOPY)
+    where = Screen('pChange > -6 and not change < 0 and totalTradedVolume >= 200',
+                   FIELDS)
+    assert symbols(snapshot, screen(snapshot, where)) == ['INFY', 'RELIANCE', 'WIPRO']
+    order = Screen('totalTradedVolume', FIELDS, condition=False)
+    assert symbols(snapshot, screen(snapshot, where, order, limit=2)) == ['RELIANCE', 'INFY']
+    assert symbols(snapshot, screen(snapshot, where, order, ascending=True)) == \
+        ['WIPRO', 'INFY', 'RELIANCE']
+    # NEWCO has no previous close, its pChange is nan and sorts last
+    everything = Screen('lastPrice > 0', FIELDS)
+    order = Screen('pChange', FIELDS, condition=False)
+    assert symbols(snapshot, screen(snapshot, everything, order)) == \
+        ['INFY', 'RELIANCE', 'WIPRO', 'TCS', 'NEWCO']
+
+
+@pytest.mark.parametrize('text', [
+    'pChange > 2', '1 < lastPrice / 10 <= 10', 'lastPrice / change > 1',
+    'change / change >= 1 or change / change < 1', 'abs(change) > 1 and lastPrice % 2 == 1',
+    'not (pChange > 0 or pChange < 0)', '-lastPrice / -change < 0',
+    'lastPrice / 0 > 1000', '0 / change == 0'])
+def test_numpy_and_scalar_agree(monkeypatch, text):
+    if market.numpy is None:
+        pytest.skip('numpy is not installed')
+    snapshot = Snapshot.from_bhavcopy(BHAVCOPY)
+    expression = Screen(text, FIELDS)
+    order = Screen('lastPrice / change', FIELDS, condition=False)
+    vector = [bool(value) for value in expression.evaluate(snapshot)]
+    ranked = screen(snapshot, expression, order)
+    monkeypatch.setattr(market, 'numpy', None)
+    monkeypatch.setattr(screen_module, 'numpy', None)
+    snapshot = Snapshot.from_bhavcopy(BHAVCOPY)
+    assert [bool(value) for value in expression.evaluate(snapshot)] == vector
+    assert screen(snapshot, expression, order) == ranked
+
+
+def test_add_year_range(tmpdir, mode):
+    snapshot = Snapshot.from_bhavcopy(BHAVCOPY)
+    store = HistoryStore(str(tmpdir), ('TIME', 'dayHigh', 'dayLow'))
+    day = day_time(snapshot.day)
+    year = 365 * 24 * 60 * 60
+    store.merge('INFY', {'TIME': array('d', [day - year - 1, day - 10, day - 5]),
+                         'dayHigh': array('d', [500, 130, float('nan')]),
+                         'dayLow': array('d', [1, 90, 80])})
+    snapshot.add_year_range(store)
+    rows = [snapshot.row(idx) for idx in range(len(snapshot))]
+    # a year back, the snapshot day included
+    assert (rows[0]['high52'], rows[0]['low52']) == (130, 80)
+    # no history, the range of the day
+    assert (rows[1]['high52'], rows[1]['low52']) == (205, 190)
+    where = Screen('lastPrice > 0.9 * high52', FIELDS)
+    assert symbols(snapshot, screen(snapshot, where)) == ['TCS', 'RELIANCE', 'WIPRO', 'NEWCO']
@@ -0,0 +1,139 @@
+''' the quote server: single-flight fetching, its cache and DaemonDriver '''
+import socket
+import threading
+import time
+
+import pytest
+
+from nse.quote import InvalidCodeError, Quote
+from nse.server import DaemonDriver, QuoteServer, QuoteService
+
+
+class GatedDriver(object):
+    ''' NseDriver stand in whose fetches wait for the gate to open '''
+    workers = 4
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.fetching = threading.Event()
+        self.fetches = []
+
+    def fetch_quote(self, code):
+        self.fetches.append(code)
+        self.fetching.set()
+        self.gate.wait(5)
+        if code.startswith('BAD'):
+            raise InvalidCodeError(code)
+        return Quote({'symbol': code, 'lastPrice': '1.00'})
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target) for idx in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+@pytest.fixture
+def quote_server(driver):
+    service = QuoteService(driver, ttl=60)
+    server = QuoteServer(service, 0)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.pool.terminate()
+
+
+def test_concurrent_gets_share_one_fetch():
+    nse = GatedDriver()
+    service = QuoteService(nse, ttl=60)
+    results = []
+    threads = run_threads(10, lambda: results.append(service.get('INFY')))
+    nse.fetching.wait(5)
+    time.sleep(0.1)
+    nse.gate.set()
+    for thread in threads:
+        thread.join()
+    assert nse.fetches == ['INFY']
+    assert len(results) == 10 and len(set(id(quote) for quote, fetched in results)) == 1
+    stats = service.stats()
+    assert stats['upstream'] == 1
+    assert stats['coalesced'] + stats['hits'] == 9
+    service.pool.terminate()
+
+
+def test_cached_quotes_are_served_within_max_age():
+    nse = GatedDriver()
+    nse.gate.set()
+    service = QuoteService(nse, ttl=60)
+    service.get('INFY')
+    service.get('INFY')
+    assert nse.fetches == ['INFY']
+    service.get('INFY', max_age=-1)
+    assert nse.fetches == ['INFY', 'INFY']
+    service.pool.terminate()
+
+
+def test_get_many_keeps_order_and_isolates_errors():
+    nse = GatedDriver()
+    nse.gate.set()
+    service = QuoteService(nse)
+    results = service.get_many(['INFY', 'BADCODE', 'TCS'])
+    assert [code for code, quote, fetched, error in results] == ['INFY', 'BADCODE', 'TCS']
+    assert isinstance(results[1][3], InvalidCodeError)
+    assert results[0][1]['symbol'] == 'INFY' and results[2][1]['symbol'] == 'TCS'
+    service.pool.terminate()
+
+
+def test_daemon_driver_over_http(quote_server):
+    port = quote_server.server_address[1]
+    assert DaemonDriver.available(port)
+    results = DaemonDriver(port).get_quotes(['INFY', 'BADCODE'])
+    assert results[0][0] == 'INFY' and results[0][1]['symbol'] == 'INFY'
+    assert isinstance(results[1][2], InvalidCodeError)
+    batch = list(DaemonDriver(port).iter_quotes(iter(['TCS', 'INFY', 'RELIANCE']), window=2))
+    assert [code for code, quote, error in batch] == ['TCS', 'INFY', 'RELIANCE']
+
+
+def test_concurrent_clients_are_coalesced_upstream(quote_server, stub):
+    stub.delay = 0.2
+    port = quote_server.server_address[1]
+    results = []
+    started = time.time()
+    # like the cli, which asks for quotes younger than QUOTE_TTL
+    threads = run_threads(20, lambda: results.append(
+        DaemonDriver(port).get_quotes(['INFY', 'TCS'], max_age=5)))
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    assert len(results) == 20
+    assert all(quote['symbol'] == code for result in results
+               for code, quote, error in result)
+    # one upstream request per symbol, instead of 40 of 0.2s each
+    assert stub.requests == 2
+    assert elapsed < 2
+    assert quote_server.service.stats()['upstream'] == 2
+
+
+def test_foreign_listener_is_not_a_quote_server():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(5)
+    port = listener.getsockname()[1]
+
+    def answer():
+        while True:
+            conn, address = listener.accept()
+            conn.recv(1024)
+            conn.sendall('HTTP/1.1 garbage\r\n\r\n')
+            conn.close()
+    thread = threading.Thread(target=answer)
+    thread.daemon = True
+    thread.start()
+    assert not DaemonDriver.available(port)
+    code, quote, error = DaemonDriver(port).get_quotes(['INFY'])[0]
+    assert quote is None and 'quote server failed' in str(error)
+    listener.close()
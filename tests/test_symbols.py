@@ -0,0 +1,119 @@
+''' the symbol master: EQUITY_L.csv, its search index and the memory
+mapped symbol index
+'''
+import pytest
+
+from nse.cli import check_codes
+from nse.db import DB
+from nse.quote import QuoteError
+from nse.symbols import SymbolIndex, write_index
+
+
+def test_refresh_symbols_applies_only_the_differences(driver, stub, db):
+    stub.stocks = ('SYMBOL,NAME OF COMPANY\nINFY,Infosys Limited\n'
+                   'TCS,Tata Consultancy Services Ltd\nWIPRO,Wipro Limited\n')
+    assert driver.refresh_symbols() == (1, 1, 1)
+    assert db.get_all_stock_list() == {
+        'INFY': 'Infosys Limited', 'TCS': 'Tata Consultancy Services Ltd',
+        'WIPRO': 'Wipro Limited'}
+    # the search index follows the inserts, renames and deletes
+    assert db.search_stocks('wipro')[0][0] == 'WIPRO'
+    assert db.search_stocks('ltd')[0][0] == 'TCS'
+    assert db.search_stocks('reliance') == []
+    index = SymbolIndex(db.symbol_index_path())
+    assert list(index.codes) == ['INFY', 'TCS', 'WIPRO']
+    index.close()
+
+
+def test_refresh_symbols_skips_an_unchanged_file(driver, stub, db):
+    assert driver.refresh_symbols() == (0, 0, 0)
+    # the ETag of the first download is sent back, the server answers 304
+    assert driver.refresh_symbols() is None
+    assert stub.requests == 2
+    stub.stocks += 'WIPRO,Wipro Limited\n'
+    assert driver.refresh_symbols() == (1, 0, 0)
+
+
+def test_refresh_symbols_raises_quote_errors(driver, stub, db):
+    stub.statuses = {'EQUITY_L.csv': 404}
+    with pytest.raises(QuoteError):
+        driver.refresh_symbols()
+    # server errors went through the retries of open first
+    stub.statuses = {'EQUITY_L.csv': 503}
+    with pytest.raises(QuoteError):
+        driver.refresh_symbols()
+    retries = int(db.get_config_setting('MAX_RETRIES')[0])
+    assert stub.requests == retries + 2
+    driver.code_csv_url = 'http://127.0.0.1:9/EQUITY_L.csv'
+    with pytest.raises(QuoteError):
+        driver.refresh_symbols()
+    assert sorted(db.get_all_stock_list()) == ['INFY', 'RELIANCE', 'TCS']
+
+
+@pytest.fixture
+def index(db):
+    index = SymbolIndex(db.symbol_index_path())
+    yield index
+    index.close()
+
+
+def test_index_follows_the_stocks_table(db, index):
+    assert list(index.codes) == ['INFY', 'RELIANCE', 'TCS']
+    assert index.has_code('infy') and not index.has_code('INF')
+    assert 'lastPrice' in index.fields
+
+
+def test_index_of_a_new_database(tmpdir):
+    db = DB(str(tmpdir.join('nse.db')))
+    # the stocks come before the config table, the fields with bootstrap
+    db.create_stocks_table('SYMBOL,NAME OF COMPANY\nINFY,Infosys Limited\n')
+    index = SymbolIndex(db.symbol_index_path())
+    assert list(index.codes) == ['INFY'] and list(index.fields) == []
+    index.close()
+    db.bootstrap()
+    index = SymbolIndex(db.symbol_index_path())
+    assert 'lastPrice' in index.fields
+    index.close()
+
+
+def test_prefix_completion(db, index):
+    assert index.complete_code('') == ['INFY', 'RELIANCE', 'TCS']
+    assert index.complete_code('in') == ['INFY']
+    assert index.complete_code('T') == ['TCS']
+    assert index.complete_code('X') == []
+    assert index.complete_code('INFYX') == []
+    assert index.complete_field('lastp') == ['lastPrice']
+    assert 'pricebandlower' in index.complete_field('PRICEBAND')
+
+
+def test_single_typo_correction(tmpdir):
+    path = str(tmpdir.join('nse.db.symbols'))
+    write_index(path, ['INFY', 'TCS', 'TCI', 'RELIANCE'], [])
+    index = SymbolIndex(path)
+    assert index.correct('infy') == 'INFY'
+    # a substitution, a deletion and an insertion
+    assert index.correct('INFI') == 'INFY'
+    assert index.correct('RELINCE') == 'RELIANCE'
+    assert index.correct('INFYY') == 'INFY'
+    # TCS and TCI are both one typo away from TCX
+    assert sorted(index.close_codes('TCX')) == ['TCI', 'TCS']
+    assert index.correct('TCX') is None
+    assert index.correct('WIPRO') is None
+    index.close()
+
+
+def test_not_an_index(tmpdir):
+    path = tmpdir.join('nse.db.symbols')
+    path.write('SYMBOL,NAME OF COMPANY\n')
+    with pytest.raises(ValueError):
+        SymbolIndex(str(path))
+    with pytest.raises(IOError):
+        SymbolIndex(str(tmpdir.join('missing')))
+
+
+def test_check_codes_corrects_typos_and_keeps_the_input_order(db):
+    checked = check_codes(db, iter(['infy', 'TCZ', 'WIPRO', 'INFYY', 'tcs']))
+    # lazily, for -batch
+    assert not isinstance(checked, list)
+    # INFYY and tcs are already listed once corrected
+    assert list(checked) == [('infy', 'INFY'), ('TCZ', 'TCS'), ('WIPRO', None)]
@@ -0,0 +1,80 @@
+''' rate limiting, retries and the circuit breaker '''
+import pytest
+
+from nse.quote import QuoteError
+from nse.throttle import Backoff, CircuitBreaker, CircuitOpenError, TokenBucket
+
+
+def test_token_bucket_allows_the_burst_then_the_rate(clock):
+    bucket = TokenBucket(2, burst=3, clock=clock.time, sleep=clock.sleep)
+    for idx in range(3):
+        assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.sleeps == pytest.approx([0.5, 0.5])
+
+
+def test_token_bucket_refills_while_idle(clock):
+    bucket = TokenBucket(1, burst=2, clock=clock.time, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 10
+    # never more than the burst
+    assert [bucket.acquire() for idx in range(3)] == pytest.approx([0, 0, 1])
+
+
+def test_backoff_is_capped_and_jittered():
+    backoff = Backoff(retries=5, base=0.5, cap=4, rand=lambda: 1.0)
+    assert [backoff.delay(attempt) for attempt in range(5)] == [0.5, 1, 2, 4, 4]
+    assert Backoff(base=0.5, rand=lambda: 0.25).delay(2) == 0.5
+
+
+def test_circuit_opens_after_the_threshold_and_lets_one_trial(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=30, clock=clock.time)
+    breaker.failure()
+    breaker.before()
+    breaker.failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    clock.now += 30
+    breaker.before()
+    # a single trial until it succeeds or fails
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    clock.now += 30
+    breaker.before()
+    breaker.success()
+    breaker.before()
+    breaker.before()
+
+
+def test_driver_retries_server_errors(driver, stub, db):
+    sleeps = []
+    driver.sleep = sleeps.append
+    stub.statuses = {'TCS': 503}
+    with pytest.raises(QuoteError):
+        driver.fetch_quote('TCS')
+    retries = int(db.get_config_setting('MAX_RETRIES')[0])
+    assert stub.requests == retries + 1
+    assert len(sleeps) == retries
+    # client errors are not retried
+    stub.statuses = {'TCS': 404}
+    with pytest.raises(QuoteError):
+        driver.fetch_quote('TCS')
+    assert stub.requests == retries + 2
+
+
+def test_driver_stops_at_the_open_circuit(driver, stub, clock):
+    driver.breaker = CircuitBreaker(threshold=2, cooldown=30, clock=clock.time)
+    stub.statuses = {'TCS': 503}
+    with pytest.raises(QuoteError):
+        driver.fetch_quote('TCS')
+    requests = stub.requests
+    with pytest.raises(CircuitOpenError):
+        driver.fetch_quote('INFY')
+    assert stub.requests == requests
+    clock.now += 30
+    assert driver.fetch_quote('INFY')['symbol'] == 'INFY'
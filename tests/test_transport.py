@@ -0,0 +1,76 @@
+''' keep-alive connections of NseDriver and recorded responses '''
+import httplib
+import socket
+
+from nse.driver import NseDriver
+from nse.quote import QuoteError
+from nse.transport import (Archive, ConnectionPool, KeepAliveHandler,
+                           RecordingHandler, ReplayHandler)
+
+
+def test_sequential_fetches_reuse_one_connection(driver, stub):
+    for code in ['INFY', 'TCS', 'RELIANCE', 'INFY']:
+        driver.fetch_quote(code)
+    stats = driver.connection_stats()
+    assert stats['new'] == 1 and stats['reused'] == 3
+    assert len(stub.clients) == 1
+
+
+def test_concurrent_rounds_reuse_the_pooled_connections(driver, stub):
+    codes = ['C%d' % idx for idx in range(4)]
+    stub.delay = 0.05
+    for round in range(4):
+        driver.get_quotes(codes)
+    stats = driver.connection_stats()
+    # a connection is only opened when all the others are busy
+    assert stats['new'] + stats['reused'] == 16
+    assert stats['new'] <= len(codes)
+    assert len(stub.clients) == stats['new']
+
+
+def test_server_closing_connections(driver, stub):
+    stub.close = True
+    for code in ['INFY', 'TCS']:
+        assert driver.fetch_quote(code)['symbol'] == code
+    assert driver.connection_stats() == {'new': 2, 'reused': 0, 'idle': 0}
+
+
+def test_idle_connection_dropped_by_the_server_is_retried(driver, stub):
+    stub.drop_idle = True
+    for code in ['INFY', 'TCS', 'RELIANCE']:
+        assert driver.fetch_quote(code)['symbol'] == code
+    assert stub.requests == 3
+    assert len(stub.clients) == 3
+
+
+def test_recorded_responses_are_replayed(db, driver, stub, tmpdir):
+    path = str(tmpdir.join('quotes.zip'))
+    archive = Archive(path, 'w')
+    stub.prices = {'TCS': '2.00'}
+    recorder = NseDriver(db, transport=lambda handler: RecordingHandler(handler, archive))
+    recorder.baseurl = driver.baseurl
+    recorded = recorder.get_quotes(['INFY', 'TCS'])
+    archive.close()
+    assert sorted(Archive(path).urls()) == [driver.build_url('INFY'), driver.build_url('TCS')]
+
+    stub.prices = {}
+    nse = NseDriver(db, transport=lambda handler: ReplayHandler(Archive(path)))
+    nse.baseurl = driver.baseurl
+    results = nse.get_quotes(['INFY', 'TCS', 'RELIANCE'])
+    assert results[:2] == recorded
+    assert stub.requests == 2
+    # RELIANCE was not recorded, the replay answers 404
+    assert results[2][1] is None and isinstance(results[2][2], QuoteError)
+
+
+def test_connect_tries_every_address(stub, monkeypatch):
+    port = stub.server_address[1]
+    # an IPv6 address refusing the connection comes first, like ::1 for
+    # localhost on many hosts
+    addresses = [(socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('::1', 9, 0, 0)),
+                 (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))]
+    monkeypatch.setattr(socket, 'getaddrinfo', lambda *args: addresses)
+    conn = httplib.HTTPConnection('localhost', port, timeout=1)
+    KeepAliveHandler(ConnectionPool())._connect(conn)
+    assert conn.sock.getpeername() == ('127.0.0.1', port)
+    conn.close()
@@ -0,0 +1,92 @@
+''' the -watch loop and its in place rendering '''
+from cStringIO import StringIO
+
+from nse.display import NseDisplay
+from nse.quote import Quote, QuoteError
+from nse.watch import NseWatcher
+
+
+class ScriptedDriver(object):
+    ''' returns the results of a script, one list per tick, taking seconds
+    of the fake clock per tick
+    '''
+    def __init__(self, clock, script, seconds=0):
+        self.clock = clock
+        self.script = list(script)
+        self.seconds = seconds
+
+    def get_quotes(self, codes):
+        self.clock.now += self.seconds
+        return self.script.pop(0)
+
+
+def quote(price):
+    return Quote({'symbol': 'INFY', 'lastPrice': price, 'pChange': '0.50'})
+
+
+def test_update_redraws_only_the_changed_lines(db):
+    db.update_config_setting('DISPLAY_FIELDS', 'lastPrice pChange')
+    out = StringIO()
+    disp = NseDisplay(db, out=out)
+    disp.start_watch(['INFY'])
+    assert out.getvalue() == '[INFY]\nlastPrice :\npChange :\n'
+    assert disp.update_watch([('INFY', quote('100.00'), None)]) == 3
+    out.truncate(0)
+    assert disp.update_watch([('INFY', quote('100.00'), None)]) == 0
+    assert out.getvalue() == ''
+    assert disp.update_watch([('INFY', quote('101.00'), None)]) == 1
+    # up two lines from the bottom to lastPrice and back down
+    assert out.getvalue() == '\033[2A\r\033[KlastPrice : 101.00\033[2B\r'
+
+
+def test_watch_redraws_the_header_of_failed_fetches(db):
+    db.update_config_setting('DISPLAY_FIELDS', 'lastPrice')
+    out = StringIO()
+    disp = NseDisplay(db, out=out)
+    disp.start_watch(['INFY'])
+    disp.update_watch([('INFY', quote('100.00'), None)])
+    out.truncate(0)
+    assert disp.update_watch([('INFY', None, QuoteError('timed out'))]) == 1
+    assert '[INFY] unable to fetch quote: timed out' in out.getvalue()
+
+
+def test_watch_sleeps_the_rest_of_the_interval(db, clock):
+    ticks = [[('INFY', quote('100.00'), None)]] * 3
+    watcher = NseWatcher(ScriptedDriver(clock, ticks, seconds=0.5),
+                         NseDisplay(db, out=StringIO()), interval=2,
+                         clock=clock.time, sleep=clock.sleep)
+    watcher.run(['INFY'], ticks=3)
+    assert clock.sleeps == [1.5, 1.5]
+
+
+def test_watch_backs_off_and_recovers(db, clock):
+    failed = [('INFY', None, QuoteError('HTTP Error 503'))]
+    ok = [('INFY', quote('100.00'), None)]
+    watcher = NseWatcher(ScriptedDriver(clock, [failed] * 4 + [ok] * 4),
+                         NseDisplay(db, out=StringIO()), interval=2, max_interval=10,
+                         clock=clock.time, sleep=clock.sleep)
+    watcher.run(['INFY'], ticks=8)
+    assert clock.sleeps == [4, 8, 10, 10, 5, 2.5, 2]
+
+
+def test_watch_backs_off_from_a_slow_server(db, clock):
+    ok = [('INFY', quote('100.00'), None)]
+    watcher = NseWatcher(ScriptedDriver(clock, [ok] * 3, seconds=1.5),
+                         NseDisplay(db, out=StringIO()), interval=2,
+                         clock=clock.time, sleep=clock.sleep)
+    watcher.run(['INFY'], ticks=3)
+    # a tick taking more than half of the interval doubles it, within
+    # half of the doubled one it halves back
+    assert clock.sleeps == [2.5, 0.5]
+    assert watcher.current_interval == 4
+
+
+def test_watch_over_the_stub_server(db, driver, clock):
+    db.update_config_setting('DISPLAY_FIELDS', 'lastPrice')
+    out = StringIO()
+    watcher = NseWatcher(driver, NseDisplay(db, out=out), interval=2,
+                         clock=clock.time, sleep=clock.sleep)
+    watcher.run(['INFY', 'TCS'], ticks=2)
+    # the second tick brought the same prices, nothing was redrawn
+    assert out.getvalue().count('lastPrice : 1,234.50') == 2
+    assert clock.sleeps == [2]